@@ -0,0 +1,287 @@
+"""
+End-to-end benchmarks of pykube against a local fake API server.
+
+    PYTHONPATH=. python benchmarks/bench_api.py [--quick] [--output results.json]
+
+Every scenario runs in a fresh client process against a fresh server
+process (benchmarks/server.py, serving pykube.testing.FakeAPI over HTTP),
+so peak RSS is that of the client alone. Scenarios:
+
+    list-N     list N pods at once (Query.query_cache) and in pages of 500
+               (Query.iterator)
+    get        get pods by name
+    watch      watch pods being created; latency is creation to delivery
+    create     create pods from concurrent threads
+    patch      update (merge patch) pods from concurrent threads
+
+For each it reports operations per second, p50/p99 latency of one
+operation and peak RSS. Compare saved results with benchmarks/compare.py.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import pykube
+
+from bench_codec import make_pod
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+NAMESPACE = "bench"
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summarize(latencies, seconds, ops, **extra):
+    result = {
+        "ops": ops,
+        "seconds": seconds,
+        "ops_per_sec": ops / seconds if seconds else None,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+    result.update(extra)
+    return result
+
+
+def timed_ops(func, count):
+    latencies = []
+    start = time.time()
+    for i in range(count):
+        t = time.time()
+        func(i)
+        latencies.append(time.time() - t)
+    return latencies, time.time() - start
+
+
+def concurrent_ops(func, count, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        mine = []
+        for i in range(offset, count, threads):
+            t = time.time()
+            func(i)
+            mine.append(time.time() - t)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, time.time() - start
+
+
+# scenarios: (server seed, run(api, args) -> {result name: summary})
+
+def scenario_list(size):
+    def run(api, args):
+        repeat = max(2, min(20, 20000 // size))
+        query = pykube.Pod.objects(api).filter(namespace=NAMESPACE)
+
+        def list_all(_):
+            assert len(query.all()) == size
+
+        def iterate(_):
+            assert sum(1 for _ in query.iterator(page_size=500)) == size
+
+        results = {}
+        # paging first, as peak RSS only grows
+        for name, func in [("iterate-{}".format(size), iterate), ("list-{}".format(size), list_all)]:
+            latencies, seconds = timed_ops(func, repeat)
+            results[name] = summarize(latencies, seconds, repeat, objects_per_sec=size * repeat / seconds,
+                                      peak_rss_mb=peak_rss_mb())
+        return results
+    return size, run
+
+
+def run_get(api, args):
+    count = args.ops
+    query = pykube.Pod.objects(api).filter(namespace=NAMESPACE)
+    latencies, seconds = timed_ops(lambda i: query.get_by_name("web-{}".format(i % 1000)), count)
+    return {"get": summarize(latencies, seconds, count)}
+
+
+def run_watch(api, args):
+    count = args.ops * 10
+    query = pykube.Pod.objects(api).filter(namespace=NAMESPACE)
+    watch = query.watch(since=pykube.now)
+    latencies = []
+    r = api.post(url="churn?count={}&namespace={}".format(count, NAMESPACE), base="/_bench", version="")
+    r.raise_for_status()
+    start = time.time()
+    stream = watch.object_stream()
+    for event in stream:
+        latencies.append(time.time() - float(event.object.annotations["bench/created"]))
+        if len(latencies) == count:
+            break
+    seconds = time.time() - start
+    stream.close()
+    return {"watch": summarize(latencies, seconds, count)}
+
+
+def run_create(api, args):
+    count = args.ops
+
+    def create(i):
+        pod = make_pod(i)
+        pod["metadata"] = {"name": "new-{}".format(i), "namespace": NAMESPACE, "labels": {"app": "web"}}
+        pykube.Pod(api, pod).create()
+
+    latencies, seconds = concurrent_ops(create, count, args.threads)
+    return {"create": summarize(latencies, seconds, count, threads=args.threads)}
+
+
+def run_patch(api, args):
+    pods = list(pykube.Pod.objects(api).filter(namespace=NAMESPACE).iterator())
+
+    def patch(i):
+        pod = pods[i]
+        pod.labels["bench/patched"] = str(i)
+        pod.update()
+
+    latencies, seconds = concurrent_ops(patch, len(pods), args.threads)
+    return {"patch": summarize(latencies, seconds, len(pods), threads=args.threads)}
+
+
+def scenarios(args):
+    found = [("list-{}".format(size), scenario_list(size)) for size in args.sizes]
+    found += [
+        ("get", (1000, run_get)),
+        ("watch", (0, run_watch)),
+        ("create", (0, run_create)),
+        ("patch", (args.ops, run_patch)),
+    ]
+    return found
+
+
+def run_client(args):
+    """
+    Runs one scenario against ``args.url`` and prints its results as JSON.
+    """
+    run = dict(scenarios(args))[args.run][1]
+    api = pykube.HTTPClient(
+        pykube.KubeConfig.from_url(args.url),
+        pool_maxsize=max(10, args.threads),
+        discovery_cache_dir=None,
+    )
+    results = run(api, args)
+    rss = peak_rss_mb()
+    for result in results.values():
+        result.setdefault("peak_rss_mb", rss)
+    json.dump(results, sys.stdout)
+
+
+def start_server(pods):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(HERE), env.get("PYTHONPATH")]))
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "server.py"), "--pods", str(pods), "--namespace", NAMESPACE],
+        stdout=subprocess.PIPE,
+        env=env,
+    )
+    url = server.stdout.readline().decode("ascii").strip()
+    if not url:
+        server.wait()
+        raise RuntimeError("the benchmark server did not start")
+    return server, url, env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", help="comma separated scenarios to run (default: all)")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="pods listed by the list scenarios")
+    parser.add_argument("--ops", type=int, default=2000, help="operations of the get, create and patch scenarios")
+    parser.add_argument("--threads", type=int, default=8, help="threads of the create and patch scenarios")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a quick check")
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    parser.add_argument("--label", help="name of this run in the results (default: git describe)")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",")]
+    if args.quick:
+        args.sizes = [s for s in args.sizes if s <= 10000]
+        args.ops = min(args.ops, 200)
+
+    if args.run:
+        run_client(args)
+        return
+
+    selected = args.scenarios.split(",") if args.scenarios else None
+    forwarded = ["--sizes", ",".join(str(s) for s in args.sizes), "--ops", str(args.ops),
+                 "--threads", str(args.threads)]
+    results = {}
+    print("{:<14} {:>12} {:>10} {:>10} {:>10}".format("scenario", "ops/s", "p50 ms", "p99 ms", "rss MB"))
+    for name, (seed, _) in scenarios(args):
+        if selected is not None and name not in selected:
+            continue
+        server, url, env = start_server(seed)
+        try:
+            output = subprocess.check_output(
+                [sys.executable, os.path.abspath(__file__), "--run", name, "--url", url] + forwarded,
+                env=env,
+            )
+        finally:
+            server.terminate()
+            server.wait()
+        for result_name, result in sorted(json.loads(output.decode("utf-8")).items()):
+            results[result_name] = result
+            print("{:<14} {:>12,.1f} {:>10.2f} {:>10.2f} {:>10.1f}".format(
+                result_name, result["ops_per_sec"], result["p50_ms"], result["p99_ms"], result["peak_rss_mb"] or 0,
+            ))
+            sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump({
+                "label": args.label or git_describe(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "codec": pykube.HTTPClient(pykube.KubeConfig.from_url("http://localhost"),
+                                           discovery_cache_dir=None).codec.name,
+                "results": results,
+            }, fp, indent=2, sort_keys=True)
+
+
+def git_describe():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=HERE, stderr=subprocess.STDOUT,
+        ).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compares list and watch decoding throughput of the installed JSON codecs.
+
+    PYTHONPATH=. python benchmarks/bench_codec.py [--pods 5000] [--events 20000]
+"""
+
+import argparse
+import time
+
+import pykube
+from pykube import codec
+from pykube.query import WatchQuery
+from pykube.utils import StreamingList
+
+
+def make_pod(i):
+    return {
+        "kind": "Pod",
+        "apiVersion": "v1",
+        "metadata": {
+            "name": "web-{}".format(i),
+            "namespace": "default",
+            "uid": "6c0e6d4e-{:012d}".format(i),
+            "resourceVersion": str(1000 + i),
+            "labels": {"app": "web", "pod-template-hash": "5d8f7b9c"},
+            "ownerReferences": [{"kind": "ReplicaSet", "name": "web-5d8f7b9c", "uid": "rs-uid"}],
+        },
+        "spec": {
+            "nodeName": "node-{}".format(i % 50),
+            "containers": [{
+                "name": "web",
+                "image": "nginx:1.13",
+                "ports": [{"containerPort": 80, "protocol": "TCP"}],
+                "resources": {"requests": {"cpu": "100m", "memory": "128Mi"}},
+                "env": [{"name": "VAR_{}".format(n), "value": "x" * 20} for n in range(10)],
+            }],
+        },
+        "status": {
+            "phase": "Running",
+            "conditions": [{"type": "Ready", "status": "True"}],
+            "podIP": "10.0.{}.{}".format(i // 250, i % 250),
+        },
+    }
+
+
+def timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pods", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=20000)
+    args = parser.parse_args()
+
+    pods = [make_pod(i) for i in range(args.pods)]
+    body = codec.json_dumps({"kind": "PodList", "metadata": {"resourceVersion": "1"}, "items": pods})
+    lines = [
+        codec.json_dumps({"type": "MODIFIED", "object": pods[i % len(pods)]})
+        for i in range(args.events)
+    ]
+    config = pykube.KubeConfig.from_url("http://localhost:8080")
+
+    print("list: {} pods, {:.1f} MB; watch: {} events".format(args.pods, len(body) / 1e6, args.events))
+    print("{:<8} {:>14} {:>14} {:>14}".format("codec", "list objs/s", "stream objs/s", "watch evts/s"))
+    for name, (_, installed) in sorted(codec._codecs.items()):
+        if not installed:
+            continue
+        api = pykube.HTTPClient(config, json_codec=name)
+        watch = WatchQuery(api, pykube.Pod, namespace="default")
+
+        def decode_list():
+            for obj in api.codec.loads(body)["items"]:
+                pykube.Pod(api, obj)
+
+        def stream_list():
+            chunks = (body[i:i + 65536] for i in range(0, len(body), 65536))
+            for obj in StreamingList(chunks):
+                pykube.Pod(api, obj)
+
+        def decode_watch():
+            for line in lines:
+                watch._decode_event(line)
+
+        print("{:<8} {:>14,.0f} {:>14,.0f} {:>14,.0f}".format(
+            name,
+            args.pods / timed(decode_list),
+            args.pods / timed(stream_list),
+            args.events / timed(decode_watch),
+        ))
+
+
+if __name__ == "__main__":
+    main()
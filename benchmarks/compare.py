@@ -0,0 +1,64 @@
+"""
+Compares two result files of bench_api.py.
+
+    python benchmarks/compare.py baseline.json results.json [--threshold 10]
+
+Prints the change of every result present in both and exits with status 1
+if any got more than ``threshold`` percent slower (fewer ops/s or a
+higher p99 latency).
+"""
+
+import argparse
+import json
+import sys
+
+
+def change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) * 100.0 / old
+
+
+def fmt(value):
+    return "     n/a" if value is None else "{:+7.1f}%".format(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("results")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent slower that counts as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    with open(args.results) as fp:
+        results = json.load(fp)
+
+    print("{} -> {}".format(baseline.get("label"), results.get("label")))
+    print("{:<14} {:>12} {:>12} {:>8} {:>10} {:>10} {:>8} {:>8}".format(
+        "scenario", "ops/s", "ops/s", "", "p99 ms", "p99 ms", "", "rss"))
+    regressions = []
+    for name in sorted(set(baseline["results"]) & set(results["results"])):
+        old, new = baseline["results"][name], results["results"][name]
+        ops = change(old["ops_per_sec"], new["ops_per_sec"])
+        p99 = change(old["p99_ms"], new["p99_ms"])
+        rss = change(old.get("peak_rss_mb"), new.get("peak_rss_mb"))
+        regressed = (ops is not None and ops < -args.threshold) or (p99 is not None and p99 > args.threshold)
+        if regressed:
+            regressions.append(name)
+        print("{:<14} {:>12,.1f} {:>12,.1f} {} {:>10.2f} {:>10.2f} {} {}{}".format(
+            name, old["ops_per_sec"], new["ops_per_sec"], fmt(ops),
+            old["p99_ms"], new["p99_ms"], fmt(p99), fmt(rss),
+            "  REGRESSION" if regressed else "",
+        ))
+    for name in sorted(set(baseline["results"]) ^ set(results["results"])):
+        print("{:<14} only in {}".format(name, "baseline" if name in baseline["results"] else "results"))
+    if regressions:
+        print("{} regressed by more than {}%: {}".format(len(regressions), args.threshold, ", ".join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
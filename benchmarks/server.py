@@ -0,0 +1,144 @@
+"""
+Serves a pykube.testing.FakeAPI over HTTP for benchmarks.
+
+    PYTHONPATH=. python benchmarks/server.py [--port 8001] [--pods 10000]
+
+Prints the URL once it is listening. Besides the Kubernetes API it
+answers ``POST /_bench/churn?count=N&namespace=NS``, which creates N pods
+in the background (each stamped with its creation time in the
+``bench/created`` annotation) to drive watch benchmarks.
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+import requests
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs, urlparse
+
+from pykube.testing import FAKE_SERVER, FakeAPI
+
+from bench_codec import make_pod
+
+
+def seed(fake, pods, namespace):
+    for i in range(pods):
+        pod = make_pod(i)
+        pod["metadata"]["namespace"] = namespace
+        fake.add(pod)
+
+
+def churn(fake, count, namespace):
+    prefix = "churn-{}-".format(int(time.time() * 1000))
+    for i in range(count):
+        pod = make_pod(i)
+        pod["metadata"].update(
+            name=prefix + str(i),
+            namespace=namespace,
+            annotations={"bench/created": repr(time.time())},
+        )
+        fake.add(pod)
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    # headers and body are written separately; without this every response
+    # waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_one_request(self):
+        try:
+            BaseHTTPServer.BaseHTTPRequestHandler.handle_one_request(self)
+        except (IOError, OSError):
+            # the client went away, as benchmarks closing watches do
+            self.close_connection = True
+
+    def _serve(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else None
+        url = urlparse(self.path)
+        if url.path == "/_bench/churn":
+            params = parse_qs(url.query)
+            thread = threading.Thread(target=churn, args=(
+                self.server.fake, int(params["count"][0]), params.get("namespace", ["default"])[0],
+            ))
+            thread.daemon = True
+            thread.start()
+            self._reply(202, {"content-type": "text/plain"}, b"")
+            return
+        request = requests.Request(
+            self.command,
+            FAKE_SERVER + self.path,
+            headers={"Content-Type": self.headers.get("Content-Type", "application/json")},
+            data=body,
+        ).prepare()
+        response = self.server.fake.send(request, stream=True)
+        if response._content_consumed:
+            self._reply(response.status_code, response.headers, response.content)
+            return
+        # a watch: stream the events as they happen
+        self.send_response(response.status_code)
+        self.send_header("Content-Type", response.headers["content-type"])
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            while True:
+                chunk = response.raw.read(64 * 1024)
+                if not chunk:
+                    break
+                self.wfile.write("{:x}\r\n".format(len(chunk)).encode("ascii") + chunk + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        finally:
+            response.raw.close()
+
+    def _reply(self, status, headers, content):
+        self.send_response(status)
+        self.send_header("Content-Type", headers["content-type"])
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _serve
+
+
+class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, fake):
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.fake = fake
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--pods", type=int, default=0, help="pods to create before serving")
+    parser.add_argument("--namespace", default="bench")
+    parser.add_argument("--history", type=int, default=200000, help="changes kept for watches")
+    args = parser.parse_args()
+
+    fake = FakeAPI(history=args.history)
+    seed(fake, args.pods, args.namespace)
+    server = Server((args.host, args.port), fake)
+    print("http://{}:{}".format(*server.server_address[:2]))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.close()
+
+
+if __name__ == "__main__":
+    main()
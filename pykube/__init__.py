@@ -2,11 +2,16 @@
 Python client for Kubernetes
 """
 
+from . import cache  # noqa
+from . import logs  # noqa
 from .config import KubeConfig  # noqa
-from .exceptions import KubernetesError, PyKubeError, ObjectDoesNotExist  # noqa
+from .exceptions import KubernetesError, PyKubeError, ObjectDoesNotExist, WaitTimeout  # noqa
 from .http import HTTPClient  # noqa
+from .mixins import scale_many  # noqa
 from .objects import (  # noqa
+    apply,
     object_factory,
+    object_factory_all,
     ConfigMap,
     CronJob,
     DaemonSet,
@@ -0,0 +1,490 @@
+"""
+asyncio support.
+
+AsyncHTTPClient builds URLs and authenticates exactly like HTTPClient but
+runs on aiohttp, so a single event loop can drive many concurrent requests
+and watches. Queries made through it are AsyncQuery instances:
+
+    api = pykube.aio.AsyncHTTPClient(pykube.KubeConfig.from_file("~/.kube/config"))
+    pods = await pykube.Pod.objects(api).filter(selector={"app": "web"}).all()
+    async for pod in pykube.Pod.objects(api):
+        ...
+    async for event in pykube.Pod.objects(api).watch():
+        ...
+
+Objects returned by async queries are regular APIObject instances; their
+own methods (create, update, ...) still need a blocking HTTPClient.
+
+Requires aiohttp (pip install pykube[async]).
+"""
+
+import asyncio
+import base64
+import ssl
+
+try:
+    import aiohttp
+    aiohttp_installed = True
+except ImportError:
+    aiohttp_installed = False
+
+from six.moves import http_client
+
+from .codec import get_codec
+from .exceptions import HTTPError, ObjectDoesNotExist
+from .http import BaseHTTPClient, auth_provider
+from .query import (
+    BaseQuery,
+    DEFAULT_PAGE_SIZE,
+    WatchEvent,
+    WatchQuery,
+    _storage_key,
+    now,
+)
+from .ratelimit import DEFAULT_RETRY
+
+
+DEFAULT_QUEUE_SIZE = 100
+
+_done = object()
+
+
+class AsyncQuery(BaseQuery):
+    """
+    Async counterpart of Query. ``filter`` and friends still return clones;
+    everything that talks to the API server is a coroutine or an async
+    iterator.
+    """
+
+    async def all(self):
+        """
+        Returns a list of every object matched by the query.
+        """
+        return [obj async for obj in self.iterator()]
+
+    async def get_by_name(self, name):
+        r = await self.api.get(**self._get_by_name_kwargs(name))
+        async with r:
+            if r.status == http_client.NOT_FOUND:
+                raise ObjectDoesNotExist("{} does not exist.".format(name))
+            await self.api.raise_for_status(r)
+            return self.api_obj_class(self.api, self.api.codec.loads(await r.read()))
+
+    async def get(self, *args, **kwargs):
+        if "name" in kwargs:
+            return await self.get_by_name(kwargs["name"])
+        objs = await self.filter(*args, **kwargs).all()
+        if len(objs) == 1:
+            return objs[0]
+        if not objs:
+            raise ObjectDoesNotExist("get() returned zero objects")
+        raise ValueError("get() more than one object; use filter")
+
+    async def get_or_none(self, *args, **kwargs):
+        try:
+            return await self.get(*args, **kwargs)
+        except ObjectDoesNotExist:
+            return None
+
+    def watch(self, since=None, timeout_seconds=None, reconnect=True, known=None, queue_size=DEFAULT_QUEUE_SIZE):
+        query = self._clone(AsyncWatchQuery)
+        query.timeout_seconds = timeout_seconds
+        query.reconnect = reconnect
+        query.known = known
+        query.queue_size = queue_size
+        if since is now:
+            if not hasattr(self, "_list_metadata"):
+                raise ValueError("since=now needs the query to have been listed first")
+            query.resource_version = self._list_metadata.get("resourceVersion")
+        elif since is not None:
+            query.resource_version = since
+        return query
+
+    async def _paginate(self, page_size, list_metadata=None):
+        # see Query._paginate
+        if page_size < 1:
+            raise ValueError("page_size must be a positive integer")
+        token = None
+        last_key = None
+        resume_after = None
+        while True:
+            params = {"limit": page_size}
+            if token:
+                params["continue"] = token
+            r = await self.api.get(**self._get_kwargs(params=params))
+            async with r:
+                if r.status == http_client.GONE and token:
+                    try:
+                        payload = self.api.codec.loads(await r.read())
+                    except ValueError:
+                        payload = {}
+                    token = (payload.get("metadata") or {}).get("continue") or None
+                    if token is None:
+                        resume_after = last_key
+                    continue
+                await self.api.raise_for_status(r)
+                response = self.api.codec.loads(await r.read())
+            metadata = response.get("metadata") or {}
+            for obj in (response.get("items") or []):
+                key = _storage_key(obj)
+                if resume_after is not None:
+                    if key <= resume_after:
+                        continue
+                    resume_after = None
+                last_key = key
+                yield obj
+            if list_metadata is not None:
+                list_metadata.clear()
+                list_metadata.update(metadata)
+            token = metadata.get("continue")
+            if not token:
+                break
+
+    async def iterator(self, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Asynchronously iterates over the objects, fetching them in pages of
+        ``page_size``.
+        """
+        metadata = {}
+        async for obj in self._paginate(page_size, metadata):
+            yield self.api_obj_class(self.api, obj)
+        # what watch(since=now) starts from
+        self._list_metadata = metadata
+
+    def __aiter__(self):
+        return self.iterator()
+
+
+class AsyncWatchQuery(WatchQuery):
+    """
+    Async counterpart of WatchQuery with the same reconnect semantics. The
+    stream is read by a background task into a queue of at most
+    ``queue_size`` events; a slow consumer stops the reader, and with it the
+    socket, instead of letting events pile up in memory.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.queue_size = kwargs.pop("queue_size", DEFAULT_QUEUE_SIZE)
+        super(AsyncWatchQuery, self).__init__(*args, **kwargs)
+
+    def _clone(self, cls=None):
+        clone = super(AsyncWatchQuery, self)._clone(cls)
+        if isinstance(clone, AsyncWatchQuery):
+            clone.queue_size = self.queue_size
+        return clone
+
+    async def _relist(self, known):
+        # see WatchQuery._relist
+        metadata = {}
+        listed = set()
+        async for obj in self._clone(AsyncQuery)._paginate(DEFAULT_PAGE_SIZE, metadata):
+            listed.add(_storage_key(obj))
+            yield WatchEvent(type="ADDED", object=self.api_obj_class(self.api, obj))
+        self.resource_version = metadata.get("resourceVersion")
+        for key in [key for key in known.keys() if key not in listed]:
+            yield WatchEvent(type="DELETED", object=known.get(key))
+
+    async def _events(self):
+        seen = self._tracking()
+        failures = 0
+        while not self._closed:
+            expired = False
+            r = self._response = await self.api.get(**self._watch_kwargs())
+            if self._closed:
+                # closed while connecting
+                r.close()
+            try:
+                if r.status == http_client.GONE:
+                    expired = True
+                else:
+                    await self.api.raise_for_status(r)
+                    async for line in iter_lines(r):
+                        event = self._decode_event(line)
+                        failures = 0
+                        if event is not None:
+                            yield self._seen(seen, event)
+            except HTTPError as e:
+                if e.code != http_client.GONE:
+                    raise
+                expired = True
+            except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if not self.reconnect and not self._closed:
+                    raise
+                failures += 1
+            except Exception:
+                # see WatchQuery.object_stream
+                if not self._closed:
+                    raise
+            finally:
+                self._response = None
+                r.release()
+            if self._closed:
+                break
+            if expired:
+                if not self.reconnect:
+                    raise HTTPError(http_client.GONE, "resource version {} is too old".format(self.resource_version))
+                async for event in self._relist(seen if self.known is None else self.known):
+                    yield self._seen(seen, event)
+            elif not self.reconnect:
+                break
+            elif failures:
+                await asyncio.sleep(self._reconnect_delay(failures))
+
+    def object_stream(self):
+        return merge(self._events(), maxsize=self.queue_size)
+
+    def close(self):
+        """
+        Stops the watch: the request being read is closed and the stream
+        ends instead of reconnecting. Call it on the loop the watch runs on.
+        """
+        self._closed = True
+        r = self._response
+        if r is not None:
+            r.close()
+
+    def __aiter__(self):
+        return self.object_stream()
+
+
+async def merge(*streams, maxsize=DEFAULT_QUEUE_SIZE):
+    """
+    Merges async iterators into one, in arrival order. Each stream is
+    consumed by its own task feeding a queue bounded by ``maxsize``, e.g. to
+    follow many watches from a single loop:
+
+        async for event in pykube.aio.merge(*(cls.objects(api).watch() for cls in kinds)):
+            ...
+    """
+    queue = asyncio.Queue(maxsize=maxsize)
+
+    async def produce(stream):
+        try:
+            async for item in stream:
+                await queue.put(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+        await queue.put(_done)
+
+    tasks = [asyncio.ensure_future(produce(stream)) for stream in streams]
+    running = len(tasks)
+    try:
+        while running:
+            item = await queue.get()
+            if item is _done:
+                running -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def iter_lines(response):
+    """
+    Yields the non-empty lines of a streaming aiohttp response. Unlike
+    ``response.content`` line iteration this puts no limit on line length.
+    """
+    pending = b""
+    async for chunk in response.content.iter_any():
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line:
+                yield line
+    if pending:
+        yield pending
+
+
+class AsyncHTTPClient(BaseHTTPClient):
+    """
+    asyncio client for interfacing with the Kubernetes API.
+    """
+
+    query_class = AsyncQuery
+
+    def __init__(self, config, limit=100, json_codec=None, rate_limiter=None, retry=DEFAULT_RETRY):
+        """
+        Creates a new instance of the AsyncHTTPClient.
+
+        :Parameters:
+           - `config`: The configuration instance
+           - `limit`: Maximum number of simultaneous connections
+           - `json_codec`: As for HTTPClient
+           - `rate_limiter`: As for HTTPClient; waiting does not block the loop
+           - `retry`: As for HTTPClient
+        """
+        if not aiohttp_installed:
+            raise ImportError("missing dependencies for asyncio support (try pip install pykube[async])")
+        self.config = config
+        self.codec = get_codec(json_codec)
+        self.url = self.config.cluster["server"]
+        self.limit = limit
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self._session = None
+        self._ssl_context = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                # watches are long lived; only bound connection setup
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=30),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def ssl_context(self):
+        """
+        SSLContext mirroring the certificate handling of
+        KubernetesHTTPAdapterSendMixin.send.
+        """
+        if self._ssl_context is None:
+            cluster = self.config.cluster
+            user = self.config.user
+            if "certificate-authority" in cluster:
+                context = ssl.create_default_context(cafile=cluster["certificate-authority"].filename())
+            else:
+                context = ssl.create_default_context()
+                if cluster.get("insecure-skip-tls-verify"):
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+            if not user.get("token") and "auth-provider" not in user and "client-certificate" in user:
+                context.load_cert_chain(
+                    user["client-certificate"].filename(),
+                    user["client-key"].filename(),
+                )
+            self._ssl_context = context
+        return self._ssl_context
+
+    async def _authenticate(self, headers, rejected_token=None):
+        """
+        Sets the authentication headers. Returns the auth-provider token used
+        (so it can be refreshed should it be rejected) or None.
+        """
+        user = self.config.user
+        if user.get("token"):
+            headers["Authorization"] = "Bearer {}".format(user["token"])
+        elif "auth-provider" in user:
+            provider = auth_provider(self.config)
+            if provider is not None:
+                # refreshing may run cmd-path or google-auth; both block
+                loop = asyncio.get_event_loop()
+                if rejected_token is None:
+                    token = provider.cached_token()
+                    if token is None:
+                        token = await loop.run_in_executor(None, provider.token)
+                else:
+                    token = await loop.run_in_executor(None, provider.refresh, rejected_token)
+                headers["Authorization"] = "Bearer {}".format(token)
+                return token
+        elif user.get("username") and user.get("password"):
+            credentials = "{}:{}".format(user["username"], user["password"]).encode("utf-8")
+            headers["Authorization"] = "Basic {}".format(base64.b64encode(credentials).decode("ascii"))
+        return None
+
+    async def request(self, method, **kwargs):
+        """
+        Makes an API request based on arguments and returns the
+        aiohttp.ClientResponse. The body is not read; use the response as an
+        async context manager or release it when done.
+
+        :Parameters:
+           - `method`: The HTTP method
+           - `kwargs`: Keyword arguments
+        """
+        kwargs = self.get_kwargs(**kwargs)
+        url = kwargs.pop("url")
+        kwargs.pop("stream", None)
+        headers = dict(kwargs.pop("headers", None) or {})
+        attempt = 0
+        retries = 0
+        # the token the API server answered 401 to, to be refreshed
+        rejected = None
+        while True:
+            if self.rate_limiter is not None:
+                wait = self.rate_limiter.reserve(method)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            token = await self._authenticate(headers, rejected_token=rejected)
+            rejected = None
+            try:
+                r = await self.session.request(method, url, headers=headers, ssl=self.ssl_context, **kwargs)
+            except aiohttp.ClientConnectionError:
+                if self.retry is None or not self.retry.retry_error(method, retries):
+                    raise
+                await asyncio.sleep(self.retry.delay(retries))
+                retries += 1
+                continue
+            if r.status == http_client.UNAUTHORIZED and token is not None and attempt < 2:
+                r.release()
+                attempt += 1
+                rejected = token
+                continue
+            retry_after = r.headers.get("Retry-After")
+            if self.retry is not None and self.retry.retry_status(method, r.status, retries, retry_after):
+                delay = self.retry.delay(retries, retry_after)
+                r.release()
+                await asyncio.sleep(delay)
+                retries += 1
+                continue
+            return r
+
+    async def get(self, **kwargs):
+        return await self.request("GET", **kwargs)
+
+    async def options(self, **kwargs):
+        return await self.request("OPTIONS", **kwargs)
+
+    async def head(self, **kwargs):
+        return await self.request("HEAD", **kwargs)
+
+    async def post(self, **kwargs):
+        return await self.request("POST", **kwargs)
+
+    async def put(self, **kwargs):
+        return await self.request("PUT", **kwargs)
+
+    async def patch(self, **kwargs):
+        return await self.request("PATCH", **kwargs)
+
+    async def delete(self, **kwargs):
+        return await self.request("DELETE", **kwargs)
+
+    async def raise_for_status(self, resp):
+        if resp.status < 400:
+            return
+        # attempt to provide a more specific exception based around what
+        # Kubernetes returned as the error.
+        if resp.content_type == "application/json":
+            payload = self.codec.loads(await resp.read())
+            if payload.get("kind") == "Status":
+                raise HTTPError(resp.status, payload["message"])
+        resp.raise_for_status()
+
+    async def version(self):
+        """
+        Get Kubernetes API version
+        """
+        r = await self.get(version="", base="/version")
+        async with r:
+            await self.raise_for_status(r)
+            data = self.codec.loads(await r.read())
+        return (data["major"], data["minor"])
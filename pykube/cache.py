@@ -0,0 +1,655 @@
+"""
+In-memory caches of Kubernetes objects kept up to date by a watch.
+"""
+
+import logging
+import re
+import threading
+
+from six import string_types
+
+from .exceptions import ObjectDoesNotExist
+from .query import DEFAULT_PAGE_SIZE, all_, everything
+
+
+logger = logging.getLogger(__name__)
+
+
+def object_key(obj):
+    """
+    Returns the ``namespace/name`` (or ``name`` for cluster scoped objects)
+    key of an API object or of its raw dict.
+    """
+    metadata = (obj if isinstance(obj, dict) else obj._obj)["metadata"]
+    if metadata.get("namespace"):
+        return "{}/{}".format(metadata["namespace"], metadata["name"])
+    return metadata["name"]
+
+
+# indexers read the raw dict (APIObject._obj) so indexing never triggers
+# the copy-on-write snapshot of APIObject.obj
+
+
+def index_by_namespace(obj):
+    namespace = obj._obj["metadata"].get("namespace")
+    return [namespace] if namespace else []
+
+
+def index_by_label(obj):
+    # "key=value" for equality lookups and bare "key" for existence lookups;
+    # label keys never contain "=" so the two cannot collide
+    values = []
+    for k, v in (obj._obj["metadata"].get("labels") or {}).items():
+        values.append("{}={}".format(k, v))
+        values.append(k)
+    return values
+
+
+def index_by_owner(obj):
+    return [ref["uid"] for ref in obj._obj["metadata"].get("ownerReferences") or [] if "uid" in ref]
+
+
+def index_by_node(obj):
+    node_name = (obj._obj.get("spec") or {}).get("nodeName")
+    return [node_name] if node_name else []
+
+
+DEFAULT_INDEXERS = {
+    "namespace": index_by_namespace,
+    "label": index_by_label,
+    "owner": index_by_owner,
+    "node": index_by_node,
+}
+
+
+class ObjectStore(object):
+    """
+    Thread-safe store of API objects keyed by ``namespace/name``.
+
+    Objects are indexed by every registered indexer: a function returning the
+    list of index values of an object. The ``namespace``, ``label``
+    (``key=value`` and ``key``), ``owner`` (ownerReferences UID) and ``node``
+    (``spec.nodeName``) indexers are registered unless ``indexers`` says
+    otherwise.
+    """
+
+    def __init__(self, indexers=None):
+        self._lock = threading.RLock()
+        self._objects = {}
+        self._indexers = {}
+        self._indices = {}
+        if indexers is None:
+            indexers = DEFAULT_INDEXERS
+        for name, func in indexers.items():
+            self.add_indexer(name, func)
+
+    def add_indexer(self, name, func):
+        """
+        Registers (or replaces) an indexer and indexes the stored objects.
+        """
+        with self._lock:
+            self._indexers[name] = func
+            self._indices[name] = index = {}
+            for key, obj in self._objects.items():
+                for value in func(obj):
+                    index.setdefault(value, set()).add(key)
+
+    def _index(self, key, obj):
+        for name, func in self._indexers.items():
+            index = self._indices[name]
+            for value in func(obj):
+                index.setdefault(value, set()).add(key)
+
+    def _unindex(self, key, obj):
+        for name, func in self._indexers.items():
+            index = self._indices[name]
+            for value in func(obj):
+                keys = index.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[value]
+
+    def add(self, obj):
+        """
+        Adds or replaces an object and returns the object it replaced (if any).
+        """
+        key = object_key(obj)
+        with self._lock:
+            old = self._objects.get(key)
+            if old is not None:
+                self._unindex(key, old)
+            self._objects[key] = obj
+            self._index(key, obj)
+        return old
+
+    update = add
+
+    def delete(self, obj):
+        """
+        Removes an object and returns the object that was stored (if any).
+        """
+        key = object_key(obj)
+        with self._lock:
+            old = self._objects.pop(key, None)
+            if old is not None:
+                self._unindex(key, old)
+        return old
+
+    def replace(self, objs):
+        """
+        Replaces the content of the store. Returns a ``(added, updated,
+        deleted)`` tuple where updated holds ``(old, new)`` pairs.
+        """
+        objects = dict((object_key(obj), obj) for obj in objs)
+        with self._lock:
+            previous, self._objects = self._objects, objects
+            for name in self._indices:
+                self._indices[name] = {}
+            for key, obj in objects.items():
+                self._index(key, obj)
+        added, updated = [], []
+        for key, obj in objects.items():
+            if key in previous:
+                updated.append((previous.pop(key), obj))
+            else:
+                added.append(obj)
+        return added, updated, list(previous.values())
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._objects.get(key, default)
+
+    def keys(self):
+        with self._lock:
+            return list(self._objects)
+
+    def list(self):
+        with self._lock:
+            return list(self._objects.values())
+
+    def index_keys(self, name, value):
+        """
+        Returns the set of keys of the objects indexed under ``value`` by the
+        ``name`` indexer.
+        """
+        with self._lock:
+            return set(self._indices[name].get(value, ()))
+
+    def by_index(self, name, value):
+        """
+        Returns the objects indexed under ``value`` by the ``name`` indexer.
+        """
+        with self._lock:
+            return [self._objects[key] for key in self._indices[name].get(value, ())]
+
+    def select(self, keys):
+        """
+        Returns the stored objects for the given keys.
+        """
+        with self._lock:
+            return [self._objects[key] for key in keys if key in self._objects]
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, key):
+        return key in self._objects
+
+
+class Informer(object):
+    """
+    Keeps a local ObjectStore in sync with the API server: one LIST followed
+    by a WATCH that is resumed from the last seen resourceVersion. Should the
+    watch expire the collection is listed again, by the watch, which tells
+    the objects gone meanwhile from the store.
+
+    Event handlers registered with ``add_event_handler`` are called from the
+    informer thread. Objects handed out by the store are shared by every
+    consumer and must be treated as read-only.
+
+    For example:
+
+        informer = pykube.cache.Informer(api, pykube.Pod, namespace="default")
+        informer.start()
+        informer.wait_for_sync()
+        pods = informer.cached().filter(selector={"app": "web"})
+    """
+
+    def __init__(self, api, api_obj_class, namespace=None, selector=None,
+                 field_selector=None, timeout_seconds=300, retry_period=1,
+                 indexers=None):
+        """
+        :Parameters:
+           - `api`: The HTTPClient used to list and watch
+           - `api_obj_class`: The APIObject subclass to cache
+           - `namespace`: As for ``api_obj_class.objects``; pass ``pykube.all``
+             to cache every namespace
+           - `selector`: Label selector restricting the cached objects
+           - `field_selector`: Field selector restricting the cached objects
+           - `timeout_seconds`: Server side timeout of each watch request
+           - `retry_period`: Seconds to wait before retrying a failed list or
+             watch
+           - `indexers`: Indexers of the store (see ObjectStore)
+        """
+        self.api = api
+        self.api_obj_class = api_obj_class
+        self.query = api_obj_class.objects(api, namespace=namespace).filter(
+            selector=selector,
+            field_selector=field_selector,
+        )
+        self.timeout_seconds = timeout_seconds
+        self.retry_period = retry_period
+        self.store = ObjectStore(indexers=indexers)
+        self._handlers = []
+        self._synced = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        # the watch in progress, closed by stop()
+        self._watch_query = None
+        self.resource_version = None
+
+    def add_indexer(self, name, func):
+        """
+        Registers a user-defined index function on the store.
+        """
+        self.store.add_indexer(name, func)
+
+    def add_event_handler(self, on_add=None, on_update=None, on_delete=None):
+        """
+        Registers callbacks for changes to the store. ``on_add(obj)``,
+        ``on_update(old, new)`` and ``on_delete(obj)`` are all optional.
+        Objects already in the store are replayed to ``on_add``.
+        """
+        handler = (on_add, on_update, on_delete)
+        self._handlers.append(handler)
+        if on_add is not None:
+            for obj in self.store.list():
+                on_add(obj)
+
+    def _notify(self, index, *args):
+        for handler in self._handlers:
+            callback = handler[index]
+            if callback is None:
+                continue
+            try:
+                callback(*args)
+            except Exception:
+                logger.exception("informer event handler failed")
+
+    def _list(self):
+        metadata = {}
+        objs = [
+            self.api_obj_class(self.api, obj)
+            for obj in self.query._paginate(DEFAULT_PAGE_SIZE, metadata)
+        ]
+        self.resource_version = metadata.get("resourceVersion")
+        added, updated, deleted = self.store.replace(objs)
+        for obj in added:
+            self._notify(0, obj)
+        for old, new in updated:
+            self._notify(1, old, new)
+        for obj in deleted:
+            self._notify(2, obj)
+        self._synced.set()
+
+    def _watch(self):
+        query = self.query.watch(
+            since=self.resource_version,
+            timeout_seconds=self.timeout_seconds,
+            known=self.store,
+        )
+        self._watch_query = query
+        if self._stopped.is_set():
+            # stop() came before the query was there to close
+            query.close()
+        try:
+            for event in query:
+                if event.type == "DELETED":
+                    old = self.store.delete(event.object)
+                    self._notify(2, old or event.object)
+                else:
+                    old = self.store.add(event.object)
+                    if old is None:
+                        self._notify(0, event.object)
+                    else:
+                        self._notify(1, old, event.object)
+                if self._stopped.is_set():
+                    break
+        finally:
+            self._watch_query = None
+            self.resource_version = query.resource_version
+
+    def run(self):
+        """
+        Lists and watches until ``stop`` is called. ``start`` runs this in a
+        daemon thread.
+        """
+        while not self._stopped.is_set():
+            try:
+                if self.resource_version is None:
+                    self._list()
+                self._watch()
+            except Exception:
+                if self._stopped.is_set():
+                    break
+                logger.exception("informer for {} failed; retrying".format(self.api_obj_class.kind))
+                self._stopped.wait(self.retry_period)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="informer-{}".format(self.api_obj_class.kind))
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stops the informer: the watch request in progress is closed and the
+        informer thread joined for at most ``timeout`` seconds (None to wait
+        until it finished). Returns whether the thread finished.
+        """
+        self._stopped.set()
+        query = self._watch_query
+        if query is not None:
+            query.close()
+        thread = self._thread
+        if thread is None or thread is threading.current_thread():
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def wait_for_sync(self, timeout=None):
+        """
+        Blocks until the initial list populated the store. Returns whether it
+        did within `timeout`.
+        """
+        return self._synced.wait(timeout)
+
+    @property
+    def has_synced(self):
+        return self._synced.is_set()
+
+    def cached(self):
+        """
+        Returns a CachedQuery reading from the store.
+        """
+        return CachedQuery(self)
+
+
+class CachedQuery(object):
+    """
+    Query compatible read path over an Informer's store. Nothing here goes to
+    the API server.
+    """
+
+    def __init__(self, informer, namespace=None, selector=everything, field_selector=everything):
+        self.informer = informer
+        self.api_obj_class = informer.api_obj_class
+        self.namespace = namespace
+        self.selector = selector
+        self.field_selector = field_selector
+
+    def all(self):
+        return self._clone()
+
+    def filter(self, namespace=None, selector=None, field_selector=None):
+        clone = self._clone()
+        if namespace is not None:
+            clone.namespace = namespace
+        if selector is not None:
+            clone.selector = selector
+        if field_selector is not None:
+            clone.field_selector = field_selector
+        return clone
+
+    def _clone(self):
+        return self.__class__(
+            self.informer,
+            namespace=self.namespace,
+            selector=self.selector,
+            field_selector=self.field_selector,
+        )
+
+    def _candidates(self, label_requirements, field_requirements, key_sets):
+        """
+        Resolves what it can through the store indexes. Returns the candidate
+        objects along with the requirements still to be checked one by one.
+        """
+        store = self.informer.store
+        if self.namespace is not None and self.namespace is not all_:
+            key_sets.append(store.index_keys("namespace", self.namespace))
+        remaining_labels = []
+        for key, op, values in label_requirements:
+            if op == "eq":
+                key_sets.append(store.index_keys("label", "{}={}".format(key, values[0])))
+            elif op == "in":
+                keys = set()
+                for value in values:
+                    keys |= store.index_keys("label", "{}={}".format(key, value))
+                key_sets.append(keys)
+            elif op == "exists":
+                key_sets.append(store.index_keys("label", key))
+            else:
+                remaining_labels.append((key, op, values))
+        remaining_fields = []
+        for key, op, values in field_requirements:
+            index = _field_indexes.get(key)
+            if op == "eq" and index is not None and values[0]:
+                key_sets.append(store.index_keys(index, values[0]))
+            else:
+                remaining_fields.append((key, op, values))
+        if key_sets:
+            key_sets.sort(key=len)
+            keys = key_sets[0].intersection(*key_sets[1:])
+            objs = store.select(keys)
+        else:
+            objs = store.list()
+        return objs, remaining_labels, remaining_fields
+
+    def iterator(self):
+        return self._select([])
+
+    def _select(self, key_sets):
+        label_requirements = []
+        if self.selector is not everything:
+            label_requirements = parse_selector(self.selector)
+        field_requirements = []
+        if self.field_selector is not everything:
+            field_requirements = parse_selector(self.field_selector)
+        objs, label_requirements, field_requirements = self._candidates(
+            label_requirements,
+            field_requirements,
+            key_sets,
+        )
+        for obj in objs:
+            raw = obj._obj
+            if label_requirements and not labels_match(raw["metadata"].get("labels") or {}, label_requirements):
+                continue
+            if field_requirements and not fields_match(raw, field_requirements):
+                continue
+            yield obj
+
+    def by_index(self, name, value):
+        """
+        Returns the objects matching the query that the ``name`` indexer
+        filed under ``value``, e.g. ``by_index("owner", replica_set_uid)``.
+        """
+        return list(self._select([self.informer.store.index_keys(name, value)]))
+
+    def get_by_name(self, name):
+        namespace = self.namespace
+        if namespace is None:
+            namespace = self.informer.query.namespace
+        if namespace is all_:
+            namespace = None
+        key = "{}/{}".format(namespace, name) if namespace else name
+        obj = self.informer.store.get(key)
+        if obj is None:
+            raise ObjectDoesNotExist("{} does not exist.".format(name))
+        return obj
+
+    def get(self, *args, **kwargs):
+        if "name" in kwargs:
+            return self.get_by_name(kwargs["name"])
+        objs = list(self.filter(*args, **kwargs).iterator())
+        if len(objs) == 1:
+            return objs[0]
+        if not objs:
+            raise ObjectDoesNotExist("get() returned zero objects")
+        raise ValueError("get() more than one object; use filter")
+
+    def get_or_none(self, *args, **kwargs):
+        try:
+            return self.get(*args, **kwargs)
+        except ObjectDoesNotExist:
+            return None
+
+    def __len__(self):
+        return sum(1 for _ in self.iterator())
+
+    def __iter__(self):
+        return self.iterator()
+
+
+_field_indexes = {
+    "metadata.namespace": "namespace",
+    "spec.nodeName": "node",
+}
+
+
+_informers = {}
+_informers_lock = threading.Lock()
+
+
+def shared_informer(api, api_obj_class, namespace=None, selector=None, field_selector=None):
+    """
+    Returns a started Informer shared by every caller in the process asking
+    for the same objects, so one watch connection feeds all of them.
+    """
+    key = (
+        id(api),
+        api_obj_class,
+        namespace,
+        None if selector is None else as_key(selector),
+        None if field_selector is None else as_key(field_selector),
+    )
+    with _informers_lock:
+        informer = _informers.get(key)
+        if informer is None:
+            informer = Informer(
+                api,
+                api_obj_class,
+                namespace=namespace,
+                selector=selector,
+                field_selector=field_selector,
+            )
+            _informers[key] = informer.start()
+    return informer
+
+
+def as_key(selector):
+    return tuple(sorted(parse_selector(selector)))
+
+
+_requirement_re = re.compile(
+    r"^\s*(?P<key>[^\s!=,()]+)\s*(?:(?P<op>==|=|!=)\s*(?P<value>[^\s,()]*)"
+    r"|\s+(?P<setop>in|notin)\s*\((?P<values>[^)]*)\))?\s*$"
+)
+
+
+def parse_selector(value):
+    """
+    Parses a selector, given as a string or as a dict in the form understood
+    by ``as_selector``, into ``(key, op, values)`` requirements where op is
+    one of ``eq``, ``neq``, ``in``, ``notin``, ``exists`` or ``notexists``
+    and values is a tuple of strings.
+    """
+    if not isinstance(value, string_types):
+        requirements = []
+        for k, v in value.items():
+            bits = k.split("__")
+            assert len(bits) <= 2, "too many __ in selector"
+            op = bits[1] if len(bits) == 2 else "eq"
+            if op in {"eq", "neq"}:
+                values = (str(v),)
+            elif op in {"in", "notin"}:
+                values = tuple(str(x) for x in v)
+            else:
+                raise ValueError("{} is not a valid comparison operator".format(op))
+            requirements.append((bits[0], op, values))
+        return requirements
+    requirements = []
+    for part in _split_selector(value):
+        if part.startswith("!"):
+            requirements.append((part[1:].strip(), "notexists", ()))
+            continue
+        m = _requirement_re.match(part)
+        if m is None:
+            raise ValueError("unable to parse selector requirement {!r}".format(part))
+        if m.group("op"):
+            op = "neq" if m.group("op") == "!=" else "eq"
+            requirements.append((m.group("key"), op, (m.group("value"),)))
+        elif m.group("setop"):
+            values = tuple(v.strip() for v in m.group("values").split(",") if v.strip())
+            requirements.append((m.group("key"), m.group("setop"), values))
+        else:
+            requirements.append((m.group("key"), "exists", ()))
+    return requirements
+
+
+def _split_selector(value):
+    # split on commas that are not inside an "in (...)" value list
+    parts, depth, current = [], 0, []
+    for c in value:
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        if c == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(c)
+    parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+
+def _requirement_matches(present, actual, op, values):
+    if op == "eq":
+        return present and actual == values[0]
+    if op == "neq":
+        return not present or actual != values[0]
+    if op == "in":
+        return present and actual in values
+    if op == "notin":
+        return not present or actual not in values
+    if op == "exists":
+        return present
+    return not present
+
+
+def labels_match(labels, requirements):
+    """
+    Returns whether the labels dict satisfies every parsed requirement.
+    """
+    for key, op, values in requirements:
+        if not _requirement_matches(key in labels, labels.get(key), op, values):
+            return False
+    return True
+
+
+def fields_match(obj, requirements):
+    """
+    Returns whether the raw object satisfies every parsed field requirement.
+    Fields are dotted paths such as ``spec.nodeName``.
+    """
+    for key, op, values in requirements:
+        value = obj
+        for bit in key.split("."):
+            value = value.get(bit) if isinstance(value, dict) else None
+        # the API server compares fields as strings; unset fields are ""
+        actual = "" if value is None else str(value).lower() if isinstance(value, bool) else str(value)
+        if not _requirement_matches(True, actual, op, values):
+            return False
+    return True
@@ -0,0 +1,128 @@
+"""
+JSON encoding and decoding.
+
+Every request and response body goes through the codec of the client
+(``HTTPClient(config, json_codec=...)``). By default that is the standard
+library; orjson and ujson, when installed, are used if asked for by name.
+All codecs decode straight from bytes and produce the same bytes as
+``json_dumps``: compact separators and no ASCII escaping. Whatever a
+faster library encodes differently (non-string keys, dates, integers
+beyond 64 bits) is encoded by the standard library instead, so it is
+written, or refused, as ``json_dumps`` does.
+"""
+
+import json
+
+import six
+
+try:
+    import orjson
+    orjson_installed = True
+    # non-string keys as json writes them; dates are not serializable there
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+except ImportError:
+    orjson_installed = False
+
+try:
+    import ujson
+    ujson_installed = True
+except ImportError:
+    ujson_installed = False
+
+
+def json_dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class JSONCodec(object):
+    """
+    Codec built on the standard library json module.
+    """
+
+    name = "json"
+
+    # StreamingList decodes items with the same C scanner as json.loads, so
+    # decoding lists incrementally costs nothing extra with this codec
+    prefer_streaming = True
+
+    def loads(self, data):
+        if isinstance(data, six.binary_type):
+            data = data.decode("utf-8")
+        return json.loads(data)
+
+    def dumps(self, obj):
+        return json_dumps(obj)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    Codec built on orjson.
+    """
+
+    name = "orjson"
+    prefer_streaming = False
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, obj):
+        try:
+            return orjson.dumps(obj, option=ORJSON_OPTIONS)
+        except TypeError:
+            return json_dumps(obj)
+
+
+class UjsonCodec(JSONCodec):
+    """
+    Codec built on ujson.
+    """
+
+    name = "ujson"
+    prefer_streaming = False
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+    def dumps(self, obj):
+        if _has_non_str_keys(obj):
+            return json_dumps(obj)
+        try:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode("utf-8")
+        except (TypeError, OverflowError):
+            return json_dumps(obj)
+
+
+def _has_non_str_keys(obj):
+    # ujson writes some of them differently than json (e.g. True as "True")
+    if isinstance(obj, dict):
+        return any(not isinstance(k, six.string_types) or _has_non_str_keys(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return any(_has_non_str_keys(v) for v in obj)
+    return False
+
+
+_codecs = {
+    "json": (JSONCodec, True),
+    "orjson": (OrjsonCodec, orjson_installed),
+    "ujson": (UjsonCodec, ujson_installed),
+}
+
+
+def get_codec(codec=None):
+    """
+    Returns a codec instance given a codec, the name of one or None for the
+    standard library one.
+    """
+    if codec is None:
+        return default_codec
+    if not isinstance(codec, six.string_types):
+        return codec
+    if codec not in _codecs:
+        raise ValueError("unknown JSON codec {!r}; use one of {}".format(codec, ", ".join(sorted(_codecs))))
+    cls, installed = _codecs[codec]
+    if not installed:
+        raise ImportError("{} is not installed".format(codec))
+    return cls()
+
+
+default_codec = JSONCodec()
@@ -2,10 +2,12 @@
 Configuration code.
 """
 
+import atexit
 import base64
 import copy
 import tempfile
 import os
+import threading
 
 import yaml
 
@@ -109,6 +111,7 @@ class KubeConfig(object):
         Creates an instance of the KubeConfig class.
         """
         self.doc = doc
+        self._lock = threading.RLock()
         self._current_context = None
         if current_context is not None:
             self.set_current_context(current_context)
@@ -135,42 +138,48 @@ class KubeConfig(object):
         """
         Returns known clusters by exposing as a read-only property.
         """
-        if not hasattr(self, "_clusters"):
-            cs = {}
-            for cr in self.doc["clusters"]:
-                cs[cr["name"]] = c = copy.deepcopy(cr["cluster"])
-                if "server" not in c:
-                    c["server"] = "http://localhost"
-                BytesOrFile.maybe_set(c, "certificate-authority")
-            self._clusters = cs
-        return self._clusters
+        clusters = getattr(self, "_clusters", None)
+        if clusters is None:
+            with self._lock:
+                clusters = {}
+                for cr in self.doc["clusters"]:
+                    clusters[cr["name"]] = c = copy.deepcopy(cr["cluster"])
+                    if "server" not in c:
+                        c["server"] = "http://localhost"
+                    BytesOrFile.maybe_set(c, "certificate-authority")
+                self._clusters = clusters
+        return clusters
 
     @property
     def users(self):
         """
         Returns known users by exposing as a read-only property.
         """
-        if not hasattr(self, "_users"):
-            us = {}
-            if "users" in self.doc:
-                for ur in self.doc["users"]:
-                    us[ur["name"]] = u = copy.deepcopy(ur["user"])
-                    BytesOrFile.maybe_set(u, "client-certificate")
-                    BytesOrFile.maybe_set(u, "client-key")
-            self._users = us
-        return self._users
+        users = getattr(self, "_users", None)
+        if users is None:
+            with self._lock:
+                users = {}
+                if "users" in self.doc:
+                    for ur in self.doc["users"]:
+                        users[ur["name"]] = u = copy.deepcopy(ur["user"])
+                        BytesOrFile.maybe_set(u, "client-certificate")
+                        BytesOrFile.maybe_set(u, "client-key")
+                self._users = users
+        return users
 
     @property
     def contexts(self):
         """
         Returns known contexts by exposing as a read-only property.
         """
-        if not hasattr(self, "_contexts"):
-            cs = {}
-            for cr in self.doc["contexts"]:
-                cs[cr["name"]] = copy.deepcopy(cr["context"])
-            self._contexts = cs
-        return self._contexts
+        contexts = getattr(self, "_contexts", None)
+        if contexts is None:
+            with self._lock:
+                contexts = {}
+                for cr in self.doc["contexts"]:
+                    contexts[cr["name"]] = copy.deepcopy(cr["context"])
+                self._contexts = contexts
+        return contexts
 
     @property
     def cluster(self):
@@ -198,17 +207,29 @@ class KubeConfig(object):
         if not hasattr(self, "filename") or not self.filename:
             # Config was provided as string, not way to persit it
             return
-        with open(self.filename, "w") as f:
-            yaml.safe_dump(self.doc, f, encoding='utf-8',
-                           allow_unicode=True, default_flow_style=False)
+        with self._lock:
+            with open(self.filename, "w") as f:
+                yaml.safe_dump(self.doc, f, encoding='utf-8',
+                               allow_unicode=True, default_flow_style=False)
 
     def reload(self):
-        if hasattr(self, "_users"):
-            delattr(self, "_users")
-        if hasattr(self, "_contexts"):
-            delattr(self, "_contexts")
-        if hasattr(self, "_clusters"):
-            delattr(self, "_clusters")
+        """
+        Drops the parsed clusters, users and contexts so they are rebuilt from
+        the (updated) doc. Safe to call while other threads use the config.
+        """
+        with self._lock:
+            self.__dict__.pop("_users", None)
+            self.__dict__.pop("_contexts", None)
+            self.__dict__.pop("_clusters", None)
+
+    def update_doc(self, func):
+        """
+        Calls ``func(doc)`` to change the doc while holding the config lock,
+        so threads building clusters, users or contexts never see it half
+        changed.
+        """
+        with self._lock:
+            func(self.doc)
 
 
 class BytesOrFile(object):
@@ -264,6 +285,35 @@ class BytesOrFile(object):
         if self._filename:
             return self._filename
         else:
+            return _materialize(self._bytes)
+
+
+_materialized = {}
+_materialized_lock = threading.Lock()
+
+
+def _materialize(data):
+    """
+    Writes data to a temporary file once per process and returns its path.
+    Inline (``*-data``) certificates are needed as files on every request and
+    across config reloads, so the same file is handed out each time and
+    removed at exit.
+    """
+    with _materialized_lock:
+        filename = _materialized.get(data)
+        if filename is None:
             with tempfile.NamedTemporaryFile(delete=False) as f:
-                f.write(self._bytes)
-            return f.name
+                f.write(data)
+            filename = _materialized[data] = f.name
+        return filename
+
+
+@atexit.register
+def _cleanup_materialized():
+    with _materialized_lock:
+        for filename in _materialized.values():
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+        _materialized.clear()
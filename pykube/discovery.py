@@ -0,0 +1,129 @@
+"""
+Caching of API discovery (the resource lists of API group versions).
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from six.moves.urllib.parse import urlparse
+
+
+DEFAULT_CACHE_DIR = os.path.join("~", ".kube", "cache", "discovery")
+
+# as kubectl
+DEFAULT_TTL = 10 * 60
+
+_unsafe_re = re.compile(r"[^\w.-]")
+
+_path_re = re.compile(r"^/(?:api/(?P<core>[^/]+)|apis/(?P<group>[^/]+/[^/]+))(?:/|$)")
+
+
+def api_version_of(path):
+    """
+    Returns the API version (``v1`` or ``group/version``) of a request path
+    relative to the server URL, or None for paths outside /api and /apis.
+    """
+    match = _path_re.match(urlparse(path).path)
+    if match is None:
+        return None
+    return match.group("core") or match.group("group")
+
+
+class DiscoveryCache(object):
+    """
+    Resource lists by API version, kept for ``ttl`` seconds in memory and,
+    unless ``directory`` is None, on disk so other processes skip discovery
+    too. The on-disk layout follows kubectl:
+    ``<directory>/<server host_port>/<group>/<version>/serverresources.json``.
+    """
+
+    def __init__(self, server, directory=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL):
+        """
+        :Parameters:
+           - `server`: The URL of the API server the lists belong to
+           - `directory`: The directory of the on-disk cache or None to only
+             cache in memory
+           - `ttl`: Seconds a resource list is used before it is fetched again
+        """
+        self.ttl = ttl
+        self.directory = None
+        if directory is not None:
+            host = _unsafe_re.sub("_", urlparse(server).netloc)
+            self.directory = os.path.join(os.path.expanduser(directory), host)
+        self._lists = {}
+        self._lock = threading.Lock()
+
+    def _path(self, api_version):
+        return os.path.join(self.directory, *(api_version.split("/") + ["serverresources.json"]))
+
+    def get(self, api_version):
+        """
+        Returns the cached resource list of ``api_version`` or None if there
+        is none younger than the TTL.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._lists.get(api_version)
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+        if self.directory is None:
+            return None
+        path = self._path(api_version)
+        try:
+            mtime = os.path.getmtime(path)
+            if now - mtime >= self.ttl:
+                return None
+            with open(path) as fp:
+                resource_list = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+        with self._lock:
+            self._lists[api_version] = (mtime, resource_list)
+        return resource_list
+
+    def set(self, api_version, resource_list):
+        with self._lock:
+            self._lists[api_version] = (time.time(), resource_list)
+        if self.directory is None:
+            return
+        path = self._path(api_version)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            # written aside and renamed so readers never see a partial file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".serverresources")
+            with os.fdopen(fd, "w") as fp:
+                json.dump(resource_list, fp)
+            os.rename(tmp, path)
+        except (IOError, OSError):
+            # the cache is an optimization; a read-only home must not fail
+            pass
+
+    def invalidate(self, api_version=None):
+        """
+        Forgets the resource list of ``api_version`` or, if None, all of them.
+        """
+        with self._lock:
+            if api_version is None:
+                self._lists.clear()
+            else:
+                self._lists.pop(api_version, None)
+        if self.directory is None:
+            return
+        versions = [api_version] if api_version is not None else self._disk_versions()
+        for version in versions:
+            try:
+                os.remove(self._path(version))
+            except OSError:
+                pass
+
+    def _disk_versions(self):
+        versions = []
+        for root, _, files in os.walk(self.directory):
+            if "serverresources.json" in files:
+                versions.append(os.path.relpath(root, self.directory).replace(os.sep, "/"))
+        return versions
@@ -25,3 +25,10 @@ class HTTPError(PyKubeError):
 
 class ObjectDoesNotExist(PyKubeError):
     pass
+
+
+class WaitTimeout(PyKubeError):
+    """
+    Raised when waiting for the API server to reach a state timed out.
+    """
+    pass
@@ -8,6 +8,9 @@ import posixpath
 import re
 import shlex
 import subprocess
+import threading
+import time
+import weakref
 
 try:
     import google.auth
@@ -21,47 +24,189 @@ import requests.adapters
 from six.moves import http_client
 from six.moves.urllib.parse import urlparse
 
+from . import protobuf
+from .codec import default_codec, get_codec
+from .discovery import DEFAULT_CACHE_DIR, DEFAULT_TTL, DiscoveryCache, api_version_of
 from .exceptions import HTTPError
+from .metrics import RequestInfo
+from .query import Query
+from .ratelimit import DEFAULT_RETRY, monotonic
+from .tracing import NOOP_TRACER, RequestSpans
 from .utils import jsonpath_installed, jsonpath_parse
 
 
 _ipv4_re = re.compile(r"^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?).){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$")
 
 
-class KubernetesHTTPAdapterSendMixin(object):
+_expiry_re = re.compile(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.\d+)?(Z|[+-]\d\d:?\d\d)?$")
+
+
+def parse_expiry(value):
+    """
+    Parses a token expiry (an RFC 3339 string or a datetime) into a naive
+    UTC datetime. Returns None if there is no usable expiry.
+    """
+    if isinstance(value, datetime.datetime):
+        if value.utcoffset() is not None:
+            value = (value - value.utcoffset()).replace(tzinfo=None)
+        return value
+    if not value:
+        return None
+    m = _expiry_re.match(str(value).strip())
+    if m is None:
+        return None
+    expiry = datetime.datetime.strptime(m.group(1), "%Y-%m-%dT%H:%M:%S")
+    offset = m.group(2)
+    if offset and offset != "Z":
+        offset = offset.replace(":", "")
+        delta = datetime.timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+        expiry = expiry - delta if offset[0] == "+" else expiry + delta
+    return expiry
+
+
+def gcp_cmd_token(auth_config):
+    """
+    Runs the auth-provider cmd-path command (e.g. gcloud) and returns the
+    token and expiry found in its output.
+    """
+    output = subprocess.check_output(
+        [auth_config["cmd-path"]] + shlex.split(auth_config["cmd-args"])
+    )
+    parsed = json.loads(output)
+    token = jsonpath_parse(auth_config["token-key"], parsed)
+    expiry = parse_expiry(jsonpath_parse(auth_config["expiry-key"], parsed))
+    return token, expiry
+
+
+class GCPAuthProvider(object):
+    """
+    Token source for the gcp auth-provider.
+
+    The token is cached until ``refresh_ahead`` before its expiry and then
+    refreshed, by running cmd-path or through google-auth, once no matter how
+    many threads ask for it at the same time. A token fetched without a
+    (parseable) expiry is cached for ``untimed_ttl`` or until the API server
+    rejects it. Tokens refreshed through google-auth are persisted back to
+    the kubeconfig.
+    """
+
+    refresh_ahead = datetime.timedelta(seconds=60)
+
+    untimed_ttl = datetime.timedelta(minutes=5)
+
+    def __init__(self, config, auth_config):
+        self.config = config
+        self.auth_config = auth_config
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._token = auth_config.get("access-token")
+        self._expiry = parse_expiry(auth_config.get("expiry"))
+        # when the token was last refreshed
+        self._fetched = None
+
+    def _fresh(self, token, expiry):
+        if not token:
+            return False
+        now = datetime.datetime.utcnow()
+        if expiry is None:
+            fetched = self._fetched
+            return fetched is not None and now < fetched + self.untimed_ttl
+        return now + self.refresh_ahead < expiry
+
+    def cached_token(self):
+        """
+        Returns the cached token if it is not about to expire, otherwise None.
+        Never blocks.
+        """
+        token, expiry = self._token, self._expiry
+        if self._fresh(token, expiry):
+            return token
+        return None
 
-    def _persist_credentials(self, config, token, expiry):
+    def token(self):
+        """
+        Returns a token that is not about to expire.
+        """
+        token = self.cached_token()
+        if token is not None:
+            return token
+        with self._lock:
+            # another caller may have refreshed while we waited
+            if not self._fresh(self._token, self._expiry):
+                self._refresh()
+            return self._token
+
+    def refresh(self, rejected_token):
+        """
+        Refreshes the token after the API server rejected ``rejected_token``,
+        unless another caller already replaced it. Returns the new token.
+        """
+        with self._lock:
+            if self._token == rejected_token:
+                self._refresh()
+            return self._token
+
+    def _refresh(self):
+        if "cmd-path" in self.auth_config:
+            self._token, self._expiry = gcp_cmd_token(self.auth_config)
+            self._fetched = datetime.datetime.utcnow()
+            return
+        if self._credentials is None:
+            self._credentials = google.auth.default()[0]
+        self._credentials.refresh(GoogleAuthRequest())
+        self._token = self._credentials.token
+        self._expiry = parse_expiry(self._credentials.expiry)
+        self._fetched = datetime.datetime.utcnow()
+        self._persist()
+
+    def _persist(self):
+        config = self.config
         user_name = config.contexts[config.current_context]["user"]
-        user = [u["user"] for u in config.doc["users"] if u["name"] == user_name][0]
-        auth_config = user["auth-provider"].setdefault("config", {})
-        auth_config["access-token"] = token
-        auth_config["expiry"] = expiry
+
+        def update(doc):
+            user = [u["user"] for u in doc["users"] if u["name"] == user_name][0]
+            auth_config = user["auth-provider"].setdefault("config", {})
+            auth_config["access-token"] = self._token
+            auth_config["expiry"] = self._expiry
+
+        config.update_doc(update)
         config.persist_doc()
         config.reload()
 
-    def _auth_gcp(self, request, token, expiry, config):
-        original_request = request.copy()
 
-        credentials = google.auth.default()[0]
-        credentials.token = token
-        credentials.expiry = expiry
+_auth_providers = weakref.WeakKeyDictionary()
+_auth_providers_lock = threading.Lock()
 
-        should_persist = not credentials.valid
 
-        auth_request = GoogleAuthRequest()
-        credentials.before_request(auth_request, request.method, request.url, request.headers)
-
-        if should_persist and config:
-            self._persist_credentials(config, credentials.token, credentials.expiry)
+def auth_provider(config):
+    """
+    Returns the token source for the auth-provider of the current user of
+    ``config``, shared by every client using that config, or None if the user
+    has no supported auth-provider.
+    """
+    auth_provider = config.user.get("auth-provider") or {}
+    if auth_provider.get("name") != "gcp":
+        return None
+    # cmd-path only needs jsonpath to read the command output; everything
+    # else goes through google-auth
+    if "cmd-path" in auth_provider.get("config", {}):
+        dependencies = [jsonpath_installed]
+    else:
+        dependencies = [google_auth_installed]
+    if not all(dependencies):
+        raise ImportError("missing dependencies for GCP support (try pip install pykube[gcp]")
+    with _auth_providers_lock:
+        providers = _auth_providers.setdefault(config, {})
+        provider = providers.get(config.current_context)
+        if provider is None:
+            provider = providers[config.current_context] = GCPAuthProvider(
+                config,
+                auth_provider.get("config", {}),
+            )
+    return provider
 
-        def retry(send_kwargs):
-            credentials.refresh(auth_request)
-            response = self.send(original_request, **send_kwargs)
-            if response.ok and config:
-                self._persist_credentials(config, credentials.token, credentials.expiry)
-            return response
 
-        return retry
+class KubernetesHTTPAdapterSendMixin(object):
 
     def send(self, request, **kwargs):
         if "kube_config" in kwargs:
@@ -77,33 +222,15 @@ class KubernetesHTTPAdapterSendMixin(object):
         if "token" in config.user and config.user["token"]:
             request.headers["Authorization"] = "Bearer {}".format(config.user["token"])
         elif "auth-provider" in config.user:
-            auth_provider = config.user["auth-provider"]
-            if auth_provider.get("name") == "gcp":
-                dependencies = [
-                    google_auth_installed,
-                    jsonpath_installed,
-                ]
-                if not all(dependencies):
-                    raise ImportError("missing dependencies for GCP support (try pip install pykube[gcp]")
-                auth_config = auth_provider.get("config", {})
-                if "cmd-path" in auth_config:
-                    output = subprocess.check_output(
-                        [auth_config["cmd-path"]] + shlex.split(auth_config["cmd-args"])
-                    )
-                    parsed = json.loads(output)
-                    token = jsonpath_parse(auth_config["token-key"], parsed)
-                    expiry = datetime.datetime.strptime(
-                        jsonpath_parse(auth_config["expiry-key"], parsed),
-                        "%Y-%m-%dT%H:%M:%SZ"
-                    )
-                    retry_func = self._auth_gcp(request, token, expiry, None)
-                else:
-                    retry_func = self._auth_gcp(
-                        request,
-                        auth_config.get("access-token"),
-                        auth_config.get("expiry"),
-                        config,
-                    )
+            provider = auth_provider(config)
+            if provider is not None:
+                token = provider.token()
+                request.headers["Authorization"] = "Bearer {}".format(token)
+
+                def refresh_and_retry(send_kwargs):
+                    provider.refresh(token)
+                    return self.send(request, **send_kwargs)
+                retry_func = refresh_and_retry
             # @@@ support oidc
         elif "client-certificate" in config.user:
             kwargs["cert"] = (
@@ -143,27 +270,16 @@ class KubernetesHTTPAdapter(KubernetesHTTPAdapterSendMixin, requests.adapters.HT
         super(KubernetesHTTPAdapter, self).__init__(**kwargs)
 
 
-class HTTPClient(object):
+class BaseHTTPClient(object):
     """
-    Client for interfacing with the Kubernetes API.
+    URL building shared by the Kubernetes API clients.
     """
 
-    _session = None
+    codec = default_codec
 
-    def __init__(self, config):
-        """
-        Creates a new instance of the HTTPClient.
-
-        :Parameters:
-           - `config`: The configuration instance
-        """
-        self.config = config
-        self.url = self.config.cluster["server"]
+    content_type = "json"
 
-        session = requests.Session()
-        session.mount("https://", KubernetesHTTPAdapter(self.config))
-        session.mount("http://", KubernetesHTTPAdapter(self.config))
-        self.session = session
+    tracer = NOOP_TRACER
 
     @property
     def url(self):
@@ -174,24 +290,6 @@ class HTTPClient(object):
         pr = urlparse(value)
         self._url = pr.geturl()
 
-    @property
-    def version(self):
-        """
-        Get Kubernetes API version
-        """
-        response = self.get(version="", base="/version")
-        response.raise_for_status()
-        data = response.json()
-        return (data["major"], data["minor"])
-
-    def resource_list(self, api_version):
-        cached_attr = "_cached_resource_list"
-        if not hasattr(self, cached_attr):
-            r = self.get(version=api_version)
-            r.raise_for_status()
-            setattr(self, cached_attr, r.json())
-        return getattr(self, cached_attr)
-
     def get_kwargs(self, **kwargs):
         """
         Creates a full URL to request based on arguments.
@@ -229,94 +327,338 @@ class HTTPClient(object):
         kwargs["url"] = self.url + posixpath.join(*bits)
         return kwargs
 
+
+class HTTPClient(BaseHTTPClient):
+    """
+    Client for interfacing with the Kubernetes API.
+
+    A single HTTPClient may be shared by many threads. Each request is sent
+    on a connection from a pool of at most ``pool_maxsize`` connections per
+    host; with ``pool_block`` threads wait for a free connection rather than
+    opening throwaway ones. Auth-provider token refreshes (and the kubeconfig
+    updates they cause) are serialized, so concurrent requests trigger a
+    single refresh. Changing ``session`` or ``config`` while requests are in
+    flight is not safe.
+    """
+
+    _session = None
+
+    query_class = Query
+
+    def __init__(self, config, pool_connections=requests.adapters.DEFAULT_POOLSIZE,
+                 pool_maxsize=requests.adapters.DEFAULT_POOLSIZE,
+                 pool_block=requests.adapters.DEFAULT_POOLBLOCK, json_codec=None, content_type="json",
+                 discovery_cache_dir=DEFAULT_CACHE_DIR, discovery_ttl=DEFAULT_TTL, rate_limiter=None,
+                 retry=DEFAULT_RETRY, tracer=None):
+        """
+        Creates a new instance of the HTTPClient.
+
+        :Parameters:
+           - `config`: The configuration instance
+           - `pool_connections`: The number of per host connection pools to cache
+           - `pool_maxsize`: The maximum number of connections kept per host;
+             size it to the number of threads sharing the client
+           - `pool_block`: Whether to wait for a free connection when the pool
+             is exhausted instead of opening one that is discarded afterwards
+           - `json_codec`: The JSON codec (or name of one: "json", "orjson",
+             "ujson"); defaults to the standard library (see pykube.codec)
+           - `content_type`: "json" or "protobuf" to negotiate the protobuf
+             wire format for list, get and watch requests of the kinds it
+             supports (see pykube.protobuf)
+           - `discovery_cache_dir`: The directory API discovery is cached in
+             across processes, None to cache in memory only
+           - `discovery_ttl`: Seconds discovered resource lists are used for
+           - `rate_limiter`: A pykube.ratelimit.RateLimiter every request
+             (and retry) takes a token from, None for no limit
+           - `retry`: A pykube.ratelimit.Retry deciding which throttled or
+             failed requests are retried, None to never retry
+           - `tracer`: A pykube.tracing tracer for spans of operations and
+             their requests; by default nothing is traced
+        """
+        if content_type not in ("json", "protobuf"):
+            raise ValueError("content_type must be \"json\" or \"protobuf\"")
+        self.config = config
+        self.codec = get_codec(json_codec)
+        self.content_type = content_type
+        self.url = self.config.cluster["server"]
+        self.discovery = DiscoveryCache(self.url, directory=discovery_cache_dir, ttl=discovery_ttl)
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self._before_request = []
+        self._after_request = []
+        if tracer is not None:
+            self.tracer = tracer
+            spans = RequestSpans(tracer)
+            self.add_request_hook(before=spans.before, after=spans.after)
+
+        session = requests.Session()
+        session.hooks["response"].append(self._check_discovery)
+        for prefix in ("https://", "http://"):
+            session.mount(prefix, KubernetesHTTPAdapter(
+                self.config,
+                pool_connections=pool_connections,
+                pool_maxsize=pool_maxsize,
+                pool_block=pool_block,
+            ))
+        self.session = session
+
+    @property
+    def version(self):
+        """
+        Get Kubernetes API version
+        """
+        response = self.get(version="", base="/version")
+        response.raise_for_status()
+        data = self.codec.loads(response.content)
+        return (data["major"], data["minor"])
+
+    def resource_list(self, api_version):
+        """
+        Returns the resources served by an API version (discovery), cached
+        in ``discovery``.
+
+        :Parameters:
+           - `api_version`: The API version ("v1" or "group/version")
+        """
+        resource_list = self.discovery.get(api_version)
+        if resource_list is None:
+            r = self.get(version=api_version)
+            r.raise_for_status()
+            resource_list = self.codec.loads(r.content)
+            self.discovery.set(api_version, resource_list)
+        return resource_list
+
+    def _check_discovery(self, resp, *args, **kwargs):
+        # a 404 that is not a Status about a missing object means the route
+        # itself is gone (a removed group version or custom resource)
+        if resp.status_code == 404 and resp.headers.get("content-type") not in ("application/json",
+                                                                                protobuf.CONTENT_TYPE):
+            api_version = None
+            if resp.url.startswith(self.url):
+                api_version = api_version_of(resp.url[len(self.url):])
+            if api_version is not None:
+                self.discovery.invalidate(api_version)
+
+    def decode(self, resp):
+        """
+        Decodes the body of a response according to its content type.
+
+        :Parameters:
+           - `resp`: The response
+        """
+        if protobuf.is_protobuf(resp.headers.get("content-type")):
+            return protobuf.loads(resp.content)
+        return self.codec.loads(resp.content)
+
     def raise_for_status(self, resp):
         try:
             resp.raise_for_status()
         except Exception:
             # attempt to provide a more specific exception based around what
             # Kubernetes returned as the error.
-            if resp.headers["content-type"] == "application/json":
-                payload = resp.json()
+            if resp.headers["content-type"] in ("application/json", protobuf.CONTENT_TYPE):
+                payload = self.decode(resp)
                 if payload["kind"] == "Status":
                     raise HTTPError(resp.status_code, payload["message"])
             raise
 
-    def request(self, *args, **kwargs):
+    def request(self, method, **kwargs):
         """
-        Makes an API request based on arguments.
+        Makes an API request based on arguments. Every verb goes through
+        here: the request waits for ``rate_limiter`` and is retried as
+        ``retry`` allows.
 
         :Parameters:
-           - `args`: Non-keyword arguments
+           - `method`: The HTTP method
            - `kwargs`: Keyword arguments
         """
-        return self.session.request(*args, **self.get_kwargs(**kwargs))
+        kwargs = self.get_kwargs(**kwargs)
+        if self._before_request or self._after_request:
+            return self._instrumented_request(method, kwargs)
+        return self._send(method, kwargs)
+
+    def _send(self, method, kwargs, info=None):
+        attempt = 0
+        while True:
+            if info is not None:
+                info.retries = attempt
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(method)
+            try:
+                r = self.session.request(method, **kwargs)
+            except requests.exceptions.ConnectionError:
+                if self.retry is None or not self.retry.retry_error(method, attempt):
+                    raise
+                time.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+            retry_after = r.headers.get("retry-after")
+            if self.retry is None or not self.retry.retry_status(method, r.status_code, attempt, retry_after):
+                return r
+            delay = self.retry.delay(attempt, retry_after)
+            r.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def add_request_hook(self, before=None, after=None):
+        """
+        Registers functions called with a ``pykube.metrics.RequestInfo``
+        before every request is sent and after it finished (also when it
+        failed without a response). The ``after`` hooks of a streamed
+        request run once its body was read to the end or it was closed.
+        Hooks run on the requesting (or reading) thread and must be quick
+        and thread-safe.
 
-    def get(self, *args, **kwargs):
+        :Parameters:
+           - `before`: Called before the request is sent
+           - `after`: Called after the response arrived or the request failed
+        """
+        if before is not None:
+            self._before_request.append(before)
+        if after is not None:
+            self._after_request.append(after)
+
+    def remove_request_hook(self, before=None, after=None):
+        if before is not None:
+            self._before_request.remove(before)
+        if after is not None:
+            self._after_request.remove(after)
+
+    def _instrumented_request(self, method, kwargs):
+        info = RequestInfo(method, kwargs["url"], self.url)
+        for hook in self._before_request:
+            hook(info)
+        start = monotonic()
+        try:
+            r = self._send(method, kwargs, info)
+        except Exception as e:
+            info.error = e
+            info.duration = monotonic() - start
+            for hook in self._after_request:
+                hook(info)
+            raise
+        info.duration = monotonic() - start
+        info.status = r.status_code
+        info.ttfb = r.elapsed.total_seconds()
+        body = r.request.body if r.request is not None else None
+        info.bytes_sent = len(body) if body else 0
+
+        def done(bytes_received):
+            info.bytes_received = bytes_received
+            for hook in self._after_request:
+                hook(info)
+        if kwargs.get("stream") and not r._content_consumed:
+            # the body is yet to be read, chunked more often than not
+            r.raw = _CountingStream(r.raw, done)
+        else:
+            done(len(r.content))
+        return r
+
+    def get(self, **kwargs):
         """
         Executes an HTTP GET.
 
         :Parameters:
-           - `args`: Non-keyword arguments
            - `kwargs`: Keyword arguments
         """
-        return self.session.get(*args, **self.get_kwargs(**kwargs))
+        return self.request("GET", **kwargs)
 
-    def options(self, *args, **kwargs):
+    def options(self, **kwargs):
         """
         Executes an HTTP OPTIONS.
 
         :Parameters:
-           - `args`: Non-keyword arguments
            - `kwargs`: Keyword arguments
         """
-        return self.session.options(*args, **self.get_kwargs(**kwargs))
+        return self.request("OPTIONS", **kwargs)
 
-    def head(self, *args, **kwargs):
+    def head(self, **kwargs):
         """
         Executes an HTTP HEAD.
 
         :Parameters:
-           - `args`: Non-keyword arguments
            - `kwargs`: Keyword arguments
         """
-        return self.session.head(*args, **self.get_kwargs(**kwargs))
+        kwargs.setdefault("allow_redirects", False)
+        return self.request("HEAD", **kwargs)
 
-    def post(self, *args, **kwargs):
+    def post(self, **kwargs):
         """
         Executes an HTTP POST.
 
         :Parameters:
-           - `args`: Non-keyword arguments
            - `kwargs`: Keyword arguments
         """
-        return self.session.post(*args, **self.get_kwargs(**kwargs))
+        return self.request("POST", **kwargs)
 
-    def put(self, *args, **kwargs):
+    def put(self, **kwargs):
         """
         Executes an HTTP PUT.
 
         :Parameters:
-           - `args`: Non-keyword arguments
            - `kwargs`: Keyword arguments
         """
-        return self.session.put(*args, **self.get_kwargs(**kwargs))
+        return self.request("PUT", **kwargs)
 
-    def patch(self, *args, **kwargs):
+    def patch(self, **kwargs):
         """
         Executes an HTTP PATCH.
 
         :Parameters:
-           - `args`: Non-keyword arguments
            - `kwargs`: Keyword arguments
         """
-        return self.session.patch(*args, **self.get_kwargs(**kwargs))
+        return self.request("PATCH", **kwargs)
 
-    def delete(self, *args, **kwargs):
+    def delete(self, **kwargs):
         """
         Executes an HTTP DELETE.
 
         :Parameters:
-           - `args`: Non-keyword arguments
            - `kwargs`: Keyword arguments
         """
-        return self.session.delete(*args, **self.get_kwargs(**kwargs))
+        return self.request("DELETE", **kwargs)
+
+
+class _CountingStream(object):
+    """
+    Wraps the raw stream of a streamed response, counting the bytes read
+    from it, and calls ``done(count)`` once it was read to the end or
+    closed.
+    """
+
+    def __init__(self, raw, done):
+        self._raw = raw
+        self._done = done
+        self.count = 0
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def read(self, *args, **kwargs):
+        data = self._raw.read(*args, **kwargs)
+        self.count += len(data)
+        if not data:
+            self._finish()
+        return data
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        # what requests reads through if the raw stream has it
+        if not hasattr(self._raw, "stream"):
+            chunks = iter(lambda: self._raw.read(amt), b"")
+        else:
+            chunks = self._raw.stream(amt, decode_content=decode_content)
+        for chunk in chunks:
+            self.count += len(chunk)
+            yield chunk
+        self._finish()
+
+    def close(self):
+        try:
+            self._raw.close()
+        finally:
+            self._finish()
+
+    def _finish(self):
+        done, self._done = self._done, None
+        if done is not None:
+            done(self.count)
@@ -0,0 +1,160 @@
+"""
+Logs of many pods merged into one stream.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from six.moves import queue
+
+from . import cache
+from .query import everything
+from .utils import log_timestamp_key
+
+
+logger = logging.getLogger(__name__)
+
+LogLine = namedtuple("LogLine", "timestamp namespace pod container text")
+
+
+def follow(query, container=None, since_seconds=None, tail_lines=None, window=1.0, max_buffer=10000):
+    """
+    Streams the logs of every pod matched by ``query`` (a ``Pod.objects``
+    query) concurrently and returns an iterator of ``LogLine`` merged by
+    timestamp. Pods are tracked with an Informer: containers are followed
+    once they run, pods created later are picked up and deleted ones
+    dropped. Iterate until done and close the iterator to stop.
+
+    Lines are held back for ``window`` seconds and handed out in timestamp
+    order, so lines arriving within ``window`` of each other are ordered
+    across pods; a larger window trades latency for better ordering. At most
+    ``max_buffer`` lines are held; beyond that the oldest are handed out
+    early, and pods stop being read until the consumer catches up.
+
+    For example:
+
+        pods = pykube.Pod.objects(api).filter(selector={"app": "web"})
+        for line in pykube.logs.follow(pods, tail_lines=10):
+            print(line.pod, line.container, line.text)
+
+    :Parameters:
+       - `query`: The Pod query selecting the pods to follow
+       - `container`: Only follow containers with this name
+       - `since_seconds`: As for ``Pod.logs``, for pods that exist when
+         following starts
+       - `tail_lines`: As for ``Pod.logs``, for pods that exist when following
+         starts; pods created later are followed from their first line
+       - `window`: Seconds lines are held back to order them
+       - `max_buffer`: The maximum number of lines held back
+    """
+    follower = _Follower(query, container, since_seconds, tail_lines, max_buffer)
+    follower.start()
+    try:
+        for line in follower.merged(window):
+            yield line
+    finally:
+        follower.stop()
+
+
+class _Follower(object):
+
+    def __init__(self, query, container, since_seconds, tail_lines, max_buffer):
+        self.informer = cache.Informer(
+            query.api,
+            query.api_obj_class,
+            namespace=query.namespace,
+            selector=None if query.selector is everything else query.selector,
+            field_selector=None if query.field_selector is everything else query.field_selector,
+        )
+        self.container = container
+        self.since_seconds = since_seconds
+        self.tail_lines = tail_lines
+        self.max_buffer = max_buffer
+        self.lines = queue.Queue(maxsize=max_buffer)
+        self._lock = threading.Lock()
+        # containers (by ID) already followed and pods (by UID) deleted since
+        self._followed = set()
+        self._deleted = set()
+        self._stopped = threading.Event()
+
+    def start(self):
+        self.informer.add_event_handler(
+            on_add=self._on_pod,
+            on_update=lambda old, new: self._on_pod(new),
+            on_delete=self._on_delete,
+        )
+        self.informer.start()
+
+    def stop(self):
+        self._stopped.set()
+        self.informer.stop()
+
+    def _on_pod(self, pod):
+        initial = not self.informer.has_synced
+        uid = pod._obj["metadata"].get("uid")
+        for status in (pod._obj.get("status") or {}).get("containerStatuses") or []:
+            if self.container is not None and status["name"] != self.container:
+                continue
+            state = status.get("state") or {}
+            if "running" not in state and "terminated" not in state:
+                continue
+            # a restarted container has a new ID and is followed again
+            key = status.get("containerID") or "{}/{}".format(uid, status["name"])
+            with self._lock:
+                if key in self._followed or uid in self._deleted:
+                    continue
+                self._followed.add(key)
+            thread = threading.Thread(
+                target=self._stream,
+                args=(pod, status["name"], initial),
+                name="logs-{}-{}".format(pod.name, status["name"]),
+            )
+            thread.daemon = True
+            thread.start()
+
+    def _on_delete(self, pod):
+        with self._lock:
+            self._deleted.add(pod._obj["metadata"].get("uid"))
+
+    def _stream(self, pod, container, initial):
+        uid = pod._obj["metadata"].get("uid")
+        kwargs = {}
+        if initial:
+            kwargs = {"since_seconds": self.since_seconds, "tail_lines": self.tail_lines}
+        try:
+            for line in pod.stream_logs(container=container, timestamps=True, follow=True, **kwargs):
+                if self._stopped.is_set() or uid in self._deleted:
+                    return
+                timestamp, _, text = line.partition(" ")
+                self._put(LogLine(timestamp, pod.namespace, pod.name, container, text))
+        except Exception:
+            if not self._stopped.is_set() and uid not in self._deleted:
+                logger.exception("following logs of {}/{} failed".format(pod.name, container))
+
+    def _put(self, line):
+        while not self._stopped.is_set():
+            try:
+                self.lines.put(line, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def merged(self, window):
+        # (timestamp key, sequence, arrival, line); the sequence keeps lines
+        # with the same timestamp in arrival order
+        held = []
+        sequence = itertools.count()
+        while True:
+            timeout = window if not held else max(0, held[0][2] + window - time.time())
+            try:
+                line = self.lines.get(timeout=timeout)
+                heapq.heappush(held, (log_timestamp_key(line.timestamp) or "", next(sequence), time.time(), line))
+            except queue.Empty:
+                pass
+            now = time.time()
+            while held and (held[0][2] + window <= now or len(held) > self.max_buffer):
+                yield heapq.heappop(held)[3]
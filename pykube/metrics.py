@@ -0,0 +1,252 @@
+"""
+Instrumentation of API requests.
+
+Functions registered with ``HTTPClient.add_request_hook`` are called before
+and after every request with a ``RequestInfo`` describing it. ``Collector``
+is such a hook keeping latency histograms and byte, retry and request
+counters in process and exporting them in the Prometheus text format:
+
+    collector = pykube.metrics.Collector()
+    api.add_request_hook(after=collector.observe)
+    ...
+    print(collector.to_prometheus())
+
+Without hooks requests are not instrumented at all.
+"""
+
+import bisect
+import re
+import threading
+
+from six.moves.urllib.parse import parse_qs, urlparse
+
+
+# as the Prometheus client libraries
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+DEFAULT_LABELS = ("verb", "resource", "code")
+
+_path_re = re.compile(
+    r"^/(?:api/(?P<core>[^/]+)|apis/(?P<group>[^/]+/[^/]+))"
+    r"(?:/namespaces/(?P<namespace>[^/]+))?"
+    r"(?:/(?P<resource>[^/]+)(?:/(?P<name>[^/]+)(?:/(?P<subresource>[^/]+))?)?)?/?$"
+)
+
+_namespace_subresources = frozenset(["status", "finalize"])
+
+_verbs = {"POST": "create", "PUT": "update", "PATCH": "patch", "DELETE": "delete", "HEAD": "head",
+          "OPTIONS": "options"}
+
+
+class RequestInfo(object):
+    """
+    What is known about a request. Before it is sent only ``method``, ``url``
+    and the attributes derived from the URL are set; afterwards the rest.
+
+    ``verb`` is the Kubernetes verb (get, list, watch, create, update, patch,
+    delete, ...); ``resource`` the plural resource name ("pods"; "namespaces"
+    for a namespace itself), None for requests outside resources such as
+    discovery. ``ttfb`` is the seconds from sending the last attempt until
+    its response headers arrived and ``duration`` the seconds of the whole
+    call, including rate limiting and retries, up to the response headers.
+    ``bytes_received`` counts the (decoded) body; of a streamed response as
+    much as was read before it was closed. ``error`` is the exception if no
+    response was received.
+    """
+
+    __slots__ = (
+        "method", "url", "verb", "api_version", "namespace", "resource", "name", "subresource",
+        "status", "bytes_sent", "bytes_received", "retries", "ttfb", "duration", "error",
+    )
+
+    def __init__(self, method, url, server=""):
+        self.method = method
+        self.url = url
+        self.status = None
+        self.bytes_sent = 0
+        self.bytes_received = None
+        self.retries = 0
+        self.ttfb = None
+        self.duration = None
+        self.error = None
+        parsed = urlparse(url[len(server):] if url.startswith(server) else url)
+        match = _path_re.match(parsed.path)
+        if match is None:
+            self.api_version = self.namespace = self.resource = self.name = self.subresource = None
+            self.verb = method.lower()
+            return
+        self.api_version = match.group("core") or match.group("group")
+        self.namespace = match.group("namespace")
+        self.resource = match.group("resource")
+        self.name = match.group("name")
+        self.subresource = match.group("subresource")
+        if self.namespace is not None and (self.resource is None or
+                                           self.name is None and self.resource in _namespace_subresources):
+            # the namespace object itself
+            self.resource, self.name, self.subresource = "namespaces", self.namespace, self.resource
+            self.namespace = None
+        if method == "GET":
+            if "watch" in parse_qs(parsed.query):
+                self.verb = "watch"
+            else:
+                self.verb = "get" if self.name is not None else "list"
+        else:
+            self.verb = _verbs.get(method, method.lower())
+
+    def labels(self, names):
+        return tuple(
+            str(self.status if name == "code" else getattr(self, name) or "")
+            for name in names
+        )
+
+
+class Histogram(object):
+    """
+    Counts observations in cumulative buckets, as a Prometheus histogram.
+    Not thread-safe by itself.
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+        yield float("inf"), self.count
+
+    def quantile(self, q):
+        """
+        Estimates the ``q`` quantile by linear interpolation in its bucket.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, below = 0.0, 0
+        for bound, total in self.cumulative():
+            if total >= rank:
+                if bound == float("inf"):
+                    return lower
+                inside = total - below
+                return lower + (bound - lower) * ((rank - below) / inside if inside else 0)
+            lower, below = bound, total
+        return lower
+
+
+class Collector(object):
+    """
+    Aggregates requests by ``labels`` (attributes of RequestInfo; "code" is
+    the status) into histograms of duration and time to first byte and
+    counters of requests, bytes and retries. Thread-safe.
+
+    Labels multiply the number of series; add "namespace" only with few
+    namespaces.
+    """
+
+    def __init__(self, labels=DEFAULT_LABELS, buckets=DEFAULT_BUCKETS, prefix="pykube_"):
+        """
+        :Parameters:
+           - `labels`: The RequestInfo attributes requests are grouped by
+           - `buckets`: The upper bounds in seconds of the histogram buckets
+           - `prefix`: The prefix of exported metric names
+        """
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, info):
+        """
+        Records a finished request; pass as the ``after`` hook.
+        """
+        key = info.labels(self.labels)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = _Series(self.buckets)
+            series.duration.observe(info.duration)
+            if info.ttfb is not None:
+                series.ttfb.observe(info.ttfb)
+            series.bytes_sent += info.bytes_sent
+            series.bytes_received += info.bytes_received or 0
+            series.retries += info.retries
+
+    def reset(self):
+        with self._lock:
+            self.series.clear()
+
+    def to_prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            series = sorted(((key, s.copy()) for key, s in self.series.items()), key=lambda item: item[0])
+        lines = []
+        for name, kind, doc, value in [
+            ("request_duration_seconds", "histogram", "Duration of API requests including retries.",
+             lambda s: s.duration),
+            ("request_ttfb_seconds", "histogram", "Time to the response headers of API requests.",
+             lambda s: s.ttfb),
+            ("request_sent_bytes_total", "counter", "Bytes of API request bodies.",
+             lambda s: s.bytes_sent),
+            ("request_received_bytes_total", "counter", "Bytes of API response bodies.",
+             lambda s: s.bytes_received),
+            ("request_retries_total", "counter", "Retries of API requests.",
+             lambda s: s.retries),
+        ]:
+            name = self.prefix + name
+            lines.append("# HELP {} {}".format(name, doc))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for key, s in series:
+                labels = ",".join('{}="{}"'.format(label, _escape(v)) for label, v in zip(self.labels, key))
+                if kind == "counter":
+                    lines.append("{}{{{}}} {}".format(name, labels, value(s)))
+                    continue
+                histogram = value(s)
+                for bound, total in histogram.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append('{}_bucket{{{}{}le="{}"}} {}'.format(name, labels, "," if labels else "", le, total))
+                lines.append("{}_sum{{{}}} {}".format(name, labels, repr(histogram.sum)))
+                lines.append("{}_count{{{}}} {}".format(name, labels, histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+class _Series(object):
+
+    __slots__ = ("duration", "ttfb", "bytes_sent", "bytes_received", "retries")
+
+    def __init__(self, buckets):
+        self.duration = Histogram(buckets)
+        self.ttfb = Histogram(buckets)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+
+    def copy(self):
+        copy = _Series(self.duration.buckets)
+        for histogram, source in ((copy.duration, self.duration), (copy.ttfb, self.ttfb)):
+            histogram.counts = list(source.counts)
+            histogram.sum = source.sum
+            histogram.count = source.count
+        copy.bytes_sent = self.bytes_sent
+        copy.bytes_received = self.bytes_received
+        copy.retries = self.retries
+        return copy
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -1,5 +1,12 @@
+import math
+import threading
 import time
 
+from six.moves import http_client
+
+from .exceptions import HTTPError, ObjectDoesNotExist, WaitTimeout
+from .tracing import traced
+
 
 class ReplicatedMixin(object):
 
@@ -7,7 +14,7 @@ class ReplicatedMixin(object):
 
     @property
     def replicas(self):
-        return self.obj["spec"]["replicas"]
+        return self._obj["spec"]["replicas"]
 
     @replicas.setter
     def replicas(self, value):
@@ -16,6 +23,10 @@ class ReplicatedMixin(object):
 
 class ScalableMixin(object):
 
+    # whether the API serves the /scale subresource for this kind; if not,
+    # or if it answers 404, scalable_attr is patched on the object itself
+    scale_subresource = True
+
     @property
     def scalable(self):
         return getattr(self, self.scalable_attr)
@@ -24,14 +35,145 @@ class ScalableMixin(object):
     def scalable(self, value):
         setattr(self, self.scalable_attr, value)
 
-    def scale(self, replicas=None):
+    @traced("ScalableMixin.scale")
+    def scale(self, replicas=None, wait=False, timeout=None):
+        """
+        Sets the number of replicas (``scalable``, by default) with a single
+        small PATCH of the /scale subresource.
+
+        With ``wait`` this blocks until the API server reports the new count
+        in the status, following the object with a watch rather than
+        polling, and raises WaitTimeout if that takes more than ``timeout``
+        seconds (None waits for as long as it takes, which may be forever
+        when the pods never come up).
+        """
         count = self.scalable if replicas is None else replicas
-        self.exists(ensure=True)
-        if self.scalable != count:
-            self.scalable = count
-            self.update()
-            while True:
-                self.reload()
-                if self.scalable == count:
-                    break
-                time.sleep(1)
+        self._patch_scale(count)
+        if wait:
+            self.wait_for_scale(count, timeout=timeout)
+        return self
+
+    def _patch_scale(self, count):
+        headers = {"Content-Type": "application/merge-patch+json"}
+        if self.scale_subresource:
+            r = self.api.patch(**self.api_kwargs(
+                operation="scale",
+                headers=headers,
+                data=self.api.codec.dumps({"spec": {"replicas": count}}),
+            ))
+            if r.status_code != 404:
+                self.api.raise_for_status(r)
+                self._set_scalable(count)
+                return
+        r = self.api.patch(**self.api_kwargs(
+            headers=headers,
+            data=self.api.codec.dumps({"spec": {self.scalable_attr: count}}),
+        ))
+        if r.status_code == 404:
+            raise ObjectDoesNotExist("{} does not exist.".format(self.name))
+        self.api.raise_for_status(r)
+        self.set_obj(self.api.codec.loads(r.content))
+
+    def _set_scalable(self, count):
+        # the object may be shared (think informer caches), so it is copied
+        # rather than changed in place
+        obj = dict(self._obj)
+        obj["spec"] = dict(obj.get("spec") or {})
+        obj["spec"][self.scalable_attr] = count
+        if self._snapshot is None:
+            # the metadata, if handed out, may have unsent changes, which
+            # the copy shares
+            self._obj = obj
+        else:
+            # keep unsent changes; the count is no longer one of them, but
+            # other edits of the spec still are
+            self._obj["spec"][self.scalable_attr] = count
+            spec = dict(self._snapshot.get("spec") or {})
+            spec[self.scalable_attr] = count
+            self._snapshot = dict(self._snapshot, spec=spec)
+
+    def scaled(self, count, obj=None):
+        """
+        Returns whether the API server reports ``count`` replicas for the
+        current generation of the object (or of the raw dict ``obj``).
+        """
+        obj = self._obj if obj is None else obj
+        if self.scalable_attr != "replicas":
+            return obj["spec"].get(self.scalable_attr) == count
+        status = obj.get("status") or {}
+        generation = obj["metadata"].get("generation", 0)
+        return status.get("observedGeneration", generation) >= generation and status.get("replicas", 0) == count
+
+    @traced("ScalableMixin.wait_for_scale")
+    def wait_for_scale(self, count, timeout=None):
+        """
+        Blocks until ``scaled(count)``, watching this one object by field
+        selector, and raises WaitTimeout after ``timeout`` seconds.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        query = self.__class__.objects(self.api, namespace=self.namespace).filter(
+            field_selector={"metadata.name": self.name},
+        )
+        while True:
+            current = query.all()
+            if not len(current):
+                raise ObjectDoesNotExist("{} does not exist.".format(self.name))
+            obj = current.response["items"][0]
+            if self.scaled(count, obj):
+                self.set_obj(obj)
+                return
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                raise WaitTimeout("{} did not scale to {} within {}s".format(self.name, count, timeout))
+            watch = current.watch(
+                since=current.response["metadata"]["resourceVersion"],
+                timeout_seconds=None if remaining is None else int(math.ceil(remaining)),
+                reconnect=False,
+            )
+            try:
+                for event in watch:
+                    if event.type != "DELETED" and self.scaled(count, event.object._obj):
+                        self.set_obj(event.object._obj)
+                        return
+                    if deadline is not None and time.time() >= deadline:
+                        break
+            except HTTPError as e:
+                if e.code != http_client.GONE:
+                    raise
+            # the watch ended (timed out or expired); look again
+
+
+def scale_many(objs, counts, wait=False, timeout=None, max_workers=10):
+    """
+    Scales many objects concurrently, at most ``max_workers`` at a time.
+    ``counts`` is a count for every object or a single count for all of them.
+    The first error raised by any of them is raised once all are done.
+    """
+    objs = list(objs)
+    if isinstance(counts, int):
+        counts = [counts] * len(objs)
+    work = list(zip(objs, counts))
+    lock = threading.Lock()
+    errors = []
+
+    def worker():
+        while True:
+            with lock:
+                if not work:
+                    return
+                obj, count = work.pop(0)
+            try:
+                obj.scale(count, wait=wait, timeout=timeout)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(min(max_workers, len(work)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return objs
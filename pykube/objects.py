@@ -1,21 +1,26 @@
 import copy
-import json
 import os.path as op
+import threading
 from inspect import getmro
+
+import requests.exceptions
 import six
+import yaml
 
 from six.moves.urllib.parse import urlencode
 from .exceptions import ObjectDoesNotExist
 from .mixins import ReplicatedMixin, ScalableMixin
-from .query import Query
-from .utils import obj_merge
+from .query import STREAM_CHUNK_SIZE, Query
+from .tracing import traced
+from .utils import log_timestamp_key, merge_patch
 
 
 class ObjectManager(object):
     def __call__(self, api, namespace=None):
         if namespace is None and NamespacedAPIObject in getmro(self.api_obj_class):
             namespace = api.config.namespace
-        return Query(api, self.api_obj_class, namespace=namespace)
+        query_class = getattr(api, "query_class", Query)
+        return query_class(api, self.api_obj_class, namespace=namespace)
 
     def __get__(self, obj, api_obj_class):
         assert obj is None, "cannot invoke objects on resource object."
@@ -35,8 +40,48 @@ class APIObject(object):
         self.set_obj(obj)
 
     def set_obj(self, obj):
-        self.obj = obj
-        self._original_obj = copy.deepcopy(obj)
+        self._obj = obj
+        self._snapshot = None
+        # the original metadata, once handed out while the rest of the
+        # object was not
+        self._metadata_snapshot = None
+
+    @property
+    def obj(self):
+        """
+        The object as a mutable dict.
+
+        Handing it out is what may lead to a change, so the first access
+        snapshots the original for ``update`` to compare against. Objects
+        that are only ever read through the properties below (as with most
+        objects coming out of lists and watches) are never copied, and
+        ``metadata``, ``labels`` and ``annotations`` copy the metadata only.
+        """
+        if self._snapshot is None:
+            self._snapshot = copy.deepcopy(self._original_obj)
+        return self._obj
+
+    @obj.setter
+    def obj(self, value):
+        if self._snapshot is None:
+            # never handed out, so the current dict is still the original
+            # (but for the metadata, maybe)
+            self._snapshot = self._original_obj
+        self._obj = value
+
+    @property
+    def _original_obj(self):
+        if self._snapshot is not None:
+            return self._snapshot
+        if self._metadata_snapshot is not None:
+            return dict(self._obj, metadata=self._metadata_snapshot)
+        return self._obj
+
+    def _mutable_metadata(self):
+        # as obj, for the metadata alone
+        if self._snapshot is None and self._metadata_snapshot is None:
+            self._metadata_snapshot = copy.deepcopy(self._obj["metadata"])
+        return self._obj["metadata"]
 
     def __repr__(self):
         return "<{kind} {name}>".format(kind=self.kind, name=self.name)
@@ -46,19 +91,19 @@ class APIObject(object):
 
     @property
     def name(self):
-        return self.obj["metadata"]["name"]
+        return self._obj["metadata"]["name"]
 
     @property
     def metadata(self):
-        return self.obj["metadata"]
+        return self._mutable_metadata()
 
     @property
     def labels(self):
-        return self.obj["metadata"].get("labels", {})
+        return self._mutable_metadata().get("labels", {})
 
     @property
     def annotations(self):
-        return self.obj["metadata"].get("annotations", {})
+        return self._mutable_metadata().get("annotations", {})
 
     def api_kwargs(self, **kwargs):
         kw = {}
@@ -81,6 +126,7 @@ class APIObject(object):
         kw.update(kwargs)
         return kw
 
+    @traced("APIObject.exists")
     def exists(self, ensure=False):
         r = self.api.get(**self.api_kwargs())
         if r.status_code not in {200, 404}:
@@ -92,15 +138,17 @@ class APIObject(object):
                 return False
         return True
 
+    @traced("APIObject.create")
     def create(self):
-        r = self.api.post(**self.api_kwargs(data=json.dumps(self.obj), obj_list=True))
+        r = self.api.post(**self.api_kwargs(data=self.api.codec.dumps(self._obj), obj_list=True))
         self.api.raise_for_status(r)
-        self.set_obj(r.json())
+        self.set_obj(self.api.codec.loads(r.content))
 
+    @traced("APIObject.reload")
     def reload(self):
         r = self.api.get(**self.api_kwargs())
         self.api.raise_for_status(r)
-        self.set_obj(r.json())
+        self.set_obj(self.api.codec.loads(r.content))
 
     def watch(self):
         return self.__class__.objects(
@@ -110,15 +158,60 @@ class APIObject(object):
             "metadata.name": self.name
         }).watch()
 
-    def update(self):
-        self.obj = obj_merge(self.obj, self._original_obj)
+    @traced("APIObject.update")
+    def update(self, optimistic=False):
+        """
+        Sends the changes made to ``obj`` since the object was loaded as a
+        JSON merge patch. Nothing is sent when nothing changed.
+
+        With ``optimistic`` the patch carries the resourceVersion the object
+        was loaded with, so the API server rejects it with 409 Conflict if
+        the object was changed by someone else in the meantime.
+        """
+        if self._snapshot is None and self._metadata_snapshot is None:
+            # obj was never handed out, so it cannot have changed
+            return
+        patch = merge_patch(self._original_obj, self._obj)
+        if not patch:
+            return
+        if optimistic:
+            resource_version = self._original_obj.get("metadata", {}).get("resourceVersion")
+            if resource_version:
+                patch.setdefault("metadata", {}).setdefault("resourceVersion", resource_version)
         r = self.api.patch(**self.api_kwargs(
             headers={"Content-Type": "application/merge-patch+json"},
-            data=json.dumps(self.obj),
+            data=self.api.codec.dumps(patch),
         ))
         self.api.raise_for_status(r)
-        self.set_obj(r.json())
+        self.set_obj(self.api.codec.loads(r.content))
 
+    @traced("APIObject.apply")
+    def apply(self, field_manager="pykube", force=False):
+        """
+        Server-side applies ``obj``: a single PATCH with which the API server
+        creates the object or merges it with what is there, tracking the
+        fields set by ``field_manager``. With ``force`` conflicts with fields
+        owned by other managers are overridden instead of rejected.
+        """
+        obj = dict(self._obj)
+        obj.setdefault("apiVersion", self.version)
+        obj.setdefault("kind", self.kind)
+        if "managedFields" in obj.get("metadata", {}):
+            # the API server refuses applied configurations carrying these
+            obj["metadata"] = dict(obj["metadata"])
+            del obj["metadata"]["managedFields"]
+        params = {"fieldManager": field_manager}
+        if force:
+            params["force"] = "true"
+        r = self.api.patch(**self.api_kwargs(
+            headers={"Content-Type": "application/apply-patch+yaml"},
+            data=self.api.codec.dumps(obj),
+            params=params,
+        ))
+        self.api.raise_for_status(r)
+        self.set_obj(self.api.codec.loads(r.content))
+
+    @traced("APIObject.delete")
     def delete(self):
         r = self.api.delete(**self.api_kwargs())
         if r.status_code != 404:
@@ -129,12 +222,81 @@ class NamespacedAPIObject(APIObject):
 
     @property
     def namespace(self):
-        if self.obj["metadata"].get("namespace"):
-            return self.obj["metadata"]["namespace"]
+        if self._obj["metadata"].get("namespace"):
+            return self._obj["metadata"]["namespace"]
         else:
             return self.api.config.namespace
 
 
+class _ClassRegistry(object):
+    """
+    Indexes discovered resources by kind and plural name and memoizes the
+    classes built for them, so repeated lookups return the same class.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # api_version -> (resource list, by kind, by name)
+        self._indexes = {}
+        # (api_version, kind, endpoint, namespaced) -> class
+        self._classes = {}
+
+    def _index(self, resource_list, api_version):
+        with self._lock:
+            cached = self._indexes.get(api_version)
+            if cached is not None and cached[0] is resource_list:
+                return cached[1], cached[2]
+        by_kind, by_name = {}, {}
+        for resource in resource_list["resources"]:
+            # skip subresources such as pods/log
+            if "/" in resource["name"]:
+                continue
+            by_kind.setdefault(resource["kind"], resource)
+            by_name[resource["name"]] = resource
+            if resource.get("singularName"):
+                by_name.setdefault(resource["singularName"], resource)
+        with self._lock:
+            self._indexes[api_version] = (resource_list, by_kind, by_name)
+        return by_kind, by_name
+
+    def resources(self, api, api_version):
+        """
+        Returns the resources of ``api_version`` indexed by kind.
+        """
+        return self._index(api.resource_list(api_version), api_version)[0]
+
+    def resource(self, api, api_version, kind):
+        """
+        Returns the resource of ``kind`` (or plural name) in ``api_version``,
+        rediscovering once should the cached discovery predate it (think
+        new CRDs).
+        """
+        for attempt in range(2):
+            by_kind, by_name = self._index(api.resource_list(api_version), api_version)
+            resource = by_kind.get(kind) or by_name.get(kind)
+            if resource is not None:
+                return resource
+            if attempt == 0:
+                api.discovery.invalidate(api_version)
+        raise ValueError("{} does not serve {}".format(api_version, kind))
+
+    def get_class(self, api_version, resource):
+        key = (api_version, resource["kind"], resource["name"], resource["namespaced"])
+        with self._lock:
+            cls = self._classes.get(key)
+            if cls is None:
+                base = NamespacedAPIObject if resource["namespaced"] else APIObject
+                cls = self._classes[key] = type(str(resource["kind"]), (base,), {
+                    "version": api_version,
+                    "endpoint": resource["name"],
+                    "kind": resource["kind"],
+                })
+        return cls
+
+
+_registry = _ClassRegistry()
+
+
 def object_factory(api, api_version, kind):
     """
     Dynamically builds a Python class for the given Kubernetes object in an API.
@@ -145,19 +307,67 @@ def object_factory(api, api_version, kind):
         NetworkPolicy = pykube.object_factory(api, "networking.k8s.io/v1", "NetworkPolicy")
 
     This enables construction of any Kubernetes object kind without explicit support
-    from pykube.
+    from pykube. ``kind`` may also be the plural (``networkpolicies``) or
+    singular name of the resource. Repeated calls return the same class.
 
     Currently, the HTTPClient passed to this function will not be bound to the returned type.
     It is planned to fix this, but in the mean time pass it as you would normally.
     """
-    resource_list = api.resource_list(api_version)
-    resource = next((resource for resource in resource_list["resources"] if resource["kind"] == kind), None)
-    base = NamespacedAPIObject if resource["namespaced"] else APIObject
-    return type(kind, (base,), {
-        "version": api_version,
-        "endpoint": resource["name"],
-        "kind": kind
-    })
+    return _registry.get_class(api_version, _registry.resource(api, api_version, kind))
+
+
+def object_factory_all(api, api_version):
+    """
+    Builds the classes of every kind served by an API version with a single
+    discovery request and returns them by kind.
+
+    For example:
+
+        classes = pykube.object_factory_all(api, "networking.k8s.io/v1")
+        NetworkPolicy = classes["NetworkPolicy"]
+    """
+    return dict(
+        (kind, _registry.get_class(api_version, resource))
+        for kind, resource in _registry.resources(api, api_version).items()
+    )
+
+
+def _api_obj_class(api, api_version, kind):
+    subclasses = list(APIObject.__subclasses__())
+    while subclasses:
+        cls = subclasses.pop()
+        if getattr(cls, "version", None) == api_version and getattr(cls, "kind", None) == kind:
+            return cls
+        subclasses.extend(cls.__subclasses__())
+    return object_factory(api, api_version, kind)
+
+
+def apply(api, docs, field_manager="pykube", force=False):
+    """
+    Server-side applies manifests, one request per object. ``docs`` is an
+    iterable of manifest dicts or the path of a (multi-document) YAML file.
+    Kinds pykube does not know are resolved with ``object_factory``.
+
+    For example:
+
+        pykube.apply(api, "deploy/web.yaml", field_manager="deployer")
+
+    Returns the applied objects as the API server stored them.
+    """
+    if isinstance(docs, six.string_types):
+        with open(docs) as fp:
+            docs = list(yaml.safe_load_all(fp))
+    applied = []
+    for doc in docs:
+        if not doc:
+            continue
+        if doc.get("kind") == "List":
+            applied.extend(apply(api, doc.get("items") or [], field_manager=field_manager, force=force))
+            continue
+        obj = _api_obj_class(api, doc["apiVersion"], doc["kind"])(api, doc)
+        obj.apply(field_manager=field_manager, force=force)
+        applied.append(obj)
+    return applied
 
 
 class ConfigMap(NamespacedAPIObject):
@@ -190,8 +400,8 @@ class Deployment(NamespacedAPIObject, ReplicatedMixin, ScalableMixin):
     @property
     def ready(self):
         return (
-            self.obj["status"]["observedGeneration"] >= self.obj["metadata"]["generation"] and
-            self.obj["status"]["updatedReplicas"] == self.replicas
+            self._obj["status"]["observedGeneration"] >= self._obj["metadata"]["generation"] and
+            self._obj["status"]["updatedReplicas"] == self.replicas
         )
 
     def rollout_undo(self, target_revision=None):
@@ -217,7 +427,7 @@ class Deployment(NamespacedAPIObject, ReplicatedMixin, ScalableMixin):
             "namespace": self.namespace,
             "operation": "rollback",
         }
-        r = self.api.post(**self.api_kwargs(data=json.dumps(params), **kwargs))
+        r = self.api.post(**self.api_kwargs(data=self.api.codec.dumps(params), **kwargs))
         r.raise_for_status()
         return r.text
 
@@ -277,10 +487,11 @@ class Job(NamespacedAPIObject, ScalableMixin):
     endpoint = "jobs"
     kind = "Job"
     scalable_attr = "parallelism"
+    scale_subresource = False
 
     @property
     def parallelism(self):
-        return self.obj["spec"]["parallelism"]
+        return self._obj["spec"]["parallelism"]
 
     @parallelism.setter
     def parallelism(self, value):
@@ -302,8 +513,8 @@ class Node(APIObject):
 
     @property
     def unschedulable(self):
-        if 'unschedulable' in self.obj["spec"]:
-            return self.obj["spec"]["unschedulable"]
+        if 'unschedulable' in self._obj["spec"]:
+            return self._obj["spec"]["unschedulable"]
         return False
 
     @unschedulable.setter
@@ -326,20 +537,13 @@ class Pod(NamespacedAPIObject):
 
     @property
     def ready(self):
-        cs = self.obj["status"].get("conditions", [])
+        cs = self._obj["status"].get("conditions", [])
         condition = next((c for c in cs if c["type"] == "Ready"), None)
         return condition is not None and condition["status"] == "True"
 
-    def logs(self, container=None, pretty=None, previous=False,
-             since_seconds=None, since_time=None, timestamps=False,
-             tail_lines=None, limit_bytes=None):
-        """
-        Produces the same result as calling kubectl logs pod/<pod-name>.
-        Check parameters meaning at
-        http://kubernetes.io/docs/api-reference/v1/operations/,
-        part 'read log of the specified Pod'. The result is plain text.
-        """
-        log_call = "log"
+    def _log_params(self, container=None, pretty=None, previous=False,
+                    since_seconds=None, since_time=None, timestamps=False,
+                    tail_lines=None, limit_bytes=None, follow=False):
         params = {}
         if container is not None:
             params["container"] = container
@@ -357,7 +561,12 @@ class Pod(NamespacedAPIObject):
             params["tailLines"] = int(tail_lines)
         if limit_bytes is not None:
             params["limitBytes"] = int(limit_bytes)
+        if follow:
+            params["follow"] = "true"
+        return params
 
+    def _log(self, params, stream=False):
+        log_call = "log"
         query_string = urlencode(params)
         log_call += "?{}".format(query_string) if query_string else ""
         kwargs = {
@@ -365,9 +574,122 @@ class Pod(NamespacedAPIObject):
             "namespace": self.namespace,
             "operation": log_call,
         }
+        if stream:
+            kwargs["stream"] = True
         r = self.api.get(**self.api_kwargs(**kwargs))
         r.raise_for_status()
-        return r.text
+        return r
+
+    def logs(self, container=None, pretty=None, previous=False,
+             since_seconds=None, since_time=None, timestamps=False,
+             tail_lines=None, limit_bytes=None):
+        """
+        Produces the same result as calling kubectl logs pod/<pod-name>.
+        Check parameters meaning at
+        http://kubernetes.io/docs/api-reference/v1/operations/,
+        part 'read log of the specified Pod'. The result is plain text.
+        """
+        params = self._log_params(
+            container=container, pretty=pretty, previous=previous,
+            since_seconds=since_seconds, since_time=since_time, timestamps=timestamps,
+            tail_lines=tail_lines, limit_bytes=limit_bytes,
+        )
+        return self._log(params).text
+
+    def stream_logs(self, container=None, pretty=None, previous=False,
+                    since_seconds=None, since_time=None, timestamps=False,
+                    tail_lines=None, limit_bytes=None, follow=True, lines=True,
+                    chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Like ``logs`` but returns a generator reading the log as it arrives,
+        so memory use does not grow with the size of the log. With
+        ``follow`` the stream stays open for new output until the container
+        terminates, like kubectl logs -f.
+
+        Yields lines (text without the line break) or, with ``lines=False``,
+        chunks of at most ``chunk_size`` bytes. When following by line a
+        dropped connection is resumed using ``sinceTime`` from the timestamp
+        of the last line, skipping the lines already yielded; this is not
+        done for ``limit_bytes`` which bounds a single request.
+        """
+        reconnect = follow and lines and limit_bytes is None
+        params = self._log_params(
+            container=container, pretty=pretty, previous=previous,
+            since_seconds=since_seconds, since_time=since_time,
+            # resuming needs the timestamp of every line
+            timestamps=timestamps or reconnect,
+            tail_lines=tail_lines, limit_bytes=limit_bytes, follow=follow,
+        )
+        if not lines:
+            return self._stream_log_chunks(params, chunk_size)
+        return self._stream_log_lines(params, timestamps, reconnect, chunk_size)
+
+    def _stream_log_chunks(self, params, chunk_size):
+        r = self._log(params, stream=True)
+        try:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                yield chunk
+        finally:
+            r.close()
+
+    def _stream_log_lines(self, params, timestamps, reconnect, chunk_size):
+        last = None
+        # lines yielded with the last timestamp and, when resuming, how many
+        # of those are still to be skipped
+        repeat = skip = 0
+        resuming = False
+        while True:
+            r = self._log(params, stream=True)
+            try:
+                for line in _iter_log_lines(r, chunk_size):
+                    line = line.decode("utf-8", "replace")
+                    if not reconnect:
+                        yield line
+                        continue
+                    ts, _, text = line.partition(" ")
+                    key = log_timestamp_key(ts)
+                    if key is None:
+                        # not a line of the container, e.g. a kubelet message
+                        yield line
+                        continue
+                    if resuming:
+                        if key < last or (key == last and skip):
+                            skip -= key == last
+                            continue
+                        resuming = False
+                    if last is None or key > last:
+                        last, repeat = key, 1
+                    elif key == last:
+                        repeat += 1
+                    yield line if timestamps else text
+                return
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
+                if not reconnect:
+                    raise
+            finally:
+                r.close()
+            if last is not None:
+                # sinceTime has a resolution of seconds, so lines from the
+                # start of that second are sent again and skipped above
+                for param in ("sinceSeconds", "tailLines"):
+                    params.pop(param, None)
+                params["sinceTime"] = "{}Z".format(last[:19])
+                resuming, skip = True, repeat
+
+
+def _iter_log_lines(r, chunk_size):
+    """
+    Splits the body of ``r`` into lines at ``\\n`` only. ``iter_lines``
+    splits at ``\\r`` too, which tears progress output apart.
+    """
+    pending = b""
+    for chunk in r.iter_content(chunk_size=chunk_size):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
 
 
 class ReplicationController(NamespacedAPIObject, ReplicatedMixin, ScalableMixin):
@@ -379,8 +701,8 @@ class ReplicationController(NamespacedAPIObject, ReplicatedMixin, ScalableMixin)
     @property
     def ready(self):
         return (
-            self.obj['status']['observedGeneration'] >= self.obj['metadata']['generation'] and
-            self.obj['status']['readyReplicas'] == self.replicas
+            self._obj['status']['observedGeneration'] >= self._obj['metadata']['generation'] and
+            self._obj['status']['readyReplicas'] == self.replicas
         )
 
 
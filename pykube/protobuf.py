@@ -0,0 +1,571 @@
+"""
+Kubernetes protobuf wire format.
+
+The API server serves core types as ``application/vnd.kubernetes.protobuf``:
+the ``k8s\\x00`` magic followed by a ``runtime.Unknown`` message whose
+``raw`` field holds the object itself. Watch streams
+(``;stream=watch``) are a sequence of frames, each a 4 byte big-endian
+length followed by a ``metav1.WatchEvent`` whose object is enveloped as
+above.
+
+Objects are decoded into the same dicts the JSON API returns, using the
+schemas registered for their kind (see ``register``). Only ConfigMap,
+Secret and Namespace have schemas, as those are small and complete; Pods,
+Nodes and every other kind keep using JSON. For those three kinds protobuf
+saves bandwidth, not time: decoding here is slower than a C JSON parser.
+
+Decoding fails closed: a field missing from a schema, as a newer API
+server may send, raises UnknownFieldError instead of being dropped, which
+an update() of the object would otherwise persist. Queries then stop
+asking for protobuf for that kind and repeat the request as JSON (see
+``fall_back``).
+"""
+
+import base64
+import datetime
+import json
+import struct
+from collections import namedtuple
+
+import six
+
+
+MAGIC = b"k8s\x00"
+
+CONTENT_TYPE = "application/vnd.kubernetes.protobuf"
+
+# wire types
+VARINT = 0
+FIXED64 = 1
+LENGTH = 2
+FIXED32 = 5
+
+# field flags
+REPEATED = "repeated"
+# keep zero values; the field is a pointer or not omitempty in Go
+KEEP = "keep"
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+_UINT64 = (1 << 64) - 1
+
+
+def _varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(data, start, end):
+    """
+    Yields (number, wire type, value) for each field of the message in
+    ``data[start:end]``; length-delimited values are (start, end) offsets.
+    """
+    pos = start
+    while pos < end:
+        key, pos = _varint(data, pos)
+        wire_type = key & 7
+        if wire_type == VARINT:
+            value, pos = _varint(data, pos)
+        elif wire_type == LENGTH:
+            length, pos = _varint(data, pos)
+            value = (pos, pos + length)
+            pos += length
+        elif wire_type == FIXED64:
+            value = (pos, pos + 8)
+            pos += 8
+        elif wire_type == FIXED32:
+            value = (pos, pos + 4)
+            pos += 4
+        else:
+            raise ValueError("unsupported protobuf wire type {}".format(wire_type))
+        yield key >> 3, wire_type, value
+
+
+def _encode_varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _encode_field(number, wire_type, payload):
+    key = _encode_varint(number << 3 | wire_type)
+    if wire_type == VARINT:
+        return key + _encode_varint(payload)
+    return key + _encode_varint(len(payload)) + payload
+
+
+def _as_bytes(data):
+    # indexing must give ints, which bytes only does on Python 3
+    if six.PY2 and not isinstance(data, bytearray):
+        return bytearray(data)
+    return data
+
+
+class String(object):
+
+    wire_type = LENGTH
+
+    def decode(self, data, value):
+        return data[value[0]:value[1]].decode("utf-8")
+
+    def encode(self, value):
+        return value.encode("utf-8")
+
+
+class Bytes(object):
+    """
+    Binary data, base64 encoded as in JSON.
+    """
+
+    wire_type = LENGTH
+
+    def decode(self, data, value):
+        return base64.b64encode(bytes(data[value[0]:value[1]])).decode("ascii")
+
+    def encode(self, value):
+        return base64.b64decode(value)
+
+
+class Int(object):
+    """
+    int32 and int64, both sign extended to 64 bits on the wire.
+    """
+
+    wire_type = VARINT
+
+    def decode(self, data, value):
+        return value - (1 << 64) if value >> 63 else value
+
+    def encode(self, value):
+        return value & _UINT64
+
+
+class Bool(object):
+
+    wire_type = VARINT
+
+    def decode(self, data, value):
+        return bool(value)
+
+    def encode(self, value):
+        return int(value)
+
+
+class FieldsV1(object):
+    """
+    metav1.FieldsV1, a JSON document sent as raw bytes.
+    """
+
+    wire_type = LENGTH
+
+    def decode(self, data, value):
+        for number, wire_type, v in _iter_fields(data, value[0], value[1]):
+            if number == 1:
+                return json.loads(bytes(data[v[0]:v[1]]).decode("utf-8"))
+        return None
+
+    def encode(self, value):
+        return _encode_field(1, LENGTH, json.dumps(value, separators=(",", ":"), sort_keys=True).encode("utf-8"))
+
+
+class Time(object):
+    """
+    metav1.Time, seconds and nanos since the epoch, as an RFC 3339 string.
+    """
+
+    wire_type = LENGTH
+
+    def decode(self, data, value):
+        seconds = None
+        for number, wire_type, v in _iter_fields(data, value[0], value[1]):
+            if number == 1:
+                seconds = v - (1 << 64) if v >> 63 else v
+        if seconds is None:
+            return None
+        return (EPOCH + datetime.timedelta(seconds=seconds)).strftime(TIME_FORMAT)
+
+    def encode(self, value):
+        delta = datetime.datetime.strptime(value, TIME_FORMAT) - EPOCH
+        return _encode_field(1, VARINT, (delta.days * 86400 + delta.seconds) & _UINT64)
+
+
+class Map(object):
+    """
+    A map of strings to ``value_type``, sent as repeated key/value entries.
+    """
+
+    wire_type = LENGTH
+
+    def __init__(self, value_type):
+        self.key_type = String()
+        self.value_type = value_type
+
+    def decode(self, data, value):
+        key = ""
+        item = self.value_type.decode(data, (0, 0)) if self.value_type.wire_type == LENGTH else 0
+        for number, wire_type, v in _iter_fields(data, value[0], value[1]):
+            if number == 1:
+                key = self.key_type.decode(data, v)
+            elif number == 2:
+                item = self.value_type.decode(data, v)
+        return key, item
+
+    def encode(self, value):
+        key, item = value
+        return (
+            _encode_field(1, LENGTH, self.key_type.encode(key)) +
+            _encode_field(2, self.value_type.wire_type, self.value_type.encode(item))
+        )
+
+
+Field = namedtuple("Field", "number name type repeated keep")
+
+
+class UnknownFieldError(ValueError):
+    """
+    A message holds a field its schema does not know, which decoding would
+    lose.
+    """
+
+
+class Message(object):
+    """
+    Schema of a message: ``(number, name, type, *flags)`` per field.
+    """
+
+    wire_type = LENGTH
+
+    def __init__(self, *fields):
+        self.fields = {}
+        for spec in fields:
+            number, name, type_ = spec[:3]
+            flags = spec[3:]
+            self.fields[number] = Field(
+                number, name, type_,
+                REPEATED in flags, KEEP in flags,
+            )
+        # fields by their wire key, so fields sent with an unexpected wire
+        # type are refused like unknown ones
+        self._keys = dict((f.number << 3 | f.type.wire_type, f) for f in self.fields.values())
+        # Go marshals empty values JSON leaves out (omitempty)
+        self._omit_empty = [f.name for f in self.fields.values() if not f.keep]
+
+    def decode(self, data, value):
+        # the hot loop of list decoding, so _iter_fields is inlined here
+        obj = {}
+        keys = self._keys
+        pos, end = value
+        while pos < end:
+            key = data[pos]
+            if key < 0x80:
+                pos += 1
+            else:
+                key, pos = _varint(data, pos)
+            wire_type = key & 7
+            if wire_type == LENGTH:
+                length = data[pos]
+                if length < 0x80:
+                    pos += 1
+                else:
+                    length, pos = _varint(data, pos)
+                v = (pos, pos + length)
+                pos += length
+            elif wire_type == VARINT:
+                v, pos = _varint(data, pos)
+            field = keys.get(key)
+            if field is None:
+                # no schema field has a fixed width wire type either
+                raise UnknownFieldError("unknown field {} (wire type {}) in {}".format(
+                    key >> 3, wire_type, ", ".join(sorted(f.name for f in self.fields.values()))))
+            item = field.type.decode(data, v)
+            if field.repeated:
+                obj.setdefault(field.name, []).append(item)
+            elif field.type.__class__ is Map:
+                obj.setdefault(field.name, {})[item[0]] = item[1]
+            else:
+                obj[field.name] = item
+        for name in self._omit_empty:
+            if name in obj and not obj[name]:
+                del obj[name]
+        return obj
+
+    def encode(self, obj):
+        out = []
+        for number in sorted(self.fields):
+            field = self.fields[number]
+            value = obj.get(field.name)
+            if value is None:
+                # zero times are sent as empty messages and decode to null
+                if field.keep and isinstance(field.type, Time):
+                    out.append(_encode_field(number, LENGTH, b""))
+                continue
+            if isinstance(field.type, Map):
+                items = [(key, value[key]) for key in sorted(value)]
+            elif field.repeated:
+                items = value
+            else:
+                items = [value]
+            for item in items:
+                out.append(_encode_field(number, field.type.wire_type, field.type.encode(item)))
+        return b"".join(out)
+
+
+string = String()
+binary = Bytes()
+integer = Int()
+boolean = Bool()
+time = Time()
+fields_v1 = FieldsV1()
+
+TypeMeta = Message(
+    (1, "apiVersion", string),
+    (2, "kind", string),
+)
+
+ListMeta = Message(
+    (1, "selfLink", string),
+    (2, "resourceVersion", string),
+    (3, "continue", string),
+    (4, "remainingItemCount", integer, KEEP),
+)
+
+OwnerReference = Message(
+    (1, "kind", string),
+    (3, "name", string),
+    (4, "uid", string),
+    (5, "apiVersion", string),
+    (6, "controller", boolean, KEEP),
+    (7, "blockOwnerDeletion", boolean, KEEP),
+)
+
+ManagedFieldsEntry = Message(
+    (1, "manager", string),
+    (2, "operation", string),
+    (3, "apiVersion", string),
+    (4, "time", time),
+    (6, "fieldsType", string),
+    (7, "fieldsV1", fields_v1),
+    (8, "subresource", string),
+)
+
+ObjectMeta = Message(
+    (1, "name", string),
+    (2, "generateName", string),
+    (3, "namespace", string),
+    (4, "selfLink", string),
+    (5, "uid", string),
+    (6, "resourceVersion", string),
+    (7, "generation", integer),
+    (8, "creationTimestamp", time),
+    (9, "deletionTimestamp", time),
+    (10, "deletionGracePeriodSeconds", integer, KEEP),
+    (11, "labels", Map(string)),
+    (12, "annotations", Map(string)),
+    (13, "ownerReferences", OwnerReference, REPEATED),
+    (14, "finalizers", string, REPEATED),
+    (15, "clusterName", string),
+    (17, "managedFields", ManagedFieldsEntry, REPEATED),
+)
+
+StatusDetails = Message(
+    (1, "name", string),
+    (2, "group", string),
+    (3, "kind", string),
+    (4, "causes", Message(
+        (1, "reason", string),
+        (2, "message", string),
+        (3, "field", string),
+    ), REPEATED),
+    (5, "retryAfterSeconds", integer),
+    (6, "uid", string),
+)
+
+Status = Message(
+    (1, "metadata", ListMeta),
+    (2, "status", string),
+    (3, "message", string),
+    (4, "reason", string),
+    (5, "details", StatusDetails),
+    (6, "code", integer),
+)
+
+Namespace = Message(
+    (1, "metadata", ObjectMeta, KEEP),
+    (2, "spec", Message(
+        (1, "finalizers", string, REPEATED),
+    ), KEEP),
+    (3, "status", Message(
+        (1, "phase", string),
+        (2, "conditions", Message(
+            (1, "type", string),
+            (2, "status", string),
+            (4, "lastTransitionTime", time, KEEP),
+            (5, "reason", string),
+            (6, "message", string),
+        ), REPEATED),
+    ), KEEP),
+)
+
+ConfigMap = Message(
+    (1, "metadata", ObjectMeta, KEEP),
+    (2, "data", Map(string)),
+    (3, "binaryData", Map(binary)),
+    (4, "immutable", boolean, KEEP),
+)
+
+Secret = Message(
+    (1, "metadata", ObjectMeta, KEEP),
+    (2, "data", Map(binary)),
+    (3, "type", string),
+    (4, "stringData", Map(string)),
+    (5, "immutable", boolean, KEEP),
+)
+
+_schemas = {}
+
+# kinds whose schema turned out to lack fields (see fall_back)
+_fallen_back = set()
+
+
+def register(api_version, kind, message):
+    """
+    Registers the schema of ``kind`` (and of its list) so it is requested
+    and decoded as protobuf. The schema must list every field of the kind.
+    """
+    _schemas[(api_version, kind)] = message
+    _schemas[(api_version, "{}List".format(kind))] = Message(
+        (1, "metadata", ListMeta, KEEP),
+        (2, "items", message, REPEATED),
+    )
+
+
+register("v1", "Namespace", Namespace)
+register("v1", "ConfigMap", ConfigMap)
+register("v1", "Secret", Secret)
+_schemas[("v1", "Status")] = Status
+
+
+def supports(api_obj_class):
+    """
+    Returns whether objects of ``api_obj_class`` are requested as protobuf.
+    """
+    key = (api_obj_class.version, api_obj_class.kind)
+    return key in _schemas and key not in _fallen_back
+
+
+def fall_back(api_obj_class):
+    """
+    Stops requesting objects of ``api_obj_class`` as protobuf, for the rest
+    of the process, after decoding one raised UnknownFieldError.
+    """
+    _fallen_back.add((api_obj_class.version, api_obj_class.kind))
+
+
+def accept(watch=False):
+    """
+    Returns the Accept header asking for protobuf and, should the server
+    not serve the kind as protobuf, JSON.
+    """
+    if watch:
+        return "{};stream=watch, application/json".format(CONTENT_TYPE)
+    return "{}, application/json".format(CONTENT_TYPE)
+
+
+def is_protobuf(content_type):
+    return bool(content_type) and content_type.split(";")[0].strip() == CONTENT_TYPE
+
+
+def _loads(data, start, end):
+    if data[start:start + 4] != MAGIC:
+        raise ValueError("not a Kubernetes protobuf payload")
+    type_meta = {}
+    raw = (0, 0)
+    for number, wire_type, value in _iter_fields(data, start + 4, end):
+        if number == 1 and wire_type == LENGTH:
+            type_meta = TypeMeta.decode(data, value)
+        elif number == 2 and wire_type == LENGTH:
+            raw = value
+        elif number == 3 and wire_type == LENGTH and value[1] > value[0]:
+            raise ValueError("unsupported content encoding {}".format(string.decode(data, value)))
+    api_version, kind = type_meta.get("apiVersion", ""), type_meta.get("kind", "")
+    schema = _schemas.get((api_version, kind))
+    if schema is None:
+        raise ValueError("no protobuf schema registered for {} {}".format(api_version, kind))
+    obj = schema.decode(data, raw)
+    obj["apiVersion"] = api_version
+    obj["kind"] = kind
+    return obj
+
+
+def loads(data):
+    """
+    Decodes an enveloped (``k8s\\x00``) object into a dict.
+    """
+    data = _as_bytes(data)
+    return _loads(data, 0, len(data))
+
+
+def dumps(obj):
+    """
+    Encodes an object (a dict with ``apiVersion`` and ``kind``) into an
+    enveloped payload as the API server sends it.
+    """
+    schema = _schemas[(obj["apiVersion"], obj["kind"])]
+    type_meta = TypeMeta.encode(obj)
+    return MAGIC + _encode_field(1, LENGTH, type_meta) + _encode_field(2, LENGTH, schema.encode(obj))
+
+
+def iter_frames(chunks):
+    """
+    Splits a watch stream, given as an iterable of byte chunks, into frames.
+    """
+    buf = b""
+    for chunk in chunks:
+        buf += chunk
+        while len(buf) >= 4:
+            length = struct.unpack(">I", buf[:4])[0]
+            if len(buf) < 4 + length:
+                break
+            yield buf[4:4 + length]
+            buf = buf[4 + length:]
+    if buf:
+        raise ValueError("watch stream ended in the middle of a frame")
+
+
+def loads_event(frame):
+    """
+    Decodes a watch frame into a ``{"type": ..., "object": ...}`` dict.
+    """
+    data = _as_bytes(frame)
+    start = 4 if data[:4] == MAGIC else 0
+    event = {"type": "", "object": None}
+    for number, wire_type, value in _iter_fields(data, start, len(data)):
+        if number == 1 and wire_type == LENGTH:
+            event["type"] = string.decode(data, value)
+        elif number == 2 and wire_type == LENGTH:
+            # runtime.RawExtension holding the enveloped object
+            for n, w, raw in _iter_fields(data, value[0], value[1]):
+                if n == 1 and w == LENGTH:
+                    event["object"] = _loads(data, raw[0], raw[1])
+    return event
+
+
+def dumps_event(event_type, obj):
+    """
+    Encodes a watch event into a length-prefixed frame.
+    """
+    raw = _encode_field(1, LENGTH, dumps(obj))
+    frame = _encode_field(1, LENGTH, event_type.encode("utf-8")) + _encode_field(2, LENGTH, raw)
+    return struct.pack(">I", len(frame)) + frame
@@ -1,17 +1,29 @@
-import json
-
+import socket
+import time
 from collections import namedtuple
 
+import requests.exceptions
 from six import string_types
+from six.moves import http_client
 from six.moves.urllib.parse import urlencode
 
-from .exceptions import ObjectDoesNotExist
+from . import protobuf
+from .exceptions import HTTPError, ObjectDoesNotExist
+from .ratelimit import DEFAULT_RETRY
+from .tracing import traced
+from .utils import StreamingList
 
 
 all_ = object()
 everything = object()
 now = object()
 
+DEFAULT_PAGE_SIZE = 500
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+WatchEvent = namedtuple("WatchEvent", "type object")
+
 
 class BaseQuery(object):
 
@@ -53,10 +65,18 @@ class BaseQuery(object):
         query_string = urlencode(params)
         return "{}{}".format(self.api_obj_class.endpoint, "?{}".format(query_string) if query_string else "")
 
+    def _get_kwargs(self, params=None):
+        kwargs = {"url": self._build_api_url(params=params)}
+        if self.api_obj_class.base:
+            kwargs["base"] = self.api_obj_class.base
+        if self.api_obj_class.version:
+            kwargs["version"] = self.api_obj_class.version
+        if self.namespace is not None and self.namespace is not all_:
+            kwargs["namespace"] = self.namespace
+        self._negotiate(kwargs)
+        return kwargs
 
-class Query(BaseQuery):
-
-    def get_by_name(self, name):
+    def _get_by_name_kwargs(self, name):
         kwargs = {
             "url": "{}/{}".format(self.api_obj_class.endpoint, name),
             "namespace": self.namespace,
@@ -65,13 +85,45 @@ class Query(BaseQuery):
             kwargs["base"] = self.api_obj_class.base
         if self.api_obj_class.version:
             kwargs["version"] = self.api_obj_class.version
-        r = self.api.get(**kwargs)
+        self._negotiate(kwargs)
+        return kwargs
+
+    def _negotiate(self, kwargs, watch=False):
+        # protobuf is only asked for when the kind can be decoded from it;
+        # the server still answers in JSON for kinds it can't serve that way
+        if self.api.content_type == "protobuf" and protobuf.supports(self.api_obj_class):
+            kwargs["headers"] = {"Accept": protobuf.accept(watch=watch)}
+
+    def _decode(self, r, refetch):
+        """
+        Decodes ``r``. Should it be protobuf holding a field the schema of
+        the kind lacks, protobuf is given up for the kind and the response
+        fetched again, now as JSON, with ``refetch``.
+        """
+        try:
+            return self.api.decode(r)
+        except protobuf.UnknownFieldError:
+            protobuf.fall_back(self.api_obj_class)
+            return self.api.decode(refetch())
+
+
+class Query(BaseQuery):
+
+    @traced("Query.get_by_name")
+    def get_by_name(self, name):
+        r = self.api.get(**self._get_by_name_kwargs(name))
         if not r.ok:
             if r.status_code == 404:
                 raise ObjectDoesNotExist("{} does not exist.".format(name))
             self.api.raise_for_status(r)
-        return self.api_obj_class(self.api, r.json())
 
+        def refetch():
+            r = self.api.get(**self._get_by_name_kwargs(name))
+            self.api.raise_for_status(r)
+            return r
+        return self.api_obj_class(self.api, self._decode(r, refetch))
+
+    @traced("Query.get")
     def get(self, *args, **kwargs):
         if "name" in kwargs:
             return self.get_by_name(kwargs["name"])
@@ -89,39 +141,152 @@ class Query(BaseQuery):
         except ObjectDoesNotExist:
             return None
 
-    def watch(self, since=None):
+    def watch(self, since=None, timeout_seconds=None, reconnect=True, known=None):
         query = self._clone(WatchQuery)
+        query.timeout_seconds = timeout_seconds
+        query.reconnect = reconnect
+        query.known = known
         if since is now:
             query.resource_version = self.response["metadata"]["resourceVersion"]
         elif since is not None:
             query.resource_version = since
         return query
 
-    def execute(self):
-        kwargs = {"url": self._build_api_url()}
-        if self.api_obj_class.base:
-            kwargs["base"] = self.api_obj_class.base
-        if self.api_obj_class.version:
-            kwargs["version"] = self.api_obj_class.version
-        if self.namespace is not None and self.namespace is not all_:
-            kwargs["namespace"] = self.namespace
-        r = self.api.get(**kwargs)
-        r.raise_for_status()
+    def _get(self, params=None, stream=False):
+        kwargs = self._get_kwargs(params=params)
+        if stream:
+            kwargs["stream"] = True
+        return self.api.get(**kwargs)
+
+    def _page_items(self, r):
+        # a page is bounded by its limit, so with a codec faster than the
+        # incremental decoder it pays to decode it in one go
+        if self.api.codec.prefer_streaming and not _is_protobuf(r):
+            return self._stream_items(r)
+        return self._decode_items(r)
+
+    def _decode_items(self, r):
+        """
+        Returns the items and the list metadata of a list response.
+        """
+        response = self.api.decode(r)
+        return response.get("items") or [], response.get("metadata") or {}
+
+    def _stream_items(self, r):
+        """
+        Returns an iterator decoding the items of a list response as they
+        arrive, instead of parsing the whole body first, and the dict the
+        list metadata is put in once all items were read.
+        """
+        metadata = {}
+
+        def items():
+            objs = StreamingList(r.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+            try:
+                for obj in objs:
+                    yield obj
+            finally:
+                r.close()
+            metadata.update(objs.envelope.get("metadata") or {})
+        return items(), metadata
+
+    @traced("Query.execute")
+    def execute(self, params=None):
+        r = self._get(params=params)
+        self.api.raise_for_status(r)
         return r
 
-    def iterator(self):
+    @traced("Query.iterator")
+    def iterator(self, page_size=DEFAULT_PAGE_SIZE):
         """
         Execute the API request and return an iterator over the objects. This
-        method does not use the query cache.
+        method does not use the query cache. Objects are decoded and yielded
+        as the response arrives.
+
+        Objects are fetched in pages of ``page_size`` (see ``paginate``). Pass
+        ``page_size=None`` to fetch the whole collection in one request.
         """
-        for obj in (self.execute().json().get("items") or []):
+        if page_size is not None:
+            for obj in self.paginate(page_size=page_size):
+                yield obj
+            return
+        r = self._get(stream=True)
+        self.api.raise_for_status(r)
+        try:
+            items, _ = self._decode_items(r) if _is_protobuf(r) else self._stream_items(r)
+        except protobuf.UnknownFieldError:
+            # see _decode
+            protobuf.fall_back(self.api_obj_class)
+            for obj in self.iterator(page_size=None):
+                yield obj
+            return
+        for obj in items:
             yield self.api_obj_class(self.api, obj)
 
+    @traced("Query.paginate")
+    def paginate(self, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Execute the API request in chunks of at most ``page_size`` objects
+        using the ``limit`` and ``continue`` parameters and return an iterator
+        over the objects. Only a single page is held in memory at a time.
+
+        If the continue token expires while iterating (410 Gone) the listing
+        carries on from the token the API server hands back or, failing that,
+        is restarted skipping every object that was already yielded.
+        """
+        for obj in self._paginate(page_size):
+            yield self.api_obj_class(self.api, obj)
+
+    def _paginate(self, page_size, list_metadata=None):
+        """
+        Yields the objects of the listing page by page. The metadata of each
+        page is put in ``list_metadata``, if given, once it was read, so
+        after the last page it holds the resourceVersion of the listing.
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be a positive integer")
+        token = None
+        last_key = None
+        resume_after = None
+        while True:
+            params = {"limit": page_size}
+            if token:
+                params["continue"] = token
+            r = self._get(params=params, stream=True)
+            if r.status_code == http_client.GONE and token:
+                token = _expired_continue_token(self.api, r)
+                if token is None:
+                    resume_after = last_key
+                continue
+            self.api.raise_for_status(r)
+            try:
+                items, metadata = self._page_items(r)
+            except protobuf.UnknownFieldError:
+                # see _decode; the page is fetched again as JSON
+                protobuf.fall_back(self.api_obj_class)
+                continue
+            for obj in items:
+                key = _storage_key(obj)
+                # the API server lists in storage key order; after a relist
+                # anything up to the last key handed out was already seen
+                if resume_after is not None:
+                    if key <= resume_after:
+                        continue
+                    resume_after = None
+                last_key = key
+                yield obj
+            if list_metadata is not None:
+                list_metadata.clear()
+                list_metadata.update(metadata)
+            token = metadata.get("continue")
+            if not token:
+                break
+
     @property
     def query_cache(self):
         if not hasattr(self, "_query_cache"):
             cache = {"objects": []}
-            cache["response"] = self.execute().json()
+            cache["response"] = self._decode(self.execute(), self.execute)
             for obj in (cache["response"].get("items") or []):
                 cache["objects"].append(self.api_obj_class(self.api, obj))
             self._query_cache = cache
@@ -139,34 +304,241 @@ class Query(BaseQuery):
 
 
 class WatchQuery(BaseQuery):
+    """
+    Streams changes to the objects matched by the query.
+
+    The watch remembers the resourceVersion of the last event it saw
+    (bookmark events included) and, unless ``reconnect`` is false,
+    transparently reconnects from there whenever the API server closes the
+    stream, backing off as the client's ``retry`` does while the connection
+    keeps failing. Should that version be too old (410 Gone) the collection
+    is listed again, every object yielded as an ``ADDED`` event and every
+    known object that is no longer listed as a ``DELETED`` one, and the
+    watch resumes from the version of that list.
+
+    The known objects are those the watch saw, unless the caller keeps them
+    already: ``known`` then gives them by ``namespace/name`` through
+    ``keys()`` and ``get(key)`` (a dict or a cache.ObjectStore). Without
+    ``reconnect`` nothing is kept.
+    """
 
     def __init__(self, *args, **kwargs):
         self.resource_version = kwargs.pop("resource_version", None)
+        self.timeout_seconds = kwargs.pop("timeout_seconds", None)
+        self.reconnect = kwargs.pop("reconnect", True)
+        self.allow_bookmarks = kwargs.pop("allow_bookmarks", True)
+        self.known = kwargs.pop("known", None)
         super(WatchQuery, self).__init__(*args, **kwargs)
+        # the watch request being read, for close()
+        self._response = None
+        self._closed = False
 
-    def object_stream(self):
+    def _clone(self, cls=None):
+        clone = super(WatchQuery, self)._clone(cls)
+        if isinstance(clone, WatchQuery):
+            clone.resource_version = self.resource_version
+            clone.timeout_seconds = self.timeout_seconds
+            clone.reconnect = self.reconnect
+            clone.allow_bookmarks = self.allow_bookmarks
+            clone.known = self.known
+        return clone
+
+    def _watch_kwargs(self):
         params = {"watch": "true"}
         if self.resource_version is not None:
             params["resourceVersion"] = self.resource_version
+        if self.allow_bookmarks:
+            params["allowWatchBookmarks"] = "true"
+        if self.timeout_seconds is not None:
+            params["timeoutSeconds"] = int(self.timeout_seconds)
         kwargs = {
             "url": self._build_api_url(params=params),
             "stream": True,
         }
         if self.namespace is not all_:
             kwargs["namespace"] = self.namespace
+        if self.api_obj_class.base:
+            kwargs["base"] = self.api_obj_class.base
         if self.api_obj_class.version:
             kwargs["version"] = self.api_obj_class.version
-        r = self.api.get(**kwargs)
-        self.api.raise_for_status(r)
-        WatchEvent = namedtuple("WatchEvent", "type object")
+        self._negotiate(kwargs, watch=True)
+        return kwargs
+
+    def _watch(self):
+        return self.api.get(**self._watch_kwargs())
+
+    def _decode_event(self, line):
+        """
+        Decodes one line of the watch stream and tracks its resourceVersion.
+        Returns None for bookmarks and raises HTTPError for error events.
+        """
+        return self._event(self.api.codec.loads(line))
+
+    def _decode_events(self, r):
+        if _is_protobuf(r):
+            for frame in protobuf.iter_frames(r.iter_content(chunk_size=None)):
+                yield self._event(protobuf.loads_event(frame))
+            return
         for line in r.iter_lines():
-            we = json.loads(line.decode("utf-8"))
-            yield WatchEvent(type=we["type"], object=self.api_obj_class(self.api, we["object"]))
+            if line:
+                yield self._decode_event(line)
+
+    def _event(self, we):
+        if we["type"] == "ERROR":
+            status = we["object"]
+            raise HTTPError(status.get("code"), status.get("message"))
+        resource_version = we["object"].get("metadata", {}).get("resourceVersion")
+        if resource_version:
+            self.resource_version = resource_version
+        if we["type"] == "BOOKMARK":
+            return None
+        return WatchEvent(type=we["type"], object=self.api_obj_class(self.api, we["object"]))
+
+    def _relist(self, known):
+        """
+        Lists the collection again, yielding ``ADDED`` for every object and
+        then ``DELETED`` for the ``known`` objects that are gone.
+        """
+        metadata = {}
+        listed = set()
+        for obj in self._clone(Query)._paginate(DEFAULT_PAGE_SIZE, metadata):
+            listed.add(_storage_key(obj))
+            yield WatchEvent(type="ADDED", object=self.api_obj_class(self.api, obj))
+        self.resource_version = metadata.get("resourceVersion")
+        # deleted while the watch was behind; their last state is all we have
+        for key in [key for key in known.keys() if key not in listed]:
+            yield WatchEvent(type="DELETED", object=known.get(key))
+
+    def _seen(self, seen, event):
+        """
+        Tracks in ``seen``, unless None, the last state of the objects
+        ``event`` leaves in existence.
+        """
+        if seen is not None:
+            key = _storage_key(event.object._obj)
+            if event.type == "DELETED":
+                seen.pop(key, None)
+            else:
+                seen[key] = event.object
+        return event
+
+    def _tracking(self):
+        """
+        Returns the dict the watch keeps the objects it saw in, or None when
+        they are not needed or the caller keeps them.
+        """
+        if self.reconnect and self.known is None:
+            return {}
+        return None
+
+    def _reconnect_delay(self, failures):
+        retry = getattr(self.api, "retry", None) or DEFAULT_RETRY
+        return retry.delay(failures - 1)
+
+    @traced("WatchQuery.object_stream")
+    def object_stream(self):
+        seen = self._tracking()
+        failures = 0
+        while not self._closed:
+            expired = refused = False
+            r = self._response = self._watch()
+            if self._closed:
+                # closed while connecting
+                r.close()
+            try:
+                if r.status_code == http_client.GONE:
+                    expired = True
+                else:
+                    self.api.raise_for_status(r)
+                    for event in self._decode_events(r):
+                        failures = 0
+                        if event is not None:
+                            yield self._seen(seen, event)
+            except HTTPError as e:
+                if e.code != http_client.GONE:
+                    raise
+                expired = True
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError):
+                if not self.reconnect and not self._closed:
+                    raise
+                failures += 1
+            except protobuf.UnknownFieldError:
+                # see _decode; the watch goes on as JSON from the last event
+                protobuf.fall_back(self.api_obj_class)
+                refused = True
+            except Exception:
+                # reading a response closed by close() may fail in other ways
+                if not self._closed:
+                    raise
+            finally:
+                self._response = None
+                r.close()
+            if self._closed:
+                break
+            if refused:
+                continue
+            if expired:
+                if not self.reconnect:
+                    raise HTTPError(http_client.GONE, "resource version {} is too old".format(self.resource_version))
+                for event in self._relist(seen if self.known is None else self.known):
+                    yield self._seen(seen, event)
+            elif not self.reconnect:
+                break
+            elif failures:
+                time.sleep(self._reconnect_delay(failures))
+
+    def close(self):
+        """
+        Stops the watch from any thread: the request being read is closed
+        and the stream ends instead of reconnecting.
+        """
+        self._closed = True
+        r = self._response
+        if r is not None:
+            _abort(r)
 
     def __iter__(self):
         return iter(self.object_stream())
 
 
+def _storage_key(obj):
+    metadata = obj.get("metadata") or {}
+    if metadata.get("namespace"):
+        return "{}/{}".format(metadata["namespace"], metadata.get("name", ""))
+    return metadata.get("name", "")
+
+
+def _abort(response):
+    """
+    Closes ``response`` such that a thread blocked reading it wakes up,
+    which closing the socket alone does not do.
+    """
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, socket.error):
+            pass
+    response.close()
+
+
+def _is_protobuf(response):
+    return protobuf.is_protobuf(response.headers.get("content-type"))
+
+
+def _expired_continue_token(api, response):
+    """
+    Returns the continue token carried by a 410 response for an expired
+    continue token (if the API server provides one) so the list can go on
+    with what is left; otherwise returns None to restart the list.
+    """
+    try:
+        payload = api.decode(response)
+    except ValueError:
+        return None
+    return (payload.get("metadata") or {}).get("continue") or None
+
+
 def as_selector(value):
     if isinstance(value, string_types):
         return value
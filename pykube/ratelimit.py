@@ -0,0 +1,173 @@
+"""
+Client-side rate limiting and retrying of API requests.
+"""
+
+import email.utils
+import random
+import threading
+import time
+
+
+# time.monotonic is Python 3 only
+monotonic = getattr(time, "monotonic", time.time)
+
+# methods that may be sent again after the connection broke or the server
+# failed, as the first attempt could have been applied
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+TOO_MANY_REQUESTS = 429
+
+
+class TokenBucket(object):
+    """
+    Allows ``qps`` requests per second on average and bursts of up to
+    ``burst`` requests. Thread-safe.
+    """
+
+    def __init__(self, qps, burst=None):
+        if qps <= 0:
+            raise ValueError("qps must be positive")
+        self.qps = float(qps)
+        self.burst = burst if burst is not None else max(1, int(qps))
+        self._tokens = float(self.burst)
+        self._last = monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token and returns the seconds to wait before using it.
+        Tokens are handed out in order, so waiting callers are served first
+        come, first served at a steady rate.
+        """
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.qps)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.qps
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RateLimiter(object):
+    """
+    Token bucket rate limiter for a client and, optionally, for each verb.
+
+    For example, 20 requests per second overall (bursts of 40) of which
+    at most 5 per second may be writes:
+
+        limiter = RateLimiter(qps=20, burst=40, verbs={
+            "POST": (5, 5), "PUT": (5, 5), "PATCH": (5, 5), "DELETE": (5, 5),
+        })
+        api = pykube.HTTPClient(config, rate_limiter=limiter)
+    """
+
+    def __init__(self, qps=None, burst=None, verbs=None):
+        """
+        :Parameters:
+           - `qps`: Requests per second of the client, None for no limit
+           - `burst`: Requests allowed at once; defaults to `qps`
+           - `verbs`: Mapping of HTTP methods to their own (qps, burst)
+        """
+        self.bucket = TokenBucket(qps, burst) if qps is not None else None
+        self.verbs = dict(
+            (verb.upper(), TokenBucket(*limit))
+            for verb, limit in (verbs or {}).items()
+        )
+
+    def reserve(self, method):
+        """
+        Takes a token for a ``method`` request and returns the seconds to wait
+        before sending it.
+        """
+        wait = 0.0
+        if self.bucket is not None:
+            wait = self.bucket.reserve()
+        bucket = self.verbs.get(method.upper())
+        if bucket is not None:
+            wait = max(wait, bucket.reserve())
+        return wait
+
+    def acquire(self, method):
+        wait = self.reserve(method)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Retry(object):
+    """
+    When to retry a request and how long to wait before doing so.
+
+    Responses with a status in ``statuses`` (by default 429 Too Many
+    Requests, as sent by API priority and fairness, and 503 Service
+    Unavailable) are retried. A 429 was turned away before being processed,
+    so it is retried for every method; other statuses, like broken
+    connections, only for idempotent methods unless the response asks for
+    a retry with Retry-After. The wait honors Retry-After and otherwise
+    backs off exponentially with full jitter so throttled clients spread
+    out instead of retrying in lockstep.
+    """
+
+    def __init__(self, max_retries=5, backoff=0.5, max_backoff=30, statuses=(429, 503)):
+        """
+        :Parameters:
+           - `max_retries`: Retries of a request before giving up
+           - `backoff`: Seconds the first backoff is at most
+           - `max_backoff`: Seconds any wait is at most
+           - `statuses`: Response status codes to retry
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+
+    def retry_status(self, method, status, attempt, retry_after=None):
+        """
+        Returns whether a response with ``status`` (and the Retry-After
+        header ``retry_after``, if any) to ``method`` is retried.
+        """
+        if attempt >= self.max_retries or status not in self.statuses:
+            return False
+        # a 503 may come from a server that began processing the request
+        if status == TOO_MANY_REQUESTS or retry_after:
+            return True
+        return method.upper() in IDEMPOTENT_METHODS
+
+    def retry_error(self, method, attempt):
+        return attempt < self.max_retries and method.upper() in IDEMPOTENT_METHODS
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Returns the seconds to wait before retry number ``attempt`` (from 0)
+        given the Retry-After header of the response, if any.
+        """
+        seconds = parse_retry_after(retry_after)
+        if seconds is not None:
+            # a little jitter still, so clients told the same don't collide
+            return min(self.max_backoff, seconds + random.uniform(0, self.backoff))
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    """
+    Returns the seconds of a Retry-After header (delay-seconds or an HTTP
+    date) or None if there is none.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+
+
+DEFAULT_RETRY = Retry()
@@ -1,15 +1,26 @@
 import logging
 import math
-import time
+import threading
 
+from .cache import Informer
 from .objects import Pod
 from .exceptions import KubernetesError
+from .tracing import traced
 
 
 logger = logging.getLogger(__name__)
 
 
 class RollingUpdater(object):
+    """
+    Replaces the pods of one ReplicationController with those of another
+    like kubectl rolling-update.
+
+    Readiness of the pods of both controllers is followed with informers,
+    so each scaling step happens as soon as pods become ready rather than
+    on a fixed schedule. ``update_period`` is the longest the updater waits
+    for a change before looking at the counts again.
+    """
 
     def __init__(self, api, old_rc, new_rc, **kwargs):
         self.api = api
@@ -18,7 +29,11 @@ class RollingUpdater(object):
         self.update_period = kwargs.get("update_period", 10)
         self.max_unavailable = kwargs.get("max_unavailable", 0)
         self.max_surge = kwargs.get("max_surge", 1)
+        self._informers = {}
+        self._changed = threading.Condition()
+        self._changes = 0
 
+    @traced("RollingUpdater.update", attributes=lambda updater: updater.span_attributes())
     def update(self):
         desired = self.new_rc.replicas
         original = self.old_rc.replicas
@@ -60,24 +75,38 @@ class RollingUpdater(object):
             ),
         )
 
-        while new_rc.replicas != desired or old_rc.replicas != 0:
-            scaled_rc = self.scale_up(
-                new_rc, old_rc,
-                original, desired,
-                max_surge, max_unavailable,
-            )
-            new_rc = scaled_rc
-            time.sleep(self.update_period)
-            scaled_rc = self.scale_down(
-                new_rc, old_rc,
-                desired,
-                min_available, max_surge,
-            )
-            old_rc = scaled_rc
+        self.track(old_rc, new_rc)
+        try:
+            while new_rc.replicas != desired or old_rc.replicas != 0:
+                changes = self._changes
+                scaled_rc = self.scale_up(
+                    new_rc, old_rc,
+                    original, desired,
+                    max_surge, max_unavailable,
+                )
+                new_rc = scaled_rc
+                scaled_rc = self.scale_down(
+                    new_rc, old_rc,
+                    desired,
+                    min_available, max_surge,
+                )
+                old_rc = scaled_rc
+                if new_rc.replicas != desired or old_rc.replicas != 0:
+                    self.wait_for_change(changes)
+        finally:
+            self.stop_tracking()
 
         logger.info("Update succeeded. Deleting {}".format(old_rc.name))
         self.cleanup(old_rc, new_rc)
 
+    def span_attributes(self):
+        return {
+            "k8s.kind": self.old_rc.kind,
+            "k8s.namespace": self.old_rc.namespace,
+            "pykube.old": self.old_rc.name,
+            "pykube.new": self.new_rc.name,
+        }
+
     def scale_up(self, new_rc, old_rc, original, desired, max_surge, max_unavailable):
         # if we're already at the desired, do nothing.
         if new_rc.replicas == desired:
@@ -94,7 +123,7 @@ class RollingUpdater(object):
         new_rc.replicas = min(desired, new_rc.replicas + increment)
         # perform the scale up
         logger.info("scaling {} up to {}".format(new_rc.name, new_rc.replicas))
-        new_rc.scale()
+        new_rc.scale(wait=False)
         return new_rc
 
     def scale_down(self, new_rc, old_rc, desired, min_available, max_surge):
@@ -126,36 +155,71 @@ class RollingUpdater(object):
             old_rc.replicas = 0
         # perform scale down
         logger.info("scaling {} down to {}".format(old_rc.name, old_rc.replicas))
-        old_rc.scale()
+        old_rc.scale(wait=False)
         return old_rc
 
     def cleanup(self, old_rc, new_rc):
         old_rc.delete()
 
-    def poll_for_ready_pods(self, old_rc, new_rc):
-        controllers = [old_rc, new_rc]
-        old_ready = 0
-        new_ready = 0
-        any_ready = False
+    def track(self, *controllers):
+        """
+        Starts following the pods of ``controllers`` (by name) with one
+        informer each; every change wakes up ``wait_for_change``.
+        """
+        for controller in controllers:
+            if controller.name in self._informers:
+                continue
+            informer = Informer(
+                self.api, Pod,
+                namespace=controller.namespace,
+                selector=controller.obj["spec"]["selector"],
+            )
+            informer.add_event_handler(
+                on_add=lambda obj: self._notify(),
+                on_update=lambda old, new: self._notify(),
+                on_delete=lambda obj: self._notify(),
+            )
+            self._informers[controller.name] = informer.start()
+        for informer in self._informers.values():
+            informer.wait_for_sync()
+
+    def stop_tracking(self):
+        for informer in self._informers.values():
+            informer.stop()
+        self._informers = {}
+
+    def _notify(self):
+        with self._changed:
+            self._changes += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, changes, timeout=None):
+        """
+        Blocks until pods changed since ``changes`` was read from
+        ``_changes`` or at most ``timeout`` (``update_period``) seconds.
+        """
+        with self._changed:
+            if self._changes == changes:
+                self._changed.wait(self.update_period if timeout is None else timeout)
+
+    def ready_pods(self, controller):
+        """
+        Returns how many pods of ``controller`` are ready right now.
+        """
+        return sum(1 for pod in self._informers[controller.name].store.list() if pod.ready)
 
+    def poll_for_ready_pods(self, old_rc, new_rc):
+        """
+        Blocks until any pod of either controller is ready and returns the
+        numbers of ready pods of both.
+        """
+        self.track(old_rc, new_rc)
         while True:
-            for controller in controllers:
-                pods = Pod.objects(self.api).filter(
-                    namespace=controller.namespace,
-                    selector=controller.obj["spec"]["selector"],
-                )
-                for pod in pods:
-                    if pod.ready:
-                        if controller.name == old_rc.name:
-                            old_ready += 1
-                        elif controller.name == new_rc.name:
-                            new_ready += 1
-                        any_ready = True
-            if any_ready:
-                break
-            time.sleep(1)
-
-        return old_ready, new_ready
+            changes = self._changes
+            old_ready, new_ready = self.ready_pods(old_rc), self.ready_pods(new_rc)
+            if old_ready or new_ready:
+                return old_ready, new_ready
+            self.wait_for_change(changes)
 
     def create_rc(self, rc):
         rc.replicas = 0
@@ -0,0 +1,677 @@
+"""
+An in-process fake of the Kubernetes API for tests and benchmarks.
+
+FakeAPI is a requests transport adapter keeping objects in memory. Mounted
+on an HTTPClient, pykube (and code built on it: controllers, informers,
+rolling updates) talks to it like to an API server, without a cluster:
+
+    fake = pykube.testing.FakeAPI()
+    api = fake.client()
+    pykube.Deployment(api, {...}).create()
+    pods = pykube.Pod.objects(api).filter(selector={"app": "web"})
+    for event in pods.watch():
+        ...
+
+It serves create, get, list (label and field selectors, limit/continue),
+update, merge patch, delete and watch (from a resourceVersion, with
+timeoutSeconds and bookmarks) of every kind known to pykube plus those
+added with ``add_resource``, the status and scale subresources and
+discovery. With ``controllers`` the status of objects with
+``spec.replicas`` follows their spec at once, as if their controller
+reconciled immediately.
+
+Differences from a real API server: no validation, admission,
+authentication, garbage collection or finalizers; strategic merge and
+apply patches are applied as JSON merge patches; JSON patches are
+refused; lists are not snapshots (a paginated list sees changes made
+while paging); responses are always JSON.
+"""
+
+import base64
+import collections
+import datetime
+import json
+import random
+import string
+import threading
+import time
+import uuid
+from bisect import bisect_right
+
+import requests.adapters
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from six.moves import http_client
+from six.moves.urllib.parse import parse_qs, urlparse
+
+from . import objects
+from .cache import fields_match, labels_match, parse_selector
+from .config import KubeConfig
+from .http import HTTPClient
+from .metrics import RequestInfo
+from .mixins import ScalableMixin
+from .query import _storage_key
+from .utils import apply_merge_patch
+
+
+FAKE_SERVER = "http://fake-kubernetes"
+
+VERSION = {"major": "1", "minor": "13", "gitVersion": "v1.13.0-fake", "platform": "linux/amd64"}
+
+Resource = collections.namedtuple("Resource", "api_version kind name namespaced scalable")
+
+_merge_patch_types = (
+    "application/merge-patch+json",
+    "application/strategic-merge-patch+json",
+    "application/apply-patch+yaml",
+)
+
+_reasons = {
+    400: "BadRequest",
+    404: "NotFound",
+    405: "MethodNotAllowed",
+    409: "Conflict",
+    410: "Expired",
+    415: "UnsupportedMediaType",
+}
+
+
+class FakeAPIError(Exception):
+
+    def __init__(self, code, message, reason=None):
+        super(FakeAPIError, self).__init__(message)
+        self.code = code
+        self.message = message
+        self.reason = reason or _reasons.get(code, "InternalError")
+
+    def status(self):
+        return {
+            "kind": "Status",
+            "apiVersion": "v1",
+            "metadata": {},
+            "status": "Failure",
+            "message": self.message,
+            "reason": self.reason,
+            "code": self.code,
+        }
+
+
+def default_resources():
+    """
+    Returns the resources of the kinds pykube has classes for.
+    """
+    resources = []
+    for value in vars(objects).values():
+        if isinstance(value, type) and issubclass(value, objects.APIObject) and hasattr(value, "endpoint"):
+            resources.append(Resource(
+                value.version,
+                value.kind,
+                value.endpoint,
+                issubclass(value, objects.NamespacedAPIObject),
+                issubclass(value, ScalableMixin) and value.scalable_attr == "replicas",
+            ))
+    return resources
+
+
+class FakeAPI(requests.adapters.BaseAdapter):
+    """
+    Transport adapter answering Kubernetes API requests from an in-memory
+    object store. Thread-safe; watches block their own thread only.
+    """
+
+    def __init__(self, resources=None, history=10000, controllers=True):
+        """
+        :Parameters:
+           - `resources`: Resource tuples to serve; defaults to every kind
+             pykube has a class for
+           - `history`: The number of changes kept for watches; watching
+             from an older resourceVersion answers 410 Gone
+           - `controllers`: Whether the status of objects with
+             ``spec.replicas`` follows their spec
+        """
+        super(FakeAPI, self).__init__()
+        self.controllers = controllers
+        self._resources = {}
+        for resource in (resources if resources is not None else default_resources()):
+            self.add_resource(*resource)
+        # (api_version, plural) -> {storage key: object}
+        self._objects = collections.defaultdict(dict)
+        # (api_version, plural) -> sorted storage keys, None when stale
+        self._keys = {}
+        self._rv = 0
+        self._events = collections.deque()
+        self._history = history
+        self._compacted = 0
+        self._changed = threading.Condition()
+        self._closed = False
+
+    def add_resource(self, api_version, kind, name, namespaced=True, scalable=False):
+        """
+        Serves a resource, for example a custom resource.
+
+        :Parameters:
+           - `api_version`: The API version ("v1" or "group/version")
+           - `kind`: The kind
+           - `name`: The plural resource name
+           - `namespaced`: Whether objects live in namespaces
+           - `scalable`: Whether the resource has a scale subresource
+        """
+        self._resources[(api_version, name)] = Resource(api_version, kind, name, namespaced, scalable)
+
+    def client(self, namespace="default", **kwargs):
+        """
+        Returns an HTTPClient talking to this fake. Keyword arguments are
+        passed to HTTPClient; discovery is cached in memory only.
+        """
+        config = KubeConfig(doc={
+            "clusters": [{"name": "fake", "cluster": {"server": FAKE_SERVER}}],
+            "contexts": [{"name": "fake", "context": {"cluster": "fake", "namespace": namespace}}],
+            "current-context": "fake",
+        })
+        kwargs.setdefault("discovery_cache_dir", None)
+        api = HTTPClient(config, **kwargs)
+        self.mount(api)
+        return api
+
+    def mount(self, api):
+        """
+        Routes the requests of ``api`` to this fake.
+        """
+        api.session.mount(api.url, self)
+
+    def close(self):
+        """
+        Ends all watches.
+        """
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    # store access for tests
+
+    def add(self, obj):
+        """
+        Stores a copy of ``obj`` (with apiVersion and kind) as if created
+        through the API and returns the stored object.
+        """
+        obj = json.loads(json.dumps(obj))
+        resource = self._resource_of_kind(obj["apiVersion"], obj["kind"])
+        metadata = obj.get("metadata") or {}
+        namespace = metadata.get("namespace", "default") if resource.namespaced else None
+        with self._changed:
+            return self._create(resource, namespace, obj)
+
+    def get(self, api_version, kind, name, namespace=None):
+        """
+        Returns the stored object or None.
+        """
+        resource = self._resource_of_kind(api_version, kind)
+        with self._changed:
+            return self._objects[(api_version, resource.name)].get(self._key(resource, namespace, name))
+
+    def list(self, api_version, kind, namespace=None):
+        resource = self._resource_of_kind(api_version, kind)
+        with self._changed:
+            return [
+                obj for obj in self._objects[(api_version, resource.name)].values()
+                if namespace is None or obj["metadata"].get("namespace") == namespace
+            ]
+
+    @property
+    def resource_version(self):
+        return str(self._rv)
+
+    def _resource_of_kind(self, api_version, kind):
+        for resource in self._resources.values():
+            if resource.api_version == api_version and (resource.kind == kind or resource.name == kind):
+                return resource
+        raise ValueError("{} {} is not served".format(api_version, kind))
+
+    # transport
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        info = RequestInfo(request.method, request.url, FAKE_SERVER)
+        query = parse_qs(urlparse(request.url).query)
+        params = dict((k, v[0]) for k, v in query.items())
+        try:
+            if info.api_version is None:
+                status, body = self._non_resource(info, urlparse(request.url).path.rstrip("/"))
+            elif info.resource is None:
+                status, body = self._discovery(info)
+            else:
+                resource = self._resources.get((info.api_version, info.resource))
+                if resource is None:
+                    status, body = 404, b"404 page not found"
+                elif info.verb == "watch":
+                    return self._response(request, 200, _WatchStream(self, resource, info.namespace, params))
+                else:
+                    status, body = self._handle(request, info, resource, params)
+        except FakeAPIError as e:
+            status, body = e.code, e.status()
+        return self._response(request, status, body)
+
+    def _response(self, request, status, body):
+        response = Response()
+        response.status_code = status
+        response.reason = http_client.responses.get(status, "")
+        response.headers = CaseInsensitiveDict()
+        response.request = request
+        response.url = request.url
+        if isinstance(body, _WatchStream):
+            response.headers["content-type"] = "application/json"
+            response.raw = body
+            return response
+        if isinstance(body, bytes):
+            response.headers["content-type"] = "text/plain; charset=utf-8"
+            content = body
+        else:
+            response.headers["content-type"] = "application/json"
+            content = json.dumps(body).encode("utf-8")
+        response.headers["content-length"] = str(len(content))
+        response._content = content
+        response._content_consumed = True
+        return response
+
+    def _non_resource(self, info, path):
+        if path == "/version" and info.method == "GET":
+            return 200, VERSION
+        if path == "/api" and info.method == "GET":
+            return 200, {"kind": "APIVersions", "versions": ["v1"]}
+        if path == "/apis" and info.method == "GET":
+            groups = {}
+            for api_version in sorted(set(r.api_version for r in self._resources.values() if "/" in r.api_version)):
+                group, version = api_version.split("/")
+                groups.setdefault(group, []).append({"groupVersion": api_version, "version": version})
+            return 200, {
+                "kind": "APIGroupList",
+                "apiVersion": "v1",
+                "groups": [
+                    {"name": group, "versions": versions, "preferredVersion": versions[-1]}
+                    for group, versions in sorted(groups.items())
+                ],
+            }
+        return 404, b"404 page not found"
+
+    def _discovery(self, info):
+        resources = sorted(
+            (r for r in self._resources.values() if r.api_version == info.api_version),
+            key=lambda r: r.name,
+        )
+        if not resources or info.method != "GET":
+            return 404, b"404 page not found"
+        listed = []
+        for r in resources:
+            listed.append({
+                "name": r.name,
+                "singularName": "",
+                "namespaced": r.namespaced,
+                "kind": r.kind,
+                "verbs": ["create", "delete", "get", "list", "patch", "update", "watch"],
+            })
+            listed.append({"name": r.name + "/status", "singularName": "", "namespaced": r.namespaced,
+                           "kind": r.kind, "verbs": ["get", "patch", "update"]})
+            if r.scalable:
+                listed.append({"name": r.name + "/scale", "singularName": "", "namespaced": r.namespaced,
+                               "kind": "Scale", "verbs": ["get", "patch", "update"]})
+        return 200, {
+            "kind": "APIResourceList",
+            "apiVersion": "v1",
+            "groupVersion": info.api_version,
+            "resources": listed,
+        }
+
+    def _handle(self, request, info, resource, params):
+        namespace = info.namespace if resource.namespaced else None
+        if resource.namespaced and namespace is None and (info.name is not None or info.method == "POST"):
+            raise FakeAPIError(404, "the server could not find the requested resource")
+        if info.subresource is not None and info.subresource not in ("status", "scale") or \
+                info.subresource == "scale" and not resource.scalable:
+            raise FakeAPIError(404, "the server could not find the requested resource")
+        with self._changed:
+            if info.name is None:
+                if info.method == "GET":
+                    return 200, self._list(resource, namespace, params)
+                if info.method == "POST":
+                    return 201, self._create(resource, namespace, _body(request))
+                raise FakeAPIError(405, "the server does not allow this method on the requested resource")
+            key = self._key(resource, namespace, info.name)
+            if info.method == "GET":
+                return 200, self._view(resource, info.subresource, self._existing(resource, key, info.name))
+            if info.method == "PUT":
+                return 200, self._update(resource, key, info, _body(request))
+            if info.method == "PATCH":
+                return 200, self._patch(resource, key, info, request, namespace)
+            if info.method == "DELETE":
+                return 200, self._delete(resource, key, info.name)
+        raise FakeAPIError(405, "the server does not allow this method on the requested resource")
+
+    # operations; the caller holds the lock
+
+    def _key(self, resource, namespace, name):
+        if resource.namespaced:
+            return "{}/{}".format(namespace or "default", name)
+        return name
+
+    def _existing(self, resource, key, name):
+        obj = self._objects[(resource.api_version, resource.name)].get(key)
+        if obj is None:
+            raise FakeAPIError(404, "{} \"{}\" not found".format(resource.name, name))
+        return obj
+
+    def _view(self, resource, subresource, obj):
+        if subresource != "scale":
+            return obj
+        metadata = obj["metadata"]
+        return {
+            "kind": "Scale",
+            "apiVersion": "autoscaling/v1",
+            "metadata": {
+                "name": metadata["name"],
+                "namespace": metadata.get("namespace"),
+                "resourceVersion": metadata["resourceVersion"],
+                "uid": metadata.get("uid"),
+            },
+            "spec": {"replicas": (obj.get("spec") or {}).get("replicas", 0)},
+            "status": {"replicas": (obj.get("status") or {}).get("replicas", 0)},
+        }
+
+    def _list(self, resource, namespace, params):
+        store = self._objects[(resource.api_version, resource.name)]
+        keys = self._keys.get((resource.api_version, resource.name))
+        if keys is None:
+            keys = self._keys[(resource.api_version, resource.name)] = sorted(store)
+        labels = parse_selector(params["labelSelector"]) if params.get("labelSelector") else None
+        fields = parse_selector(params["fieldSelector"]) if params.get("fieldSelector") else None
+        limit = int(params.get("limit") or 0)
+        start = 0
+        if params.get("continue"):
+            token = _decode_continue(params["continue"])
+            if token["rv"] < self._compacted:
+                raise FakeAPIError(410, "The provided continue parameter is too old")
+            start = bisect_right(keys, token["start"])
+        elif namespace is not None:
+            start = bisect_right(keys, namespace + "/")
+        items = []
+        metadata = {"resourceVersion": str(self._rv)}
+        prefix = None if namespace is None else namespace + "/"
+        for i in range(start, len(keys)):
+            key = keys[i]
+            if prefix is not None and not key.startswith(prefix):
+                break
+            obj = store[key]
+            if labels is not None and not labels_match(obj["metadata"].get("labels") or {}, labels):
+                continue
+            if fields is not None and not fields_match(obj, fields):
+                continue
+            if limit and len(items) == limit:
+                metadata["continue"] = _encode_continue(self._rv, _storage_key(items[-1]))
+                break
+            items.append(obj)
+        return {
+            "kind": resource.kind + "List",
+            "apiVersion": resource.api_version,
+            "metadata": metadata,
+            "items": items,
+        }
+
+    def _create(self, resource, namespace, obj):
+        if not isinstance(obj, dict):
+            raise FakeAPIError(400, "the object is not a JSON object")
+        metadata = dict(obj.get("metadata") or {})
+        if resource.namespaced:
+            if metadata.get("namespace", namespace) != namespace:
+                raise FakeAPIError(400, "the namespace of the provided object does not match the namespace "
+                                        "sent on the request")
+            metadata["namespace"] = namespace
+        else:
+            metadata.pop("namespace", None)
+        if not metadata.get("name"):
+            if not metadata.get("generateName"):
+                raise FakeAPIError(400, "name or generateName is required")
+            metadata["name"] = metadata["generateName"] + "".join(
+                random.choice(string.ascii_lowercase + string.digits) for _ in range(5)
+            )
+        key = self._key(resource, namespace, metadata["name"])
+        store = self._objects[(resource.api_version, resource.name)]
+        if key in store:
+            raise FakeAPIError(409, "{} \"{}\" already exists".format(resource.name, metadata["name"]),
+                               reason="AlreadyExists")
+        metadata["uid"] = str(uuid.uuid4())
+        metadata["creationTimestamp"] = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        metadata["generation"] = 1
+        obj = dict(obj, apiVersion=resource.api_version, kind=resource.kind, metadata=metadata)
+        self._keys[(resource.api_version, resource.name)] = None
+        return self._changed_obj(resource, key, "ADDED", obj)
+
+    def _update(self, resource, key, info, obj):
+        current = self._existing(resource, key, info.name)
+        self._check_version(resource, current, (obj.get("metadata") or {}).get("resourceVersion"))
+        if info.subresource == "status":
+            obj = dict(current, status=obj.get("status"))
+        elif info.subresource == "scale":
+            obj = dict(current, spec=dict(current.get("spec") or {}, replicas=(obj.get("spec") or {}).get("replicas")))
+        else:
+            # the status is only changed through the status subresource
+            obj = dict(obj)
+            if "status" in current:
+                obj["status"] = current["status"]
+            else:
+                obj.pop("status", None)
+        return self._view(resource, info.subresource, self._replace(resource, key, current, obj))
+
+    def _patch(self, resource, key, info, request, namespace):
+        content_type = (request.headers.get("Content-Type") or "").split(";")[0].strip()
+        if content_type not in _merge_patch_types:
+            raise FakeAPIError(415, "the body of the request was in an unknown format - accepted media types "
+                                    "include: " + ", ".join(_merge_patch_types))
+        patch = _body(request)
+        store = self._objects[(resource.api_version, resource.name)]
+        if content_type == "application/apply-patch+yaml" and key not in store:
+            return self._create(resource, namespace, patch)
+        current = self._existing(resource, key, info.name)
+        self._check_version(resource, current, (patch.get("metadata") or {}).get("resourceVersion"))
+        if info.subresource == "status":
+            patch = {"status": patch.get("status")}
+        elif info.subresource == "scale":
+            patch = {"spec": {"replicas": (patch.get("spec") or {}).get("replicas")}}
+        else:
+            patch.pop("status", None)
+        obj = apply_merge_patch(current, patch)
+        return self._view(resource, info.subresource, self._replace(resource, key, current, obj))
+
+    def _check_version(self, resource, current, resource_version):
+        if resource_version and resource_version != current["metadata"]["resourceVersion"]:
+            raise FakeAPIError(
+                409,
+                "Operation cannot be fulfilled on {} \"{}\": the object has been modified; please apply your "
+                "changes to the latest version and try again".format(resource.name, current["metadata"]["name"]),
+            )
+
+    def _replace(self, resource, key, current, obj):
+        metadata = dict(obj.get("metadata") or {})
+        for field in ("name", "namespace", "uid", "creationTimestamp", "generation"):
+            if field in current["metadata"]:
+                metadata[field] = current["metadata"][field]
+            else:
+                metadata.pop(field, None)
+        if obj.get("spec") != current.get("spec"):
+            metadata["generation"] = current["metadata"].get("generation", 1) + 1
+        obj = dict(obj, apiVersion=resource.api_version, kind=resource.kind, metadata=metadata)
+        return self._changed_obj(resource, key, "MODIFIED", obj)
+
+    def _delete(self, resource, key, name):
+        self._existing(resource, key, name)
+        obj = self._objects[(resource.api_version, resource.name)].pop(key)
+        self._keys[(resource.api_version, resource.name)] = None
+        self._rv += 1
+        obj = dict(obj, metadata=dict(obj["metadata"], resourceVersion=str(self._rv)))
+        self._record(resource, "DELETED", obj)
+        return obj
+
+    def _changed_obj(self, resource, key, type, obj):
+        if self.controllers and resource.scalable and isinstance(obj.get("spec"), dict) and "replicas" in obj["spec"]:
+            # the controller catches up at once
+            replicas = obj["spec"]["replicas"]
+            obj["status"] = dict(
+                obj.get("status") or {},
+                replicas=replicas,
+                readyReplicas=replicas,
+                availableReplicas=replicas,
+                updatedReplicas=replicas,
+                observedGeneration=obj["metadata"]["generation"],
+            )
+        self._rv += 1
+        obj["metadata"]["resourceVersion"] = str(self._rv)
+        self._objects[(resource.api_version, resource.name)][key] = obj
+        self._record(resource, type, obj)
+        return obj
+
+    def _record(self, resource, type, obj):
+        if len(self._events) >= self._history:
+            self._compacted = self._events.popleft()[0]
+        self._events.append((self._rv, resource.api_version, resource.name, type, obj))
+        self._changed.notify_all()
+
+    def _events_after(self, resource_version):
+        """
+        Returns the recorded changes after ``resource_version``; the caller
+        holds the lock.
+        """
+        events = []
+        # the newest changes are at the end
+        for event in reversed(self._events):
+            if event[0] <= resource_version:
+                break
+            events.append(event)
+        events.reverse()
+        return events
+
+
+class _WatchStream(object):
+    """
+    The body of a watch response, produced as the watched objects change.
+    """
+
+    def __init__(self, fake, resource, namespace, params):
+        self.fake = fake
+        self.resource = resource
+        self.namespace = namespace if resource.namespaced else None
+        self.labels = parse_selector(params["labelSelector"]) if params.get("labelSelector") else None
+        self.fields = parse_selector(params["fieldSelector"]) if params.get("fieldSelector") else None
+        self.bookmarks = params.get("allowWatchBookmarks") == "true"
+        timeout = params.get("timeoutSeconds")
+        self.deadline = time.time() + int(timeout) if timeout else None
+        self.closed = False
+        self.buffer = b""
+        with fake._changed:
+            resource_version = params.get("resourceVersion")
+            if resource_version in (None, "", "0"):
+                # start with the current state, as synthetic additions
+                self.position = fake._rv
+                state = fake._list(resource, self.namespace, {
+                    "labelSelector": params.get("labelSelector"),
+                    "fieldSelector": params.get("fieldSelector"),
+                })
+                self.buffer = b"".join(self._line("ADDED", obj) for obj in state["items"])
+            elif int(resource_version) < fake._compacted:
+                self.position = None
+                status = FakeAPIError(410, "too old resource version: {} ({})".format(
+                    resource_version, fake._compacted + 1)).status()
+                self.buffer = self._line("ERROR", status)
+                self.deadline = 0
+            else:
+                self.position = int(resource_version)
+
+    def _line(self, type, obj):
+        return json.dumps({"type": type, "object": obj}).encode("utf-8") + b"\n"
+
+    def _matches(self, api_version, plural, obj):
+        if (api_version, plural) != (self.resource.api_version, self.resource.name):
+            return False
+        metadata = obj["metadata"]
+        if self.namespace is not None and metadata.get("namespace") != self.namespace:
+            return False
+        if self.labels is not None and not labels_match(metadata.get("labels") or {}, self.labels):
+            return False
+        return self.fields is None or fields_match(obj, self.fields)
+
+    def _drain(self):
+        # the changes after the position the stream is at; moves it past them
+        events = self.fake._events_after(self.position)
+        if not events:
+            return b""
+        self.position = events[-1][0]
+        return b"".join(
+            self._line(type, obj)
+            for _, api_version, plural, type, obj in events
+            if self._matches(api_version, plural, obj)
+        )
+
+    def _fill(self):
+        fake = self.fake
+        with fake._changed:
+            while not self.buffer:
+                if self.closed or fake._closed:
+                    return
+                if self.position is None:
+                    self.closed = True
+                    return
+                if self.position < fake._compacted:
+                    # fell behind the history while not reading
+                    self.buffer = self._line("ERROR", FakeAPIError(410, "too old resource version").status())
+                    self.position = None
+                    continue
+                remaining = None if self.deadline is None else self.deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    if not self.bookmarks:
+                        self.closed = True
+                        return
+                    # the bookmark must not claim changes that were not sent
+                    self.buffer = self._drain() + self._line("BOOKMARK", {
+                        "kind": self.resource.kind,
+                        "apiVersion": self.resource.api_version,
+                        "metadata": {"resourceVersion": str(self.position)},
+                    })
+                    self.position = None
+                    continue
+                self.buffer = self._drain()
+                if not self.buffer:
+                    fake._changed.wait(remaining if remaining is not None else 1.0)
+
+    def read(self, amt=None, **kwargs):
+        if not self.buffer:
+            self._fill()
+        if amt is None or amt >= len(self.buffer):
+            data, self.buffer = self.buffer, b""
+        else:
+            data, self.buffer = self.buffer[:amt], self.buffer[amt:]
+        return data
+
+    def close(self):
+        with self.fake._changed:
+            self.closed = True
+            self.fake._changed.notify_all()
+
+
+def _body(request):
+    body = request.body
+    if not body:
+        raise FakeAPIError(400, "the request has no body")
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise FakeAPIError(400, "the body is not JSON: {}".format(e))
+
+
+def _encode_continue(resource_version, start):
+    token = json.dumps({"rv": resource_version, "start": start}).encode("utf-8")
+    return base64.urlsafe_b64encode(token).decode("ascii")
+
+
+def _decode_continue(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+    except (ValueError, TypeError):
+        raise FakeAPIError(400, "invalid continue token")
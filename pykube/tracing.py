@@ -0,0 +1,324 @@
+"""
+Tracing of pykube operations.
+
+Queries (get, list, watch), APIObject operations, scaling and rolling
+updates open a span on the tracer of their client, ``api.tracer``; the API
+requests they send become child spans. The default tracer does nothing. To
+trace, give the client a tracer:
+
+    exporter = pykube.tracing.InMemoryExporter()
+    api = pykube.HTTPClient(config, tracer=pykube.tracing.Tracer(exporter))
+    deployment.scale(5)
+    for span in exporter.spans:
+        print(span.name, span.duration)
+
+or hand the spans to OpenTelemetry (pip install pykube[tracing]):
+
+    api = pykube.HTTPClient(config, tracer=pykube.tracing.OpenTelemetryTracer())
+
+The tracer API follows OpenTelemetry: ``start_span`` starts a span as a
+child of the current one, ``use_span`` makes a span current and
+``start_as_current_span`` does both.
+"""
+
+import contextlib
+import functools
+import inspect
+import random
+import threading
+import time
+
+try:
+    from opentelemetry import trace as otel_trace
+    opentelemetry_installed = True
+except ImportError:
+    opentelemetry_installed = False
+
+from six import string_types
+
+
+class Span(object):
+    """
+    A timed operation recorded by ``Tracer``. ``start`` and ``end_time``
+    are epoch seconds; ``error`` is the exception that ended the operation.
+    """
+
+    def __init__(self, tracer, name, attributes=None, parent=None):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else "{:032x}".format(random.getrandbits(128))
+        self.span_id = "{:016x}".format(random.getrandbits(64))
+        self.start = time.time()
+        self.end_time = None
+        self.error = None
+
+    def __repr__(self):
+        return "<Span {} {}>".format(self.name, self.span_id)
+
+    @property
+    def duration(self):
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exception):
+        self.error = exception
+
+    def end(self):
+        if self.end_time is None:
+            self.end_time = time.time()
+            self.tracer.exporter.export(self)
+
+
+class _NoopSpan(object):
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_noop_span = _NoopSpan()
+
+
+class NoopTracer(object):
+    """
+    The default tracer; records nothing.
+    """
+
+    enabled = False
+
+    def start_span(self, name, attributes=None):
+        return _noop_span
+
+    def use_span(self, span):
+        return _noop_span
+
+    def start_as_current_span(self, name, attributes=None):
+        return _noop_span
+
+
+NOOP_TRACER = NoopTracer()
+
+
+class _BaseTracer(object):
+
+    enabled = True
+
+    @contextlib.contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        span = self.start_span(name, attributes)
+        try:
+            with self.use_span(span):
+                yield span
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            self._fail(span, e)
+            raise
+        finally:
+            span.end()
+
+    def _fail(self, span, exception):
+        span.record_exception(exception)
+
+
+class Tracer(_BaseTracer):
+    """
+    Records spans in process and hands every ended span to ``exporter``.
+    The current span is tracked per thread.
+    """
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter if exporter is not None else InMemoryExporter()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @property
+    def current_span(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def start_span(self, name, attributes=None):
+        return Span(self, name, attributes, parent=self.current_span)
+
+    @contextlib.contextmanager
+    def use_span(self, span):
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+
+
+class InMemoryExporter(object):
+    """
+    Keeps ended spans in ``spans``, in the order they ended.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def clear(self):
+        with self._lock:
+            del self.spans[:]
+
+    def find(self, name):
+        """
+        Returns the ended spans called ``name``.
+        """
+        return [span for span in self.spans if span.name == name]
+
+    def children(self, span):
+        return [s for s in self.spans if s.parent is span]
+
+
+class OpenTelemetryTracer(_BaseTracer):
+    """
+    Creates OpenTelemetry spans, nested in whatever span is current in the
+    OpenTelemetry context.
+    """
+
+    def __init__(self, tracer=None):
+        """
+        :Parameters:
+           - `tracer`: The OpenTelemetry tracer; defaults to the "pykube"
+             tracer of the global tracer provider
+        """
+        if not opentelemetry_installed:
+            raise ImportError("missing dependencies for OpenTelemetry tracing (try pip install pykube[tracing])")
+        self.tracer = tracer if tracer is not None else otel_trace.get_tracer("pykube")
+
+    def start_span(self, name, attributes=None):
+        # OpenTelemetry rejects None attribute values
+        attributes = dict((k, v) for k, v in (attributes or {}).items() if v is not None)
+        return self.tracer.start_span(name, attributes=attributes)
+
+    def use_span(self, span):
+        return otel_trace.use_span(span, end_on_exit=False)
+
+    def _fail(self, span, exception):
+        span.record_exception(exception)
+        span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, str(exception)))
+
+
+class RequestSpans(object):
+    """
+    Request hooks (see ``HTTPClient.add_request_hook``) opening a span for
+    every API request, as a child of the current span.
+    """
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self._local = threading.local()
+
+    def before(self, info):
+        span = self.tracer.start_span("HTTP {}".format(info.method), {
+            "http.method": info.method,
+            "http.url": info.url,
+            "k8s.verb": info.verb,
+            "k8s.resource": info.resource,
+            "k8s.namespace": info.namespace,
+        })
+        spans = getattr(self._local, "spans", None)
+        if spans is None:
+            spans = self._local.spans = []
+        spans.append(span)
+
+    def after(self, info):
+        span = self._local.spans.pop()
+        if info.status is not None:
+            span.set_attribute("http.status_code", info.status)
+        if info.retries:
+            span.set_attribute("pykube.retries", info.retries)
+        if info.error is not None:
+            self.tracer._fail(span, info.error)
+        span.end()
+
+
+def object_attributes(obj):
+    """
+    Span attributes of an APIObject or a query.
+    """
+    cls = getattr(obj, "api_obj_class", type(obj))
+    attributes = {"k8s.kind": getattr(cls, "kind", cls.__name__)}
+    namespace = getattr(obj, "namespace", None)
+    if isinstance(namespace, string_types):
+        attributes["k8s.namespace"] = namespace
+    if not hasattr(obj, "api_obj_class"):
+        attributes["k8s.name"] = obj.name
+    return attributes
+
+
+def traced(name, attributes=object_attributes):
+    """
+    Decorates a method of an object with an ``api`` so every call is
+    traced as a span ``name`` with the ``attributes(self)``. A span of a
+    generator lasts until it is exhausted or closed and is current only
+    while the generator runs.
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator(self, *args, **kwargs):
+                tracer = getattr(self.api, "tracer", NOOP_TRACER)
+                if not tracer.enabled:
+                    return func(self, *args, **kwargs)
+                return _traced_generator(tracer, name, attributes(self), func(self, *args, **kwargs))
+            return generator
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            tracer = getattr(self.api, "tracer", NOOP_TRACER)
+            if not tracer.enabled:
+                return func(self, *args, **kwargs)
+            with tracer.start_as_current_span(name, attributes(self)):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _traced_generator(tracer, name, attributes, gen):
+    span = tracer.start_span(name, attributes)
+    try:
+        while True:
+            with tracer.use_span(span):
+                try:
+                    item = next(gen)
+                except StopIteration:
+                    return
+            yield item
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        tracer._fail(span, e)
+        raise
+    finally:
+        gen.close()
+        span.end()
@@ -1,3 +1,5 @@
+import codecs
+import json
 import re
 
 try:
@@ -47,6 +49,45 @@ def obj_check(a, b):
     return c
 
 
+def merge_patch(original, current):
+    """
+    Returns the JSON merge patch (RFC 7386) that turns original into current:
+    only changed keys, null for removed keys and lists replaced as a whole.
+    """
+    patch = {}
+    for k, v in current.items():
+        if k not in original:
+            patch[k] = v
+            continue
+        o = original[k]
+        if isinstance(v, dict) and isinstance(o, dict):
+            sub = merge_patch(o, v)
+            if sub:
+                patch[k] = sub
+        elif v != o:
+            patch[k] = v
+    for k in original:
+        if k not in current:
+            patch[k] = None
+    return patch
+
+
+def apply_merge_patch(target, patch):
+    """
+    Returns target with the JSON merge patch (RFC 7386) applied; target
+    itself is not changed.
+    """
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for k, v in patch.items():
+        if v is None:
+            result.pop(k, None)
+        else:
+            result[k] = apply_merge_patch(result.get(k), v)
+    return result
+
+
 def jsonpath_parse(template, obj):
     def repl(m):
         path = m.group(2)
@@ -54,3 +95,126 @@ def jsonpath_parse(template, obj):
             path = "$" + path
         return jsonpath(path).find(obj)[0].value
     return re.sub(r"(\{([^\}]*)\})", repl, template)
+
+
+_whitespace_re = re.compile(r"[ \t\n\r]*")
+
+
+def log_timestamp_key(ts):
+    """
+    Returns a key ordering the RFC 3339 timestamps prefixed to log lines
+    with ``timestamps=true`` (which drop trailing zeros of the fraction), or
+    None if ``ts`` is not one.
+    """
+    if len(ts) < 20 or ts[4] != "-" or ts[10] != "T" or not ts.endswith("Z"):
+        return None
+    if ts[19] == ".":
+        return "{}.{}".format(ts[:19], ts[20:-1].ljust(9, "0"))
+    return "{}.{}".format(ts[:19], "0" * 9)
+
+
+class StreamingList(object):
+    """
+    Incrementally decodes a JSON object such as a Kubernetes list response
+    from an iterable of byte chunks (e.g. ``response.iter_content()``).
+
+    Iterating yields each element of ``items`` as soon as it has been read,
+    so only about one element is held in memory at a time. All other top
+    level keys are collected in ``envelope``, complete once iteration ends.
+    """
+
+    def __init__(self, chunks, key="items"):
+        self.envelope = {}
+        self._chunks = iter(chunks)
+        self._key = key
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._exhausted = False
+
+    def _more(self, size=0):
+        """
+        Reads chunks until at least ``size`` unparsed characters are buffered
+        (or just one chunk). Returns False once the input is exhausted.
+        """
+        if self._exhausted:
+            return False
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        parts = [self._buf]
+        length = len(self._buf)
+        while True:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                parts.append(self._utf8.decode(b"", True))
+                self._exhausted = True
+                break
+            text = self._utf8.decode(chunk)
+            parts.append(text)
+            length += len(text)
+            if length >= size and text:
+                break
+        self._buf = "".join(parts)
+        return True
+
+    def _peek(self):
+        while True:
+            self._pos = _whitespace_re.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                raise ValueError("unexpected end of JSON input")
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError("expected {!r} at {!r}".format(char, self._buf[self._pos:self._pos + 20]))
+        self._pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                value, end = None, None
+            # a value running up to the end of the buffer may be cut short
+            # (think numbers); it is only complete once followed by something
+            if end is not None and (end < len(self._buf) or self._exhausted):
+                self._pos = end
+                return value
+            # read as much again as is buffered so a large value is decoded
+            # a logarithmic rather than linear number of times
+            if not self._more(size=2 * (len(self._buf) - self._pos)):
+                if end is not None:
+                    self._pos = end
+                    return value
+                raise ValueError("unexpected end of JSON input")
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == self._key and self._peek() == "[":
+                self._pos += 1
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._peek() == ",":
+                            self._pos += 1
+                            continue
+                        self._expect("]")
+                        break
+            else:
+                self.envelope[key] = self._value()
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("}")
+            break
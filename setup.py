@@ -44,9 +44,15 @@ setup(
     },
     install_requires=install_requires,
     extras_require={
+        "async": [
+            "aiohttp",
+        ],
         "gcp": [
             "google-auth",
             "jsonpath-ng",
-        ]
+        ],
+        "tracing": [
+            "opentelemetry-api",
+        ],
     },
 )
@@ -0,0 +1,182 @@
+"""
+pykube.aio unittests
+"""
+
+import asyncio
+import json
+import sys
+import unittest
+
+try:
+    from aiohttp import web
+    from pykube import aio
+except (ImportError, SyntaxError):
+    web = None
+
+import pykube
+
+from . import TestCase
+
+
+def pod(name, resource_version="1", **labels):
+    return {"metadata": {"name": name, "namespace": "default", "resourceVersion": resource_version, "labels": labels}}
+
+
+@unittest.skipIf(web is None or sys.version_info < (3, 6), "requires aiohttp")
+class TestAsyncQuery(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.requests = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_with_server(self, handler, coro_factory, config_factory=pykube.KubeConfig.from_url):
+        async def main():
+            app = web.Application()
+            app.router.add_get("/api/v1/namespaces/default/pods", handler)
+            app.router.add_get("/api/v1/namespaces/default/pods/{name}", handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            config = config_factory("http://127.0.0.1:{}".format(port))
+            api = aio.AsyncHTTPClient(config)
+            try:
+                return await coro_factory(api)
+            finally:
+                await api.close()
+                await runner.cleanup()
+        return self.loop.run_until_complete(main())
+
+    def test_list_pages(self):
+        async def handler(request):
+            self.requests.append(dict(request.query))
+            if "continue" in request.query:
+                return web.json_response({"metadata": {"resourceVersion": "7"}, "items": [pod("c")]})
+            return web.json_response({"metadata": {"continue": "t"}, "items": [pod("a"), pod("b")]})
+
+        async def run(api):
+            names = [p.name async for p in pykube.Pod.objects(api)]
+            web_pods = await pykube.Pod.objects(api).filter(selector={"app": "web"}).all()
+            return names, web_pods
+
+        names, web_pods = self.run_with_server(handler, run)
+        self.assertEqual(names, ["a", "b", "c"])
+        self.assertEqual(len(web_pods), 3)
+        self.assertEqual(self.requests[2]["labelSelector"], "app=web")
+
+    def test_get_by_name(self):
+        async def handler(request):
+            name = request.match_info["name"]
+            if name == "missing":
+                return web.json_response({"kind": "Status", "message": "not found"}, status=404)
+            return web.json_response(pod(name))
+
+        async def run(api):
+            found = await pykube.Pod.objects(api).get(name="a")
+            missing = await pykube.Pod.objects(api).get_or_none(name="missing")
+            return found, missing
+
+        found, missing = self.run_with_server(handler, run)
+        self.assertEqual(found.name, "a")
+        self.assertIsNone(missing)
+
+    def test_watch_reconnects(self):
+        async def handler(request):
+            self.requests.append(dict(request.query))
+            response = web.StreamResponse()
+            await response.prepare(request)
+            rv = int(request.query["resourceVersion"])
+            event = {"type": "MODIFIED", "object": pod("a", str(rv + 1))}
+            await response.write(json.dumps(event).encode("utf-8") + b"\n")
+            await response.write_eof()
+            return response
+
+        async def run(api):
+            events = []
+            async for event in pykube.Pod.objects(api).watch(since="1"):
+                events.append(event.object.metadata["resourceVersion"])
+                if len(events) == 3:
+                    break
+            return events
+
+        self.assertEqual(self.run_with_server(handler, run), ["2", "3", "4"])
+        self.assertEqual([r["resourceVersion"] for r in self.requests[:3]], ["1", "2", "3"])
+
+    def test_close_ends_the_watch(self):
+        async def handler(request):
+            self.requests.append(dict(request.query))
+            response = web.StreamResponse()
+            await response.prepare(request)
+            event = {"type": "ADDED", "object": pod("a", "2")}
+            await response.write(json.dumps(event).encode("utf-8") + b"\n")
+            # and nothing more until the test is done
+            await self.done.wait()
+            return response
+
+        async def run(api):
+            self.done = asyncio.Event()
+            watch = pykube.Pod.objects(api).watch(since="1")
+            events = []
+
+            async def consume():
+                async for event in watch:
+                    events.append(event.object.name)
+                    watch.close()
+            try:
+                await asyncio.wait_for(consume(), 5)
+            finally:
+                self.done.set()
+            return events
+
+        self.assertEqual(self.run_with_server(handler, run), ["a"])
+        # no reconnect after close
+        self.assertEqual(len(self.requests), 1)
+
+    def test_throttled_request_keeps_token(self):
+        provider = StubTokenProvider()
+
+        def config_factory(url):
+            config = pykube.KubeConfig.from_url(url)
+            config.doc["users"] = [{"name": "gcp", "user": {"auth-provider": {
+                "name": "gcp", "config": {"cmd-path": "gcloud"}}}}]
+            config.doc["contexts"][0]["context"]["user"] = "gcp"
+            pykube.http._auth_providers[config] = {config.current_context: provider}
+            return config
+
+        async def handler(request):
+            self.requests.append(request.headers["Authorization"])
+            if len(self.requests) <= 2:
+                return web.json_response({"kind": "Status", "code": 429}, status=429, headers={"Retry-After": "0"})
+            if len(self.requests) == 3:
+                return web.json_response({"kind": "Status", "code": 401}, status=401)
+            return web.json_response(pod("a"))
+
+        async def run(api):
+            return await pykube.Pod.objects(api).get(name="a")
+
+        self.assertEqual(self.run_with_server(handler, run, config_factory).name, "a")
+        # only the 401 refreshed the token
+        self.assertEqual(provider.refreshed, ["token-0"])
+        self.assertEqual(self.requests, ["Bearer token-0"] * 3 + ["Bearer token-1"])
+
+
+class StubTokenProvider(object):
+
+    def __init__(self):
+        self.tokens = 0
+        self.refreshed = []
+
+    def cached_token(self):
+        return "token-{}".format(self.tokens)
+
+    def token(self):
+        return self.cached_token()
+
+    def refresh(self, rejected_token):
+        self.refreshed.append(rejected_token)
+        self.tokens += 1
+        return self.cached_token()
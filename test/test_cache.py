@@ -0,0 +1,151 @@
+"""
+pykube.cache unittests
+"""
+
+import pykube
+from pykube.cache import Informer, parse_selector, labels_match
+
+from . import TestCase
+from .test_query import BASE_CONFIG, StubAdapter, pod
+
+
+def labelled(name, resource_version, **labels):
+    obj = pod(name)
+    obj["metadata"]["resourceVersion"] = resource_version
+    obj["metadata"]["labels"] = labels
+    return obj
+
+
+class TestSelectors(TestCase):
+
+    def test_parse_dict(self):
+        self.assertEqual(
+            sorted(parse_selector({"app": "web", "tier__in": ["a", "b"]})),
+            [("app", "eq", ("web",)), ("tier", "in", ("a", "b"))],
+        )
+
+    def test_parse_string(self):
+        self.assertEqual(
+            parse_selector("app=web,tier notin (a, b),env!=prod,canary,!legacy"),
+            [
+                ("app", "eq", ("web",)),
+                ("tier", "notin", ("a", "b")),
+                ("env", "neq", ("prod",)),
+                ("canary", "exists", ()),
+                ("legacy", "notexists", ()),
+            ],
+        )
+
+    def test_labels_match(self):
+        requirements = parse_selector("app=web,env!=prod")
+        self.assertTrue(labels_match({"app": "web"}, requirements))
+        self.assertFalse(labels_match({"app": "web", "env": "prod"}, requirements))
+        self.assertFalse(labels_match({}, requirements))
+
+
+class TestInformer(TestCase):
+
+    def setUp(self):
+        self.api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG))
+
+    def test_list_and_watch(self):
+        self.api.session.mount("http://", StubAdapter([
+            (200, {
+                "kind": "PodList",
+                "metadata": {"resourceVersion": "10"},
+                "items": [labelled("a", "5", app="web"), labelled("b", "6", app="db")],
+            }),
+            (200, [
+                {"type": "ADDED", "object": labelled("c", "11", app="web")},
+                {"type": "MODIFIED", "object": labelled("a", "12", app="cache")},
+                {"type": "DELETED", "object": labelled("b", "13", app="db")},
+            ]),
+            # expired on reconnect: listed again, with c deleted meanwhile
+            (410, {"kind": "Status", "code": 410}),
+            (200, {
+                "kind": "PodList",
+                "metadata": {"resourceVersion": "20"},
+                "items": [labelled("a", "12", app="cache")],
+            }),
+        ]))
+        informer = Informer(self.api, pykube.Pod)
+        seen = []
+        informer.add_event_handler(
+            on_add=lambda obj: seen.append(("add", obj.name)),
+            on_update=lambda old, new: seen.append(("update", new.name)),
+            on_delete=lambda obj: seen.append(("delete", obj.name)),
+        )
+        informer._list()
+        self.assertTrue(informer.has_synced)
+
+        def on_delete(obj):
+            if obj.name == "c":
+                informer.stop()
+        informer.add_event_handler(on_delete=on_delete)
+        informer._watch()
+        self.assertEqual(informer.resource_version, "20")
+        self.assertEqual(seen, [
+            ("add", "a"), ("add", "b"),
+            ("add", "c"), ("update", "a"), ("delete", "b"),
+            # the relist, told the objects gone by the store
+            ("update", "a"), ("delete", "c"),
+        ])
+        cached = informer.cached()
+        self.assertEqual([p.name for p in cached], ["a"])
+        self.assertEqual(cached.get(name="a").labels, {"app": "cache"})
+        self.assertIsNone(cached.get_or_none(name="b"))
+
+
+class TestIndexes(TestCase):
+
+    def setUp(self):
+        api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG))
+        self.informer = Informer(api, pykube.Pod, namespace=pykube.all)
+        objs = []
+        for i in range(20):
+            obj = labelled("pod-{}".format(i), "1", app="web" if i % 2 else "db", shard=str(i % 5))
+            obj["metadata"]["namespace"] = "ns-{}".format(i % 2)
+            obj["metadata"]["ownerReferences"] = [{"uid": "rs-{}".format(i % 4)}]
+            obj["spec"] = {"nodeName": "node-{}".format(i % 3)}
+            objs.append(pykube.Pod(api, obj))
+        self.informer.store.replace(objs)
+
+    def names(self, objs):
+        return sorted(obj.name for obj in objs)
+
+    def test_builtin_indexes(self):
+        store = self.informer.store
+        self.assertEqual(len(store.by_index("namespace", "ns-1")), 10)
+        self.assertEqual(self.names(store.by_index("owner", "rs-3")), ["pod-11", "pod-15", "pod-19", "pod-3", "pod-7"])
+        self.assertEqual(len(store.by_index("node", "node-0")), 7)
+        self.assertEqual(len(store.by_index("label", "shard")), 20)
+
+    def test_filter_through_indexes(self):
+        cached = self.informer.cached()
+        self.assertEqual(
+            self.names(cached.filter(selector={"app": "web", "shard__in": ["1", "2"]})),
+            ["pod-1", "pod-11", "pod-17", "pod-7"],
+        )
+        self.assertEqual(
+            self.names(cached.filter(namespace="ns-0", field_selector={"spec.nodeName": "node-1"})),
+            ["pod-10", "pod-16", "pod-4"],
+        )
+        self.assertEqual(
+            self.names(cached.filter(selector="app=db,shard!=0").by_index("owner", "rs-2")),
+            ["pod-14", "pod-18", "pod-2", "pod-6"],
+        )
+
+    def test_index_follows_updates(self):
+        store = self.informer.store
+        obj = store.get("ns-1/pod-1")
+        moved = pykube.Pod(obj.api, {"metadata": {"name": "pod-1", "namespace": "ns-1", "labels": {"app": "db"}}})
+        store.add(moved)
+        self.assertNotIn("pod-1", self.names(store.by_index("label", "app=web")))
+        self.assertIn("pod-1", self.names(store.by_index("label", "app=db")))
+        self.assertEqual(self.names(store.by_index("owner", "rs-1")), ["pod-13", "pod-17", "pod-5", "pod-9"])
+        store.delete(moved)
+        self.assertNotIn("pod-1", self.names(store.by_index("label", "app=db")))
+
+    def test_custom_indexer(self):
+        self.informer.add_indexer("shard", lambda obj: [obj.labels["shard"]])
+        self.assertEqual(len(self.informer.store.by_index("shard", "4")), 4)
@@ -0,0 +1,54 @@
+"""
+pykube.codec unittests
+"""
+
+import datetime
+import json
+
+from pykube import codec
+
+from . import TestCase
+
+
+SAMPLE = {
+    "kind": "Pod",
+    "apiVersion": "v1",
+    "metadata": {
+        "name": "web-1",
+        "labels": {"app": "web", "url": "http://example.com/a"},
+        "annotations": {"note": u"café ☃"},
+    },
+    "spec": {"containers": [{"name": "web", "ports": [{"containerPort": 80}], "cpu": 0.5}]},
+    "status": {"ready": True, "message": None, "restarts": 12345678901},
+}
+
+
+class TestCodec(TestCase):
+
+    def installed(self):
+        return [codec.get_codec(name) for name, (_, installed) in codec._codecs.items() if installed]
+
+    def test_codecs_match_stdlib(self):
+        expected = codec.json_dumps(SAMPLE)
+        self.assertEqual(json.loads(expected.decode("utf-8")), SAMPLE)
+        for c in self.installed():
+            self.assertEqual(c.dumps(SAMPLE), expected, c.name)
+            self.assertEqual(c.loads(expected), SAMPLE, c.name)
+
+    def test_non_str_keys_and_dates_match_stdlib(self):
+        # as YAML loads them, e.g. a ConfigMap with ports as keys
+        obj = {"data": {80: "http", 1.5: "x", True: "yes", None: "none"}, "big": 2 ** 70}
+        expected = codec.json_dumps(obj)
+        self.assertEqual(expected, b'{"data":{"80":"http","1.5":"x","true":"yes","null":"none"},"big":1180591620717411303424}')
+        for c in self.installed():
+            self.assertEqual(c.dumps(obj), expected, c.name)
+            with self.assertRaises(TypeError):
+                c.dumps({"created": datetime.date(2020, 1, 1)})
+
+    def test_get_codec(self):
+        self.assertIsInstance(codec.get_codec(None), codec.JSONCodec)
+        self.assertIsInstance(codec.get_codec("json"), codec.JSONCodec)
+        instance = codec.JSONCodec()
+        self.assertIs(codec.get_codec(instance), instance)
+        with self.assertRaises(ValueError):
+            codec.get_codec("yaml")
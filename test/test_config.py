@@ -2,6 +2,7 @@
 pykube.config unittests
 """
 
+import base64
 import os
 
 from pykube import config, exceptions
@@ -115,3 +116,21 @@ class TestConfig(TestCase):
         self.assertEqual("default", self.cfg.namespace)
         self.cfg.set_current_context("context_with_namespace")
         self.assertEqual("foospace", self.cfg.namespace)
+
+
+class TestBytesOrFile(TestCase):
+
+    def test_inline_data_is_materialized_once(self):
+        """
+        Verify inline data is written to a single temporary file that is
+        reused and removed at exit.
+        """
+        data = base64.b64encode(b"-----BEGIN CERTIFICATE-----")
+        first = config.BytesOrFile(data=data)
+        filename = first.filename()
+        self.assertEqual(filename, first.filename())
+        self.assertEqual(filename, config.BytesOrFile(data=data).filename())
+        with open(filename, "rb") as f:
+            self.assertEqual(f.read(), b"-----BEGIN CERTIFICATE-----")
+        config._cleanup_materialized()
+        self.assertFalse(os.path.exists(filename))
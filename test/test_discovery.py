@@ -0,0 +1,101 @@
+"""
+pykube.discovery unittests
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+import pykube
+from pykube.discovery import api_version_of
+
+from . import TestCase
+from .test_query import BASE_CONFIG, StubAdapter
+
+
+def resource_list(group_version, *kinds):
+    return {
+        "kind": "APIResourceList",
+        "groupVersion": group_version,
+        "resources": [
+            {"name": kind.lower() + "s", "kind": kind, "namespaced": True}
+            for kind in kinds
+        ],
+    }
+
+
+class TestDiscoveryCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def client(self, responses, **kwargs):
+        api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG), discovery_cache_dir=self.directory, **kwargs)
+        adapter = StubAdapter(responses)
+        api.session.mount("http://", adapter)
+        return api, adapter
+
+    def test_cached_per_version(self):
+        api, adapter = self.client([
+            (200, resource_list("apps/v1", "Deployment")),
+            (200, resource_list("batch/v1", "Job")),
+        ])
+        self.assertEqual(api.resource_list("apps/v1")["groupVersion"], "apps/v1")
+        self.assertEqual(api.resource_list("batch/v1")["groupVersion"], "batch/v1")
+        self.assertEqual(api.resource_list("apps/v1")["groupVersion"], "apps/v1")
+        self.assertEqual(len(adapter.requests), 2)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.directory, "localhost_8080", "apps", "v1", "serverresources.json",
+        )))
+
+    def test_shared_on_disk(self):
+        api, _ = self.client([(200, resource_list("apps/v1", "Deployment"))])
+        api.resource_list("apps/v1")
+        other, adapter = self.client([])
+        self.assertEqual(other.resource_list("apps/v1")["groupVersion"], "apps/v1")
+        self.assertEqual(adapter.requests, [])
+
+    def test_ttl(self):
+        api, adapter = self.client([
+            (200, resource_list("apps/v1", "Deployment")),
+            (200, resource_list("apps/v1", "Deployment", "StatefulSet")),
+        ], discovery_ttl=0.05)
+        api.resource_list("apps/v1")
+        time.sleep(0.1)
+        self.assertEqual(len(api.resource_list("apps/v1")["resources"]), 2)
+        self.assertEqual(len(adapter.requests), 2)
+
+    def test_invalidated_on_unknown_route(self):
+        api, adapter = self.client([
+            (200, resource_list("example.com/v1", "Widget")),
+            (404, {"kind": "Status", "message": "widgets \"a\" not found"}),
+            (404, b"404 page not found"),
+            (200, resource_list("example.com/v1", "Gadget")),
+        ])
+        Widget = pykube.object_factory(api, "example.com/v1", "Widget")
+        # a missing object leaves discovery alone
+        self.assertIsNone(Widget.objects(api).get_or_none(name="a"))
+        self.assertIsNotNone(api.discovery.get("example.com/v1"))
+        # the resource itself is gone
+        r = api.get(version="example.com/v1", url="widgets")
+        self.assertEqual(r.status_code, 404)
+        self.assertIsNone(api.discovery.get("example.com/v1"))
+        self.assertEqual(pykube.object_factory(api, "example.com/v1", "Gadget").endpoint, "gadgets")
+
+    def test_unknown_kind_rediscovers(self):
+        api, adapter = self.client([
+            (200, resource_list("example.com/v1", "Widget")),
+            (200, resource_list("example.com/v1", "Widget", "Gadget")),
+        ])
+        api.resource_list("example.com/v1")
+        self.assertEqual(pykube.object_factory(api, "example.com/v1", "Gadget").endpoint, "gadgets")
+        self.assertEqual(len(adapter.requests), 2)
+
+    def test_api_version_of(self):
+        self.assertEqual(api_version_of("/api/v1/namespaces/default/pods"), "v1")
+        self.assertEqual(api_version_of("/apis/apps/v1/deployments?watch=true"), "apps/v1")
+        self.assertEqual(api_version_of("/version"), None)
@@ -2,7 +2,15 @@
 pykube.http unittests
 """
 import copy
+import datetime
 import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from six.moves import BaseHTTPServer, socketserver
 
 import pykube
 
@@ -121,3 +129,164 @@ class TestHTTPClient(TestCase):
         _log.debug('Checking headers %s', client.session.headers)
         self.assertIn('Authorization', client.session.headers)
         self.assertEqual(client.session.headers['Authorization'], 'Bearer test')
+
+
+COUNTING_TOKEN_COMMAND = """
+import json, sys
+with open(sys.argv[1], "a") as f:
+    f.write("x")
+print(json.dumps({"credential": {"access_token": "token", "token_expiry": sys.argv[2]}}))
+"""
+
+
+class TestGCPAuthProvider(TestCase):
+
+    def setUp(self):
+        self.script = tempfile.NamedTemporaryFile("w", suffix=".py", delete=False)
+        self.script.write(COUNTING_TOKEN_COMMAND)
+        self.script.close()
+        self.counter = tempfile.mktemp()
+
+    def tearDown(self):
+        os.remove(self.script.name)
+        if os.path.exists(self.counter):
+            os.remove(self.counter)
+
+    def calls(self):
+        if not os.path.exists(self.counter):
+            return 0
+        with open(self.counter) as f:
+            return len(f.read())
+
+    def provider(self, expiry):
+        config = copy.deepcopy(BASE_CONFIG)
+        config["users"][0]["user"] = {
+            "auth-provider": {
+                "name": "gcp",
+                "config": {
+                    "cmd-path": sys.executable,
+                    "cmd-args": "{} {} {}".format(self.script.name, self.counter, expiry),
+                    "token-key": "{.credential.access_token}",
+                    "expiry-key": "{.credential.token_expiry}",
+                },
+            },
+        }
+        return pykube.http.auth_provider(pykube.KubeConfig(doc=config))
+
+    def test_parse_expiry(self):
+        parse_expiry = pykube.http.parse_expiry
+        self.assertEqual(parse_expiry("2016-08-24T16:19:17Z"), datetime.datetime(2016, 8, 24, 16, 19, 17))
+        self.assertEqual(
+            parse_expiry("2016-08-24T16:19:17.19878675-07:00"),
+            datetime.datetime(2016, 8, 24, 23, 19, 17),
+        )
+        self.assertIsNone(parse_expiry("soon"))
+        self.assertIsNone(parse_expiry(None))
+
+    def test_token_is_cached_until_expiry(self):
+        provider = self.provider("2999-01-01T00:00:00Z")
+        self.assertEqual(provider.token(), "token")
+        self.assertEqual(provider.token(), "token")
+        self.assertEqual(self.calls(), 1)
+        provider.refresh("rejected-earlier")
+        self.assertEqual(self.calls(), 1)
+        provider.refresh("token")
+        self.assertEqual(self.calls(), 2)
+
+    def test_concurrent_refresh_happens_once(self):
+        provider = self.provider("2999-01-01T00:00:00Z")
+        threads = [threading.Thread(target=provider.token) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.calls(), 1)
+
+    def test_expired_token_is_refreshed(self):
+        provider = self.provider("2000-01-01T00:00:00Z")
+        provider.token()
+        provider.token()
+        self.assertEqual(self.calls(), 2)
+
+    def test_token_without_expiry_is_cached(self):
+        provider = self.provider("soon")
+        for _ in range(3):
+            self.assertEqual(provider.token(), "token")
+        self.assertEqual(self.calls(), 1)
+        # until the API server rejects it
+        provider.refresh("token")
+        self.assertEqual(self.calls(), 2)
+        # or for untimed_ttl
+        provider.untimed_ttl = datetime.timedelta(0)
+        provider.token()
+        self.assertEqual(self.calls(), 3)
+
+
+class ConcurrencyTrackingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            server.clients.add(self.client_address)
+        time.sleep(0.05)
+        with server.lock:
+            server.active -= 1
+        body = b'{"kind": "PodList", "items": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+
+class TestHTTPClientConcurrency(TestCase):
+
+    def setUp(self):
+        self.server = ThreadedHTTPServer(("127.0.0.1", 0), ConcurrencyTrackingHandler)
+        self.server.lock = threading.Lock()
+        self.server.active = self.server.max_active = 0
+        self.server.clients = set()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_threads_share_bounded_pool(self):
+        """
+        Many threads sharing one client saturate, but never exceed, the pool.
+        """
+        pool_size = 8
+        config = pykube.KubeConfig.from_url("http://127.0.0.1:{}".format(self.server.server_address[1]))
+        client = pykube.HTTPClient(config, pool_maxsize=pool_size, pool_block=True)
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(5):
+                    self.assertEqual(len(list(pykube.Pod.objects(client).iterator())), 0)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(32)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.server.max_active, pool_size)
+        self.assertLessEqual(len(self.server.clients), pool_size)
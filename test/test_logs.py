@@ -0,0 +1,105 @@
+"""
+pykube.logs unittests
+"""
+
+import itertools
+import json
+import time
+
+import requests.adapters
+from requests.models import Response
+from six.moves.urllib.parse import parse_qs, urlparse
+
+import pykube
+
+from . import TestCase
+from .test_query import BASE_CONFIG
+
+
+def running_pod(name, *containers):
+    return {
+        "metadata": {"name": name, "namespace": "default", "uid": "uid-" + name},
+        "status": {"containerStatuses": [
+            {"name": c, "containerID": "docker://{}-{}".format(name, c), "state": {"running": {}}}
+            for c in containers
+        ]},
+    }
+
+
+class RouteAdapter(requests.adapters.BaseAdapter):
+    """
+    Answers pod list, watch and log requests of a small fake cluster.
+    """
+
+    def __init__(self, pods, added, logs):
+        super(RouteAdapter, self).__init__()
+        self.pods = pods
+        self.added = list(added)
+        self.logs = logs
+        self.log_params = {}
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        params = parse_qs(url.query)
+        response = Response()
+        response.status_code = 200
+        if url.path.endswith("/log"):
+            pod = url.path.split("/")[-2]
+            self.log_params[(pod, params["container"][0])] = params
+            content = "".join(
+                "{} {}\n".format(ts, text) for ts, text in self.logs[(pod, params["container"][0])]
+            )
+            response.headers["content-type"] = "text/plain"
+        elif "watch" in params:
+            if not self.added:
+                # nothing more happens; keep the informer from spinning
+                time.sleep(0.1)
+            content = "\n".join(
+                json.dumps({"type": "ADDED", "object": dict(pod, metadata=dict(pod["metadata"], resourceVersion="2"))})
+                for pod in self.added
+            )
+            self.added = []
+            response.headers["content-type"] = "application/json"
+        else:
+            content = json.dumps({"kind": "PodList", "metadata": {"resourceVersion": "1"}, "items": self.pods})
+            response.headers["content-type"] = "application/json"
+        response._content = content.encode("utf-8")
+        response._content_consumed = True
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+class TestFollow(TestCase):
+
+    def setUp(self):
+        self.api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG))
+
+    def test_merges_pods_by_timestamp(self):
+        adapter = RouteAdapter(
+            pods=[running_pod("a", "web"), running_pod("b", "web", "sidecar")],
+            added=[running_pod("c", "web")],
+            logs={
+                ("a", "web"): [("2018-01-01T00:00:01Z", "a1"), ("2018-01-01T00:00:03.5Z", "a2")],
+                ("b", "web"): [("2018-01-01T00:00:02Z", "b1"), ("2018-01-01T00:00:03.25Z", "b2")],
+                ("b", "sidecar"): [("2018-01-01T00:00:00Z", "sidecar")],
+                ("c", "web"): [("2018-01-01T00:00:09Z", "c1")],
+            },
+        )
+        self.api.session.mount("http://", adapter)
+        query = pykube.Pod.objects(self.api).filter(selector={"app": "web"})
+        stream = pykube.logs.follow(query, container="web", tail_lines=10, window=0.5)
+        lines = list(itertools.islice(stream, 5))
+        stream.close()
+        self.assertEqual(
+            [(line.pod, line.container, line.text) for line in lines],
+            [("a", "web", "a1"), ("b", "web", "b1"), ("b", "web", "b2"), ("a", "web", "a2"), ("c", "web", "c1")],
+        )
+        self.assertEqual(lines[0].timestamp, "2018-01-01T00:00:01Z")
+        self.assertEqual(set(adapter.log_params), {("a", "web"), ("b", "web"), ("c", "web")})
+        # pods present at the start are tailed, later ones followed from the start
+        self.assertEqual(adapter.log_params[("a", "web")]["tailLines"], ["10"])
+        self.assertNotIn("tailLines", adapter.log_params[("c", "web")])
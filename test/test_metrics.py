@@ -0,0 +1,171 @@
+"""
+pykube.metrics unittests
+"""
+
+import io
+import json
+
+import requests
+from requests.models import Response
+from urllib3.response import HTTPResponse
+
+import pykube
+from pykube.metrics import Collector, Histogram, RequestInfo
+from pykube.ratelimit import Retry
+
+from . import TestCase
+from .test_query import BASE_CONFIG, StubAdapter
+
+
+SERVER = "http://localhost"
+
+
+def pod_list(*names):
+    return {
+        "kind": "PodList",
+        "metadata": {},
+        "items": [{"metadata": {"name": name, "namespace": "default"}} for name in names],
+    }
+
+
+class ChunkedAdapter(requests.adapters.BaseAdapter):
+    """
+    Answers with ``body`` streamed as a chunked response would be, without a
+    Content-Length.
+    """
+
+    def __init__(self, body):
+        super(ChunkedAdapter, self).__init__()
+        self.body = body
+
+    def send(self, request, **kwargs):
+        response = Response()
+        response.status_code = 200
+        response.headers["content-type"] = "application/json"
+        response.raw = HTTPResponse(body=io.BytesIO(self.body), preload_content=False)
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+class TestRequestInfo(TestCase):
+
+    def test_parse(self):
+        cases = [
+            ("GET", "/api/v1/namespaces/default/pods", ("list", "v1", "default", "pods", None, None)),
+            ("GET", "/api/v1/namespaces/default/pods?watch=true", ("watch", "v1", "default", "pods", None, None)),
+            ("GET", "/api/v1/namespaces/default/pods/web/log", ("get", "v1", "default", "pods", "web", "log")),
+            ("PATCH", "/apis/apps/v1/namespaces/ns/deployments/web/scale",
+             ("patch", "apps/v1", "ns", "deployments", "web", "scale")),
+            ("POST", "/api/v1/nodes", ("create", "v1", None, "nodes", None, None)),
+            ("DELETE", "/api/v1/namespaces/gone", ("delete", "v1", None, "namespaces", "gone", None)),
+            ("PUT", "/api/v1/namespaces/gone/finalize", ("update", "v1", None, "namespaces", "gone", "finalize")),
+            ("GET", "/apis/apps/v1", ("list", "apps/v1", None, None, None, None)),
+            ("GET", "/version", ("get", None, None, None, None, None)),
+        ]
+        for method, path, expected in cases:
+            info = RequestInfo(method, SERVER + path, SERVER)
+            self.assertEqual(
+                (info.verb, info.api_version, info.namespace, info.resource, info.name, info.subresource),
+                expected,
+                msg=path,
+            )
+
+
+class TestHistogram(TestCase):
+
+    def test_quantile(self):
+        histogram = Histogram(buckets=(1, 2, 4))
+        for value in [0.5] * 50 + [1.5] * 49 + [3]:
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [(1, 50), (2, 99), (4, 100), (float("inf"), 100)])
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.0)
+        self.assertTrue(2 < histogram.quantile(0.995) <= 4)
+        self.assertIsNone(Histogram().quantile(0.5))
+
+
+class TestHooks(TestCase):
+
+    def client(self, responses):
+        api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG), discovery_cache_dir=None,
+                                retry=Retry(backoff=0, max_backoff=0))
+        adapter = StubAdapter(responses)
+        api.session.mount("http://", adapter)
+        return api, adapter
+
+    def test_before_and_after(self):
+        api, _ = self.client([
+            (429, {"kind": "Status", "message": "too many requests"}),
+            (200, pod_list("a", "b")),
+            (201, {"metadata": {"name": "c"}}),
+        ])
+        seen = []
+        api.add_request_hook(before=lambda info: seen.append(("before", info.verb, info.status)),
+                             after=lambda info: seen.append(("after", info.verb, info.status, info.retries,
+                                                             info.bytes_received)))
+        self.assertEqual(len(list(pykube.Pod.objects(api, namespace="default"))), 2)
+        pykube.Pod(api, {"metadata": {"name": "c", "namespace": "default"}}).create()
+        self.assertEqual(seen[0], ("before", "list", None))
+        self.assertEqual(seen[1][:4], ("after", "list", 200, 1))
+        self.assertGreater(seen[1][4], 0)
+        self.assertEqual(seen[2], ("before", "create", None))
+        self.assertEqual(seen[3][:4], ("after", "create", 201, 0))
+
+    def test_streamed_bytes(self):
+        body = json.dumps(pod_list("a", "b", "c")).encode("utf-8")
+        api, _ = self.client([])
+        api.session.mount("http://", ChunkedAdapter(body))
+        seen = []
+        api.add_request_hook(after=seen.append)
+        self.assertEqual(len(list(pykube.Pod.objects(api, namespace="default").iterator(page_size=None))), 3)
+        self.assertEqual([(info.verb, info.bytes_received) for info in seen], [("list", len(body))])
+        # read in part, counted once closed
+        r = api.get(url="pods", namespace="default", stream=True)
+        r.raw.read(10)
+        self.assertEqual(len(seen), 1)
+        r.close()
+        self.assertEqual(seen[1].bytes_received, 10)
+
+    def test_error(self):
+        api, _ = self.client([requests.exceptions.ConnectionError("refused")])
+        api.retry = None
+        seen = []
+        api.add_request_hook(after=seen.append)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            api.get(url="pods")
+        self.assertIsInstance(seen[0].error, requests.exceptions.ConnectionError)
+        self.assertIsNone(seen[0].status)
+
+    def test_remove(self):
+        api, adapter = self.client([(200, pod_list())] * 2)
+        seen = []
+        api.add_request_hook(after=seen.append)
+        api.get(url="pods")
+        api.remove_request_hook(after=seen.append)
+        api.get(url="pods")
+        self.assertEqual(len(seen), 1)
+
+    def test_collector(self):
+        api, _ = self.client([
+            (503, {"kind": "Status", "message": "unavailable"}),
+            (200, pod_list("a")),
+            (200, pod_list("a")),
+            (404, {"kind": "Status", "message": "not found"}),
+        ])
+        collector = Collector()
+        api.add_request_hook(after=collector.observe)
+        api.get(url="pods", namespace="default")
+        api.get(url="pods", namespace="default")
+        api.get(url="pods/missing", namespace="default")
+        text = collector.to_prometheus()
+        self.assertIn("# TYPE pykube_request_duration_seconds histogram", text)
+        self.assertIn('pykube_request_duration_seconds_count{verb="list",resource="pods",code="200"} 2', text)
+        self.assertIn('pykube_request_duration_seconds_bucket{verb="get",resource="pods",code="404",le="+Inf"} 1',
+                      text)
+        self.assertIn('pykube_request_retries_total{verb="list",resource="pods",code="200"} 1', text)
+        self.assertIn('pykube_request_ttfb_seconds_count{verb="list",resource="pods",code="200"} 2', text)
+        collector.reset()
+        self.assertNotIn("code=", collector.to_prometheus())
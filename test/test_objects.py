@@ -0,0 +1,398 @@
+"""
+pykube.objects unittests
+"""
+
+import json
+import os
+import tempfile
+
+import requests.exceptions
+from requests.models import Response
+from six.moves.urllib.parse import parse_qs, urlparse
+
+import pykube
+from pykube.testing import FakeAPI
+
+from . import TestCase
+from .test_query import BASE_CONFIG, StubAdapter
+
+
+class TestAPIObject(TestCase):
+
+    def setUp(self):
+        self.api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG))
+
+    def pod(self):
+        return pykube.Pod(self.api, {
+            "metadata": {"name": "a", "namespace": "default", "labels": {"app": "web"}},
+            "spec": {"nodeName": "node-1"},
+            "status": {"conditions": [{"type": "Ready", "status": "True"}]},
+        })
+
+    def test_reading_does_not_snapshot(self):
+        pod = self.pod()
+        self.assertEqual((pod.name, pod.namespace, pod.ready), ("a", "default", True))
+        self.assertIsNone(pod._snapshot)
+        self.assertIs(pod._original_obj, pod._obj)
+
+    def test_snapshot_on_first_mutable_access(self):
+        pod = self.pod()
+        pod.obj["spec"]["nodeName"] = "node-2"
+        self.assertEqual(pod._original_obj["spec"]["nodeName"], "node-1")
+        self.assertEqual(pod.obj["spec"]["nodeName"], "node-2")
+
+    def test_metadata_snapshots_only_the_metadata(self):
+        pod = self.pod()
+        self.assertEqual(pod.labels, {"app": "web"})
+        self.assertIsNone(pod._snapshot)
+        self.assertIs(pod._original_obj["spec"], pod._obj["spec"])
+        pod.labels["app"] = "db"
+        self.assertEqual(pod._original_obj["metadata"]["labels"], {"app": "web"})
+        # handing out the rest later keeps the original metadata
+        pod.obj["spec"]["nodeName"] = "node-2"
+        self.assertEqual(pod._original_obj["metadata"]["labels"], {"app": "web"})
+        self.assertEqual(pod._original_obj["spec"]["nodeName"], "node-1")
+
+    def test_assigning_obj_keeps_original(self):
+        pod = self.pod()
+        original = pod._obj
+        pod.obj = {"metadata": {"name": "b"}}
+        self.assertIs(pod._original_obj, original)
+        self.assertEqual(pod.name, "b")
+
+
+class TestUpdate(TestCase):
+
+    def setUp(self):
+        self.api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG))
+
+    def config_map(self):
+        return pykube.ConfigMap(self.api, {
+            "metadata": {"name": "a", "namespace": "default", "resourceVersion": "3", "labels": {"app": "web"}},
+            "data": {"big": "x" * 1000},
+        })
+
+    def mount(self, responses):
+        adapter = StubAdapter(responses)
+        self.api.session.mount("http://", adapter)
+        return adapter
+
+    def test_unchanged_object_sends_nothing(self):
+        adapter = self.mount([])
+        config_map = self.config_map()
+        config_map.update()
+        config_map.obj["data"]["big"] = config_map.obj["data"]["big"]
+        config_map.update()
+        self.assertEqual(adapter.requests, [])
+
+    def test_sends_minimal_patch(self):
+        adapter = self.mount([(200, {"metadata": {"name": "a", "resourceVersion": "4"}})])
+        config_map = self.config_map()
+        config_map.obj["metadata"]["labels"]["app"] = "db"
+        config_map.update(optimistic=True)
+        request = adapter.requests[0]
+        self.assertEqual(request.method, "PATCH")
+        self.assertEqual(request.headers["Content-Type"], "application/merge-patch+json")
+        self.assertEqual(
+            json.loads(request.body),
+            {"metadata": {"labels": {"app": "db"}, "resourceVersion": "3"}},
+        )
+        self.assertEqual(config_map.metadata["resourceVersion"], "4")
+
+    def test_sends_label_changes(self):
+        adapter = self.mount([(200, {"metadata": {"name": "a", "resourceVersion": "4"}})])
+        config_map = self.config_map()
+        config_map.annotations  # read only
+        config_map.update()
+        self.assertEqual(adapter.requests, [])
+        config_map.labels["app"] = "db"
+        config_map.update()
+        self.assertEqual(json.loads(adapter.requests[0].body), {"metadata": {"labels": {"app": "db"}}})
+
+
+class TestApply(TestCase):
+
+    def setUp(self):
+        self.api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG))
+
+    def test_apply(self):
+        adapter = StubAdapter([(200, {"metadata": {"name": "a", "resourceVersion": "1"}})])
+        self.api.session.mount("http://", adapter)
+        config_map = pykube.ConfigMap(self.api, {
+            "metadata": {"name": "a", "managedFields": [{"manager": "other"}]},
+            "data": {"key": "value"},
+        })
+        config_map.apply(field_manager="deployer", force=True)
+        request = adapter.requests[0]
+        self.assertEqual(request.method, "PATCH")
+        self.assertEqual(request.headers["Content-Type"], "application/apply-patch+yaml")
+        self.assertEqual(adapter.params[0], {"fieldManager": ["deployer"], "force": ["true"]})
+        self.assertEqual(json.loads(request.body), {
+            "apiVersion": "v1",
+            "kind": "ConfigMap",
+            "metadata": {"name": "a"},
+            "data": {"key": "value"},
+        })
+        self.assertEqual(config_map.metadata["resourceVersion"], "1")
+
+    def test_apply_manifests(self):
+        adapter = StubAdapter([
+            (200, {"metadata": {"name": "web", "namespace": "prod"}}),
+            (200, {"metadata": {"name": "web"}}),
+        ])
+        self.api.session.mount("http://", adapter)
+        manifest = tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False)
+        manifest.write(MANIFEST)
+        manifest.close()
+        try:
+            applied = pykube.apply(self.api, manifest.name)
+        finally:
+            os.remove(manifest.name)
+        self.assertEqual([type(obj) for obj in applied], [pykube.Service, pykube.Namespace])
+        self.assertEqual(
+            [r.url.split("?")[0] for r in adapter.requests],
+            [
+                "http://localhost:8080/api/v1/namespaces/prod/services/web",
+                "http://localhost:8080/api/v1/namespaces/web",
+            ],
+        )
+
+
+MANIFEST = """
+apiVersion: v1
+kind: Service
+metadata:
+  name: web
+  namespace: prod
+spec:
+  ports:
+  - port: 80
+---
+apiVersion: v1
+kind: Namespace
+metadata:
+  name: web
+"""
+
+
+class DroppingStream(object):
+    """
+    A response body read in small pieces that, if `drop`, breaks off like a
+    lost connection instead of ending.
+    """
+
+    def __init__(self, data, drop):
+        self.data = data
+        self.drop = drop
+
+    def read(self, amt=None):
+        if not self.data:
+            if self.drop:
+                raise requests.exceptions.ChunkedEncodingError("connection broken")
+            return b""
+        chunk, self.data = self.data[:5], self.data[5:]
+        return chunk
+
+    def close(self):
+        pass
+
+
+class LogAdapter(StubAdapter):
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        self.params.append(parse_qs(urlparse(request.url).query))
+        data, drop = self.responses.pop(0)
+        response = Response()
+        response.status_code = 200
+        response.headers["content-type"] = "text/plain"
+        response.raw = DroppingStream(data, drop)
+        response.request = request
+        response.url = request.url
+        return response
+
+
+class TestStreamLogs(TestCase):
+
+    def setUp(self):
+        self.api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG))
+        self.pod = pykube.Pod(self.api, {"metadata": {"name": "a", "namespace": "default"}})
+
+    def mount(self, responses):
+        adapter = LogAdapter(responses)
+        self.api.session.mount("http://", adapter)
+        return adapter
+
+    def test_resumes_after_disconnect(self):
+        adapter = self.mount([
+            (b"2018-01-01T00:00:01.5Z a\n2018-01-01T00:00:02Z b\n2018-01-01T00:00:02Z c\n", True),
+            # sinceTime has a resolution of seconds, so b and c are sent again
+            (b"2018-01-01T00:00:02Z b\n2018-01-01T00:00:02Z c\n2018-01-01T00:00:02Z d\n"
+             b"2018-01-01T00:00:03.25Z e\n", False),
+        ])
+        lines = list(self.pod.stream_logs(container="web", tail_lines=10))
+        self.assertEqual(lines, ["a", "b", "c", "d", "e"])
+        self.assertEqual(adapter.params[0], {
+            "container": ["web"], "follow": ["true"], "timestamps": ["true"], "tailLines": ["10"],
+        })
+        self.assertEqual(adapter.params[1], {
+            "container": ["web"], "follow": ["true"], "timestamps": ["true"],
+            "sinceTime": ["2018-01-01T00:00:02Z"],
+        })
+
+    def test_timestamps_and_chunks(self):
+        self.mount([(b"2018-01-01T00:00:01Z a\n", False), (b"0123456789", False)])
+        self.assertEqual(list(self.pod.stream_logs(timestamps=True)), ["2018-01-01T00:00:01Z a"])
+        self.assertEqual(list(self.pod.stream_logs(follow=False, lines=False, chunk_size=4)), [b"01234", b"56789"])
+
+    def test_carriage_returns_stay_in_the_line(self):
+        self.mount([(b"2018-01-01T00:00:01Z downloading 10%\rdownloading 20%\n"
+                     b"unable to retrieve container logs\n", False)])
+        self.assertEqual(list(self.pod.stream_logs(tail_lines=10)), [
+            "downloading 10%\rdownloading 20%",
+            # lines without a timestamp are passed on whole
+            "unable to retrieve container logs",
+        ])
+
+    def test_no_follow_does_not_reconnect(self):
+        self.mount([(b"a\nb", True)])
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            list(self.pod.stream_logs(follow=False))
+
+
+class TestObjectFactory(TestCase):
+
+    def setUp(self):
+        self.api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG), discovery_cache_dir=None)
+        self.adapter = StubAdapter([(200, {
+            "kind": "APIResourceList",
+            "groupVersion": "networking.k8s.io/v1",
+            "resources": [
+                {"name": "networkpolicies", "singularName": "", "kind": "NetworkPolicy", "namespaced": True},
+                {"name": "networkpolicies/status", "kind": "NetworkPolicy", "namespaced": True},
+                {"name": "ingressclasses", "singularName": "", "kind": "IngressClass", "namespaced": False},
+            ],
+        })])
+        self.api.session.mount("http://", self.adapter)
+
+    def test_memoized(self):
+        NetworkPolicy = pykube.object_factory(self.api, "networking.k8s.io/v1", "NetworkPolicy")
+        self.assertIs(pykube.object_factory(self.api, "networking.k8s.io/v1", "NetworkPolicy"), NetworkPolicy)
+        self.assertIs(pykube.object_factory(self.api, "networking.k8s.io/v1", "networkpolicies"), NetworkPolicy)
+        self.assertEqual(NetworkPolicy.endpoint, "networkpolicies")
+        self.assertTrue(issubclass(NetworkPolicy, pykube.objects.NamespacedAPIObject))
+        self.assertEqual(len(self.adapter.requests), 1)
+
+    def test_all(self):
+        classes = pykube.object_factory_all(self.api, "networking.k8s.io/v1")
+        self.assertEqual(sorted(classes), ["IngressClass", "NetworkPolicy"])
+        self.assertIs(classes["IngressClass"], pykube.object_factory(self.api, "networking.k8s.io/v1", "IngressClass"))
+        self.assertFalse(issubclass(classes["IngressClass"], pykube.objects.NamespacedAPIObject))
+
+    def test_unknown_kind(self):
+        self.adapter.responses.append((200, {"resources": []}))
+        with self.assertRaises(ValueError):
+            pykube.object_factory(self.api, "networking.k8s.io/v1", "Widget")
+        self.assertEqual(len(self.adapter.requests), 2)
+
+
+class TestScale(TestCase):
+
+    def setUp(self):
+        self.api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG))
+
+    def mount(self, responses):
+        adapter = StubAdapter(responses)
+        self.api.session.mount("http://", adapter)
+        return adapter
+
+    def deployment(self, name="web", replicas=1):
+        return pykube.Deployment(self.api, {
+            "metadata": {"name": name, "namespace": "default", "generation": 1},
+            "spec": {"replicas": replicas},
+            "status": {"observedGeneration": 1, "replicas": replicas},
+        })
+
+    def state(self, replicas, generation=2):
+        return {
+            "metadata": {"name": "web", "namespace": "default", "generation": 2},
+            "spec": {"replicas": 3},
+            "status": {"observedGeneration": generation, "replicas": replicas},
+        }
+
+    def test_scale_and_watch(self):
+        adapter = self.mount([
+            (200, {"kind": "Scale", "spec": {"replicas": 3}}),
+            (200, {"kind": "DeploymentList", "metadata": {"resourceVersion": "5"}, "items": [self.state(1, 1)]}),
+            (200, [
+                {"type": "MODIFIED", "object": self.state(2)},
+                {"type": "MODIFIED", "object": self.state(3)},
+            ]),
+        ])
+        deployment = self.deployment()
+        deployment.scale(3, wait=True, timeout=10)
+        patch, _, watch = adapter.requests
+        self.assertEqual((patch.method, patch.url),
+                         ("PATCH", "http://localhost:8080/apis/extensions/v1beta1/namespaces/default/deployments/web/scale"))
+        self.assertEqual(json.loads(patch.body), {"spec": {"replicas": 3}})
+        self.assertEqual(adapter.params[1]["fieldSelector"], ["metadata.name=web"])
+        self.assertEqual(adapter.params[2]["resourceVersion"], ["5"])
+        self.assertEqual(deployment.obj["status"]["replicas"], 3)
+
+    def test_no_wait(self):
+        adapter = self.mount([(200, {"kind": "Scale", "spec": {"replicas": 3}})])
+        deployment = self.deployment()
+        deployment.scale(3)
+        self.assertEqual(len(adapter.requests), 1)
+        self.assertEqual(deployment.replicas, 3)
+        # the count was sent, so it is not a pending change
+        deployment.update()
+        self.assertEqual(len(adapter.requests), 1)
+
+    def test_keeps_pending_spec_edits(self):
+        fake = FakeAPI()
+        api = fake.client()
+        pykube.Deployment(api, {
+            "metadata": {"name": "web"},
+            "spec": {"replicas": 1, "template": {"spec": {"containers": [{"name": "web", "image": "web:v1"}]}}},
+        }).create()
+        deployment = pykube.Deployment.objects(api).get(name="web")
+        deployment.obj["spec"]["template"]["spec"]["containers"][0]["image"] = "web:v2"
+        deployment.scale(3, wait=False)
+        deployment.update()
+        stored = fake.get(pykube.Deployment.version, "Deployment", "web", "default")
+        self.assertEqual(stored["spec"]["template"]["spec"]["containers"][0]["image"], "web:v2")
+        self.assertEqual(stored["spec"]["replicas"], 3)
+
+    def test_falls_back_to_patching_the_object(self):
+        adapter = self.mount([
+            (404, b"404 page not found"),
+            (200, {"metadata": {"name": "web"}, "spec": {"replicas": 3}}),
+        ])
+        self.deployment().scale(3, wait=False)
+        self.assertTrue(adapter.requests[1].url.endswith("/deployments/web"))
+        self.assertEqual(json.loads(adapter.requests[1].body), {"spec": {"replicas": 3}})
+
+    def test_job_patches_parallelism(self):
+        adapter = self.mount([(200, {"metadata": {"name": "j"}, "spec": {"parallelism": 4}})])
+        job = pykube.Job(self.api, {"metadata": {"name": "j", "namespace": "default"}, "spec": {"parallelism": 1}})
+        job.scale(4, wait=False)
+        self.assertTrue(adapter.requests[0].url.endswith("/jobs/j"))
+        self.assertEqual(json.loads(adapter.requests[0].body), {"spec": {"parallelism": 4}})
+
+    def test_timeout(self):
+        listed = (200, {"kind": "DeploymentList", "metadata": {"resourceVersion": "5"}, "items": [self.state(1)]})
+        adapter = self.mount([(200, {"kind": "Scale"}), listed])
+        with self.assertRaises(pykube.WaitTimeout):
+            self.deployment().scale(3, wait=True, timeout=0)
+        self.assertEqual(len(adapter.requests), 2)
+
+    def test_scale_many(self):
+        adapter = self.mount([(200, {"kind": "Scale"})] * 3)
+        deployments = [self.deployment(name) for name in ("a", "b", "c")]
+        pykube.scale_many(deployments, [2, 3, 4], wait=False)
+        self.assertEqual([d.replicas for d in deployments], [2, 3, 4])
+        self.assertEqual(
+            sorted(r.url.rsplit("/", 2)[1] for r in adapter.requests),
+            ["a", "b", "c"],
+        )
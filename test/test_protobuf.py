@@ -0,0 +1,292 @@
+"""
+pykube.protobuf unittests
+"""
+import binascii
+import json
+import threading
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse
+
+import pykube
+from pykube import protobuf
+
+from . import TestCase
+
+
+def varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def field(number, payload):
+    if isinstance(payload, int):
+        return varint(number << 3) + varint(payload)
+    if not isinstance(payload, bytes):
+        payload = payload.encode("utf-8")
+    return varint(number << 3 | 2) + varint(len(payload)) + payload
+
+
+# a ConfigMap in the byte layout of the API server's generated marshaller:
+# fields in number order, empty strings and zero values of non-pointer
+# fields included, managedFields holding raw JSON
+RECORDED_CONFIGMAP = binascii.unhexlify(
+    "6b3873000a0f0a0276311209436f6e6669674d617012f1010abe010a0a776562"
+    "2d636f6e66696712001a0764656661756c7422002a2436623366633061312d32"
+    "6434652d346637612d396331622d306535643861376633633231320435313230"
+    "380042080880a0f8fa0510005a0a0a0361707012037765627a008a015c0a0e6b"
+    "75626563746c2d63726561746512065570646174651a02763122080880a0f8fa"
+    "05100032084669656c647356313a280a267b22663a64617461223a7b222e223a"
+    "7b7d2c22663a636f6e6669672e79616d6c223a7b7d7d7d4200121a0a0b636f6e"
+    "6669672e79616d6c120b706f72743a20383038300a12120a046d6f6465120a70"
+    "726f64756374696f6e1a002200"
+)
+
+DECODED_CONFIGMAP = {
+    "apiVersion": "v1",
+    "kind": "ConfigMap",
+    "metadata": {
+        "name": "web-config",
+        "namespace": "default",
+        "uid": "6b3fc0a1-2d4e-4f7a-9c1b-0e5d8a7f3c21",
+        "resourceVersion": "5120",
+        "creationTimestamp": "2020-09-13T12:26:40Z",
+        "labels": {"app": "web"},
+        "managedFields": [{
+            "manager": "kubectl-create",
+            "operation": "Update",
+            "apiVersion": "v1",
+            "time": "2020-09-13T12:26:40Z",
+            "fieldsType": "FieldsV1",
+            "fieldsV1": {"f:data": {".": {}, "f:config.yaml": {}}},
+        }],
+    },
+    "data": {"config.yaml": "port: 8080\n", "mode": "production"},
+}
+
+
+def pod(name, resource_version="1"):
+    return {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {"name": name, "namespace": "default", "resourceVersion": resource_version},
+        "spec": {"containers": [{"name": "web", "image": "nginx", "resources": {}}]},
+        "status": {"phase": "Pending"},
+    }
+
+
+def configmap(name, resource_version="1"):
+    return {
+        "apiVersion": "v1",
+        "kind": "ConfigMap",
+        "metadata": {"name": name, "namespace": "default", "resourceVersion": resource_version},
+        "data": {"key": "value"},
+    }
+
+
+class TestProtobuf(TestCase):
+
+    def test_decode_recorded_configmap(self):
+        self.assertEqual(protobuf.loads(RECORDED_CONFIGMAP), DECODED_CONFIGMAP)
+
+    def test_round_trip(self):
+        objs = [
+            DECODED_CONFIGMAP,
+            {
+                "apiVersion": "v1",
+                "kind": "Namespace",
+                "metadata": {"name": "web", "labels": {"team": "a"}},
+                "spec": {"finalizers": ["kubernetes"]},
+                "status": {"phase": "Terminating", "conditions": [{
+                    "type": "NamespaceDeletionContentFailure", "status": "False",
+                    "lastTransitionTime": "2018-01-01T00:00:00Z", "reason": "ContentDeleted",
+                }]},
+            },
+            {
+                "apiVersion": "v1",
+                "kind": "Secret",
+                "metadata": {"name": "s", "namespace": "default"},
+                "data": {"password": "c2VjcmV0"},
+                "type": "Opaque",
+            },
+            {
+                "apiVersion": "v1",
+                "kind": "ConfigMapList",
+                "metadata": {"resourceVersion": "7", "continue": "abc"},
+                "items": [{"metadata": {"name": "a"}}],
+            },
+            {
+                "apiVersion": "v1",
+                "kind": "Status",
+                "status": "Failure",
+                "message": "invalid",
+                "reason": "Invalid",
+                "details": {"name": "a", "kind": "ConfigMap", "causes": [
+                    {"reason": "FieldValueInvalid", "message": "bad key", "field": "data[a b]"},
+                ]},
+                "code": 422,
+            },
+        ]
+        for obj in objs:
+            self.assertEqual(protobuf.loads(protobuf.dumps(obj)), obj)
+
+    def test_watch_frames(self):
+        stream = protobuf.dumps_event("ADDED", configmap("a")) + protobuf.dumps_event("DELETED", configmap("b"))
+        # frames arrive split at arbitrary points
+        chunks = [stream[i:i + 7] for i in range(0, len(stream), 7)]
+        events = [protobuf.loads_event(frame) for frame in protobuf.iter_frames(chunks)]
+        self.assertEqual(events, [
+            {"type": "ADDED", "object": configmap("a")},
+            {"type": "DELETED", "object": configmap("b")},
+        ])
+        with self.assertRaises(ValueError):
+            list(protobuf.iter_frames([stream[:-1]]))
+
+    def test_unknown_fields_are_refused(self):
+        # a field a newer API server might add to ConfigMap
+        obj = configmap("a")
+        type_meta = field(1, "v1") + field(2, "ConfigMap")
+        raw = protobuf._schemas[("v1", "ConfigMap")].encode(obj)
+        self.assertEqual(protobuf.loads(protobuf.MAGIC + field(1, type_meta) + field(2, raw)), obj)
+        data = protobuf.MAGIC + field(1, type_meta) + field(2, raw + field(9, "new"))
+        with self.assertRaises(protobuf.UnknownFieldError):
+            protobuf.loads(data)
+
+    def test_supports(self):
+        self.assertTrue(protobuf.supports(pykube.ConfigMap))
+        self.assertFalse(protobuf.supports(pykube.Deployment))
+        # no schemas for them
+        self.assertFalse(protobuf.supports(pykube.Pod))
+        self.assertFalse(protobuf.supports(pykube.Node))
+
+
+class ReplayHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Replays the recorded response for a path, as protobuf when it was asked
+    for and recorded, as JSON otherwise.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        key = url.path + ("?watch" if "watch=true" in url.query else "")
+        accept = self.headers.get("Accept", "")
+        self.server.accepts.append((key, accept))
+        recorded = self.server.recorded[key]
+        if protobuf.CONTENT_TYPE in accept and "protobuf" in recorded:
+            content_type, body = recorded["protobuf"]
+        else:
+            content_type, body = "application/json", recorded["json"]
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+
+class TestProtobufNegotiation(TestCase):
+
+    def setUp(self):
+        cm_list = {"apiVersion": "v1", "kind": "ConfigMapList", "metadata": {"resourceVersion": "10"},
+                   "items": [configmap("a"), configmap("b")]}
+        self.server = ThreadedHTTPServer(("127.0.0.1", 0), ReplayHandler)
+        self.server.accepts = []
+        self.server.recorded = {
+            "/api/v1/namespaces/default/configmaps": {
+                "protobuf": (protobuf.CONTENT_TYPE, protobuf.dumps(cm_list)),
+                "json": json.dumps(cm_list).encode("utf-8"),
+            },
+            "/api/v1/namespaces/default/configmaps/a": {
+                "protobuf": (protobuf.CONTENT_TYPE, protobuf.dumps(configmap("a"))),
+                "json": json.dumps(configmap("a")).encode("utf-8"),
+            },
+            "/api/v1/namespaces/default/configmaps?watch": {
+                "protobuf": (protobuf.CONTENT_TYPE + ";stream=watch", (
+                    protobuf.dumps_event("MODIFIED", configmap("a", "11")) +
+                    protobuf.dumps_event("BOOKMARK", {"apiVersion": "v1", "kind": "ConfigMap",
+                                                      "metadata": {"resourceVersion": "12"}})
+                )),
+            },
+            # the server can't serve this kind as protobuf
+            "/api/v1/namespaces/default/secrets": {
+                "json": json.dumps({"kind": "SecretList", "metadata": {},
+                                    "items": [{"metadata": {"name": "s"}}]}).encode("utf-8"),
+            },
+            "/api/v1/namespaces/default/pods": {
+                "json": json.dumps({"kind": "PodList", "metadata": {},
+                                    "items": [pod("p")]}).encode("utf-8"),
+            },
+            # a newer server, sending a field the client does not know
+            "/api/v1/namespaces": {
+                "protobuf": (protobuf.CONTENT_TYPE, protobuf.MAGIC + field(1, field(1, "v1") + field(2, "NamespaceList")) +
+                             field(2, field(2, field(1, field(1, "web")) + field(9, "new")))),
+                "json": json.dumps({"kind": "NamespaceList", "metadata": {},
+                                    "items": [{"metadata": {"name": "web"}, "spec": {"new": True}}]}).encode("utf-8"),
+            },
+            "/api/v1/namespaces/default/services": {
+                "json": json.dumps({"kind": "ServiceList", "metadata": {},
+                                    "items": [{"metadata": {"name": "s"}}]}).encode("utf-8"),
+            },
+        }
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        config = pykube.KubeConfig.from_url("http://127.0.0.1:{}".format(self.server.server_address[1]))
+        self.api = pykube.HTTPClient(config, content_type="protobuf")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        protobuf._fallen_back.clear()
+
+    def test_list_get_and_watch(self):
+        query = pykube.ConfigMap.objects(self.api, namespace="default")
+        self.assertEqual([c.name for c in query.iterator()], ["a", "b"])
+        self.assertEqual([c.name for c in query], ["a", "b"])
+        self.assertEqual(query.response["metadata"]["resourceVersion"], "10")
+        self.assertEqual(query.get(name="a").obj, configmap("a"))
+        watch = query.watch(since="10", reconnect=False)
+        events = list(watch)
+        self.assertEqual([(e.type, e.object.name) for e in events], [("MODIFIED", "a")])
+        self.assertEqual(watch.resource_version, "12")
+        self.assertTrue(all(accept.startswith(protobuf.CONTENT_TYPE) for _, accept in self.server.accepts))
+        self.assertIn(protobuf.CONTENT_TYPE + ";stream=watch", self.server.accepts[-1][1])
+
+    def test_json_fallback(self):
+        self.assertEqual([s.name for s in pykube.Secret.objects(self.api, namespace="default")], ["s"])
+        self.assertEqual([s.name for s in pykube.Service.objects(self.api, namespace="default")], ["s"])
+        pods = list(pykube.Pod.objects(self.api, namespace="default"))
+        self.assertEqual(pods[0].obj, pod("p"))
+        accepts = dict(self.server.accepts)
+        self.assertIn(protobuf.CONTENT_TYPE, accepts["/api/v1/namespaces/default/secrets"])
+        # no schema for services and pods, so protobuf is not asked for
+        self.assertNotIn(protobuf.CONTENT_TYPE, accepts["/api/v1/namespaces/default/services"])
+        self.assertNotIn(protobuf.CONTENT_TYPE, accepts["/api/v1/namespaces/default/pods"])
+
+    def test_unknown_fields_fall_back_to_json(self):
+        namespaces = list(pykube.Namespace.objects(self.api))
+        self.assertEqual(namespaces[0].obj["spec"], {"new": True})
+        self.assertEqual([n.name for n in pykube.Namespace.objects(self.api)], ["web"])
+        accepts = [accept for key, accept in self.server.accepts if key == "/api/v1/namespaces"]
+        self.assertIn(protobuf.CONTENT_TYPE, accepts[0])
+        # the kind is read as JSON from then on
+        self.assertEqual(len(accepts), 3)
+        self.assertTrue(all(protobuf.CONTENT_TYPE not in accept for accept in accepts[1:]))
+        self.assertFalse(protobuf.supports(pykube.Namespace))
+
+    def test_invalid_content_type(self):
+        with self.assertRaises(ValueError):
+            pykube.HTTPClient(self.api.config, content_type="yaml")
@@ -0,0 +1,278 @@
+"""
+pykube.query unittests
+"""
+
+import itertools
+import json
+
+import requests.adapters
+import requests.exceptions
+from requests.models import Response
+from six.moves.urllib.parse import parse_qs, urlparse
+
+import pykube
+
+from . import TestCase
+
+BASE_CONFIG = {
+    "clusters": [
+        {
+            "name": "test-cluster",
+            "cluster": {
+                "server": "http://localhost:8080",
+            }
+        }
+    ],
+    "contexts": [
+        {
+            "name": "test-cluster",
+            "context": {
+                "cluster": "test-cluster",
+                "namespace": "default",
+            }
+        }
+    ],
+    "current-context": "test-cluster",
+}
+
+
+class StubAdapter(requests.adapters.BaseAdapter):
+    """
+    Answers each request with the next (status, payload[, headers]) from
+    `responses`, or raises it if it is an exception, and records the query
+    parameters it was sent. A watch stream (a list of events) ending with an
+    exception breaks off with it once the events were read.
+    """
+
+    def __init__(self, responses):
+        super(StubAdapter, self).__init__()
+        self.responses = list(responses)
+        self.requests = []
+        self.params = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        self.params.append(parse_qs(urlparse(request.url).query))
+        entry = self.responses.pop(0)
+        if isinstance(entry, Exception):
+            raise entry
+        status, payload = entry[:2]
+        response = Response()
+        response.status_code = status
+        response.headers["content-type"] = "application/json"
+        if len(entry) > 2:
+            response.headers.update(entry[2])
+        if isinstance(payload, bytes):
+            # not from the API itself, like the 404 of an unknown route
+            response.headers["content-type"] = "text/plain; charset=utf-8"
+            content = payload
+        elif isinstance(payload, list) and payload and isinstance(payload[-1], Exception):
+            content = "\n".join(json.dumps(event) for event in payload[:-1]).encode("utf-8")
+            response.raw = BrokenStream(content + b"\n", payload[-1])
+            response.request = request
+            response.url = request.url
+            return response
+        elif isinstance(payload, list):
+            # a watch stream: one JSON document per line
+            content = "\n".join(json.dumps(event) for event in payload).encode("utf-8")
+        else:
+            content = json.dumps(payload).encode("utf-8")
+        response._content = content
+        response._content_consumed = True
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+class BrokenStream(object):
+    """
+    A response body that raises `error` once `content` was read.
+    """
+
+    def __init__(self, content, error):
+        self.content = content
+        self.error = error
+
+    def read(self, amount=None):
+        if self.content is None:
+            raise self.error
+        content, self.content = self.content, None
+        return content
+
+    def close(self):
+        pass
+
+
+def pod(name):
+    return {"metadata": {"name": name, "namespace": "default"}}
+
+
+def page(names, token=None):
+    return {
+        "kind": "PodList",
+        "metadata": {"continue": token} if token else {},
+        "items": [pod(name) for name in names],
+    }
+
+
+class TestQuery(TestCase):
+
+    def setUp(self):
+        self.api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG))
+
+    def mount(self, responses):
+        adapter = StubAdapter(responses)
+        self.api.session.mount("http://", adapter)
+        return adapter
+
+    def test_paginate(self):
+        adapter = self.mount([
+            (200, page(["a", "b"], token="t1")),
+            (200, page(["c"])),
+        ])
+        names = [p.name for p in pykube.Pod.objects(self.api).paginate(page_size=2)]
+        self.assertEqual(names, ["a", "b", "c"])
+        self.assertEqual(adapter.params[0], {"limit": ["2"]})
+        self.assertEqual(adapter.params[1], {"limit": ["2"], "continue": ["t1"]})
+
+    def test_interleaved_paginations(self):
+        adapter = self.mount([
+            (200, page(["a"], token="t1")),
+            (200, page(["x"], token="u1")),
+            (200, page(["b"])),
+            (200, page(["y"])),
+        ])
+        query = pykube.Pod.objects(self.api)
+        first, second = query.paginate(page_size=1), query.paginate(page_size=1)
+        self.assertEqual([next(first).name, next(second).name], ["a", "x"])
+        self.assertEqual([next(first).name, next(second).name], ["b", "y"])
+        self.assertEqual(adapter.params[2]["continue"], ["t1"])
+        self.assertEqual(adapter.params[3]["continue"], ["u1"])
+
+    def test_execute_raises_api_errors(self):
+        self.mount([(403, {"kind": "Status", "code": 403, "message": "pods is forbidden"})])
+        with self.assertRaises(pykube.exceptions.HTTPError) as cm:
+            pykube.Pod.objects(self.api).execute()
+        self.assertEqual(cm.exception.code, 403)
+        self.assertEqual(str(cm.exception), "pods is forbidden")
+
+    def test_paginate_relists_on_expired_token(self):
+        self.mount([
+            (200, page(["a", "b"], token="t1")),
+            (410, {"kind": "Status", "code": 410, "metadata": {}}),
+            (200, page(["a", "b"], token="t2")),
+            (200, page(["c"])),
+        ])
+        names = [p.name for p in pykube.Pod.objects(self.api).paginate(page_size=2)]
+        self.assertEqual(names, ["a", "b", "c"])
+
+    def test_paginate_uses_inconsistent_continue_token(self):
+        adapter = self.mount([
+            (200, page(["a"], token="t1")),
+            (410, {"kind": "Status", "code": 410, "metadata": {"continue": "t2"}}),
+            (200, page(["b"])),
+        ])
+        names = [p.name for p in pykube.Pod.objects(self.api).iterator()]
+        self.assertEqual(names, ["a", "b"])
+        self.assertEqual(adapter.params[2]["continue"], ["t2"])
+
+
+def event(type, name, resource_version):
+    obj = pod(name)
+    obj["metadata"]["resourceVersion"] = resource_version
+    return {"type": type, "object": obj}
+
+
+class TestWatchQuery(TestCase):
+
+    def setUp(self):
+        self.api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG))
+
+    def mount(self, responses):
+        adapter = StubAdapter(responses)
+        self.api.session.mount("http://", adapter)
+        return adapter
+
+    def test_reconnects_from_last_resource_version(self):
+        adapter = self.mount([
+            (200, [
+                event("ADDED", "a", "10"),
+                {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "15"}}},
+            ]),
+            (200, [event("MODIFIED", "a", "20")]),
+        ])
+        stream = pykube.Pod.objects(self.api).watch(since="5", timeout_seconds=60).object_stream()
+        events = [(e.type, e.object.name) for e in itertools.islice(stream, 2)]
+        self.assertEqual(events, [("ADDED", "a"), ("MODIFIED", "a")])
+        self.assertEqual(adapter.params[0]["resourceVersion"], ["5"])
+        self.assertEqual(adapter.params[0]["allowWatchBookmarks"], ["true"])
+        self.assertEqual(adapter.params[0]["timeoutSeconds"], ["60"])
+        self.assertEqual(adapter.params[1]["resourceVersion"], ["15"])
+
+    def test_relists_when_resource_version_expired(self):
+        adapter = self.mount([
+            (200, [{"type": "ERROR", "object": {"kind": "Status", "code": 410}}]),
+            (200, {"kind": "PodList", "metadata": {"resourceVersion": "30"}, "items": [pod("b")]}),
+            (200, [event("DELETED", "b", "31")]),
+        ])
+        stream = pykube.Pod.objects(self.api).watch(since="5").object_stream()
+        events = [(e.type, e.object.name) for e in itertools.islice(stream, 2)]
+        self.assertEqual(events, [("ADDED", "b"), ("DELETED", "b")])
+        self.assertNotIn("watch", adapter.params[1])
+        self.assertEqual(adapter.params[2]["resourceVersion"], ["30"])
+
+    def test_relist_deletes_objects_gone_meanwhile(self):
+        self.mount([
+            (200, [event("ADDED", "a", "10"), event("ADDED", "c", "11"), event("DELETED", "a", "12"),
+                   event("ADDED", "d", "13")]),
+            (410, {"kind": "Status", "code": 410}),
+            (200, {"kind": "PodList", "metadata": {"resourceVersion": "30"}, "items": [pod("b"), pod("d")]}),
+        ])
+        stream = pykube.Pod.objects(self.api).watch(since="5").object_stream()
+        events = [(e.type, e.object.name) for e in itertools.islice(stream, 7)]
+        self.assertEqual(events[4:], [("ADDED", "b"), ("ADDED", "d"), ("DELETED", "c")])
+
+    def test_relist_deletes_known_objects(self):
+        self.mount([
+            (410, {"kind": "Status", "code": 410}),
+            (200, {"kind": "PodList", "metadata": {"resourceVersion": "30"}, "items": [pod("b")]}),
+        ])
+        # kept by the caller, not the watch
+        known = {"default/c": pykube.Pod(self.api, pod("c"))}
+        query = pykube.Pod.objects(self.api).watch(since="5", known=known)
+        events = [(e.type, e.object.name) for e in itertools.islice(query.object_stream(), 2)]
+        self.assertEqual(events, [("ADDED", "b"), ("DELETED", "c")])
+        self.assertIsNone(query._tracking())
+        self.assertIsNone(pykube.Pod.objects(self.api).watch(reconnect=False)._tracking())
+
+    def test_reconnect_backs_off(self):
+        delays = []
+
+        class RecordingRetry(pykube.ratelimit.Retry):
+            def delay(self, attempt, retry_after=None):
+                delays.append(attempt)
+                return 0
+
+        self.api.retry = RecordingRetry()
+        broken = requests.exceptions.ChunkedEncodingError("connection reset")
+        adapter = self.mount([
+            (200, [broken]),
+            (200, [broken]),
+            (200, [event("ADDED", "a", "10"), broken]),
+            (200, [broken]),
+            (200, [event("ADDED", "b", "11")]),
+        ])
+        stream = pykube.Pod.objects(self.api).watch(since="5").object_stream()
+        self.assertEqual([e.object.name for e in itertools.islice(stream, 2)], ["a", "b"])
+        # consecutive failures back off further; an event resets the count
+        self.assertEqual(delays, [0, 1, 0, 1])
+        self.assertEqual([p["resourceVersion"] for p in adapter.params], [["5"], ["5"], ["5"], ["10"], ["10"]])
+
+    def test_no_reconnect(self):
+        self.mount([(200, [event("ADDED", "a", "10")])])
+        query = pykube.Pod.objects(self.api).watch(reconnect=False)
+        self.assertEqual([e.object.name for e in query], ["a"])
+        self.assertEqual(query.resource_version, "10")
@@ -0,0 +1,141 @@
+"""
+pykube.ratelimit unittests
+"""
+
+import email.utils
+import time
+
+import requests
+
+import pykube
+from pykube.ratelimit import RateLimiter, Retry, TokenBucket, parse_retry_after
+
+from . import TestCase
+from .test_query import BASE_CONFIG, StubAdapter
+
+
+def pod_list():
+    return {"kind": "PodList", "metadata": {}, "items": []}
+
+
+class TestTokenBucket(TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(qps=10, burst=3)
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0, 0, 0])
+        waits = [bucket.reserve() for _ in range(3)]
+        self.assertAlmostEqual(waits[0], 0.1, delta=0.01)
+        self.assertAlmostEqual(waits[1], 0.2, delta=0.01)
+        self.assertAlmostEqual(waits[2], 0.3, delta=0.01)
+
+    def test_acquire_waits(self):
+        bucket = TokenBucket(qps=50, burst=1)
+        start = time.time()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.035)
+
+    def test_per_verb(self):
+        limiter = RateLimiter(qps=100, burst=100, verbs={"post": (1, 1)})
+        self.assertEqual(limiter.reserve("GET"), 0)
+        self.assertEqual(limiter.reserve("POST"), 0)
+        self.assertAlmostEqual(limiter.reserve("POST"), 1, delta=0.01)
+        self.assertEqual(limiter.reserve("GET"), 0)
+
+
+class TestRetry(TestCase):
+
+    def test_retry_after(self):
+        retry = Retry(backoff=0.5)
+        for _ in range(20):
+            self.assertTrue(3 <= retry.delay(0, "3") <= 3.5)
+        date = email.utils.formatdate(time.time() + 10, usegmt=True)
+        self.assertAlmostEqual(parse_retry_after(date), 10, delta=1.5)
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_exponential_jitter(self):
+        retry = Retry(backoff=0.5, max_backoff=4)
+        for attempt, cap in [(0, 0.5), (1, 1), (2, 2), (3, 4), (10, 4)]:
+            delays = [retry.delay(attempt) for _ in range(50)]
+            self.assertTrue(all(0 <= d <= cap for d in delays))
+        self.assertEqual(retry.delay(0, "60"), 4)
+
+    def test_connection_errors_only_idempotent(self):
+        retry = Retry(max_retries=2)
+        self.assertTrue(retry.retry_error("GET", 0))
+        self.assertTrue(retry.retry_error("delete", 1))
+        self.assertFalse(retry.retry_error("GET", 2))
+        self.assertFalse(retry.retry_error("POST", 0))
+        self.assertFalse(retry.retry_error("PATCH", 0))
+
+    def test_unavailable_only_idempotent(self):
+        retry = Retry()
+        self.assertTrue(retry.retry_status("GET", 503, 0))
+        self.assertTrue(retry.retry_status("put", 503, 0))
+        self.assertFalse(retry.retry_status("POST", 503, 0))
+        self.assertFalse(retry.retry_status("PATCH", 503, 0))
+        # unless the server says when to try again
+        self.assertTrue(retry.retry_status("POST", 503, 0, "5"))
+        # a throttled request was never processed
+        self.assertTrue(retry.retry_status("POST", 429, 0))
+        self.assertFalse(retry.retry_status("GET", 500, 0))
+
+
+class TestHTTPClientRetry(TestCase):
+
+    def client(self, responses, **kwargs):
+        kwargs.setdefault("retry", Retry(backoff=0, max_backoff=0))
+        api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG), discovery_cache_dir=None, **kwargs)
+        adapter = StubAdapter(responses)
+        api.session.mount("http://", adapter)
+        return api, adapter
+
+    def test_throttled_then_ok(self):
+        api, adapter = self.client([
+            (429, {"kind": "Status", "message": "too many requests"}, {"Retry-After": "1"}),
+            (503, {"kind": "Status", "message": "unavailable"}),
+            (200, pod_list()),
+        ])
+        self.assertEqual(list(pykube.Pod.objects(api)), [])
+        self.assertEqual(len(adapter.requests), 3)
+
+    def test_gives_up(self):
+        api, adapter = self.client(
+            [(429, {"kind": "Status", "message": "too many requests"})] * 3,
+            retry=Retry(max_retries=2, backoff=0),
+        )
+        r = api.get(url="pods")
+        self.assertEqual(r.status_code, 429)
+        self.assertEqual(len(adapter.requests), 3)
+
+    def test_connection_reset(self):
+        reset = requests.exceptions.ConnectionError("connection reset by peer")
+        api, adapter = self.client([reset, (200, pod_list())])
+        self.assertEqual(api.get(url="pods").status_code, 200)
+        api, adapter = self.client([reset, (201, {})])
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            api.post(url="pods", json={})
+        self.assertEqual(len(adapter.requests), 1)
+
+    def test_unavailable_post_not_retried(self):
+        api, adapter = self.client([(503, {"kind": "Status", "message": "unavailable"}), (201, {})])
+        self.assertEqual(api.post(url="pods", json={}).status_code, 503)
+        self.assertEqual(len(adapter.requests), 1)
+        api, adapter = self.client([
+            (503, {"kind": "Status", "message": "unavailable"}, {"Retry-After": "0"}),
+            (201, {}),
+        ])
+        self.assertEqual(api.post(url="pods", json={}).status_code, 201)
+
+    def test_no_retry(self):
+        api, adapter = self.client([(503, {"kind": "Status", "message": "unavailable"}), (200, pod_list())],
+                                   retry=None)
+        self.assertEqual(api.get(url="pods").status_code, 503)
+
+    def test_rate_limited(self):
+        api, adapter = self.client([(200, pod_list())] * 4, rate_limiter=RateLimiter(qps=50, burst=1))
+        start = time.time()
+        for _ in range(4):
+            api.get(url="pods")
+        self.assertGreaterEqual(time.time() - start, 0.05)
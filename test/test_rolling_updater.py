@@ -0,0 +1,145 @@
+"""
+pykube.rolling_updater unittests
+"""
+
+import threading
+import time
+
+import pykube
+from pykube.cache import Informer, labels_match, parse_selector
+from pykube.rolling_updater import RollingUpdater
+from pykube.testing import FakeAPI
+
+from . import TestCase
+from .test_query import BASE_CONFIG
+
+
+def rc(name, replicas):
+    return {
+        "metadata": {"name": name, "namespace": "default"},
+        "spec": {"replicas": replicas, "selector": {"app": name}},
+    }
+
+
+def pod(name, ready):
+    return {
+        "metadata": {"name": name, "namespace": "default"},
+        "status": {"conditions": [{"type": "Ready", "status": "True" if ready else "False"}]},
+    }
+
+
+class TestReadinessTracking(TestCase):
+
+    def setUp(self):
+        self.api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG))
+        self.old_rc = pykube.ReplicationController(self.api, rc("old", 2))
+        self.new_rc = pykube.ReplicationController(self.api, rc("new", 0))
+        # a long period: only pod changes should wake the updater up
+        self.updater = RollingUpdater(self.api, self.old_rc, self.new_rc, update_period=30)
+        for controller in (self.old_rc, self.new_rc):
+            informer = Informer(self.api, pykube.Pod, selector=controller.obj["spec"]["selector"])
+            informer.add_event_handler(on_add=lambda obj: self.updater._notify())
+            informer._synced.set()
+            self.updater._informers[controller.name] = informer
+
+    def add(self, controller, name, ready):
+        informer = self.updater._informers[controller.name]
+        obj = pykube.Pod(self.api, pod(name, ready))
+        informer.store.add(obj)
+        informer._notify(0, obj)
+
+    def test_counts_are_not_accumulated(self):
+        self.add(self.old_rc, "old-1", True)
+        self.add(self.old_rc, "old-2", True)
+        self.add(self.new_rc, "new-1", False)
+        self.assertEqual(self.updater.poll_for_ready_pods(self.old_rc, self.new_rc), (2, 0))
+        self.assertEqual(self.updater.poll_for_ready_pods(self.old_rc, self.new_rc), (2, 0))
+
+    def test_wakes_up_on_readiness(self):
+        self.add(self.new_rc, "new-1", False)
+
+        def become_ready():
+            time.sleep(0.05)
+            self.add(self.new_rc, "new-2", True)
+
+        threading.Thread(target=become_ready).start()
+        start = time.time()
+        self.assertEqual(self.updater.poll_for_ready_pods(self.old_rc, self.new_rc), (0, 1))
+        self.assertLess(time.time() - start, 5)
+
+
+def versioned_rc(version, replicas):
+    labels = {"app": "web", "version": version}
+    return {
+        "metadata": {"name": "web-{}".format(version), "namespace": "default"},
+        "spec": {
+            "replicas": replicas,
+            "selector": labels,
+            "template": {"metadata": {"labels": labels}, "spec": {"containers": [{"name": "web"}]}},
+        },
+    }
+
+
+class PodController(object):
+    """
+    Stands in for the replication controller manager: as soon as a request
+    of the updater changed a ReplicationController, its pods are created,
+    ready at once, or deleted to match.
+    """
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.api = fake.client()
+        # pods of web-v1 and web-v2 after every change
+        self.counts = []
+
+    def after(self, info):
+        if info.resource == "replicationcontrollers" and info.verb != "list" and info.status < 300:
+            self.reconcile()
+
+    def reconcile(self):
+        controllers = self.fake.list("v1", "ReplicationController", "default")
+        for version in ("v1", "v2"):
+            name = "web-{}".format(version)
+            rc = [c for c in controllers if c["metadata"]["name"] == name]
+            replicas = rc[0]["spec"]["replicas"] if rc else 0
+            requirements = parse_selector({"app": "web", "version": version})
+            pods = sorted(
+                (p for p in self.fake.list("v1", "Pod", "default")
+                 if labels_match(p["metadata"].get("labels") or {}, requirements)),
+                key=lambda p: p["metadata"]["name"],
+            )
+            for i in range(len(pods), replicas):
+                obj = pod("{}-{}".format(name, i), True)
+                obj["metadata"]["labels"] = {"app": "web", "version": version}
+                pykube.Pod(self.api, obj).create()
+            for obj in pods[replicas:]:
+                pykube.Pod(self.api, obj).delete()
+        self.counts.append(tuple(
+            len(pykube.Pod.objects(self.api).filter(selector={"version": version})) for version in ("v1", "v2")
+        ))
+
+
+class TestRollingUpdate(TestCase):
+
+    def test_update(self):
+        fake = FakeAPI()
+        api = fake.client()
+        controller = PodController(fake)
+        api.add_request_hook(after=controller.after)
+        old_rc = pykube.ReplicationController(api, versioned_rc("v1", 2))
+        old_rc.create()
+        self.assertEqual(controller.counts, [(2, 0)])
+        new_rc = pykube.ReplicationController(api, versioned_rc("v2", 2))
+        updater = RollingUpdater(api, old_rc, new_rc, update_period=30)
+        start = time.time()
+        updater.update()
+        # woken up by the pods, not by update_period
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(updater._informers, {})
+        self.assertEqual(controller.counts[-1], (0, 2))
+        # one surge pod at most and never less than two pods (all ready)
+        self.assertLessEqual(max(old + new for old, new in controller.counts), 3)
+        self.assertGreaterEqual(min(old + new for old, new in controller.counts), 2)
+        self.assertIsNone(fake.get("v1", "ReplicationController", "web-v1", "default"))
+        self.assertEqual(fake.get("v1", "ReplicationController", "web-v2", "default")["spec"]["replicas"], 2)
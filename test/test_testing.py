@@ -0,0 +1,191 @@
+"""
+pykube.testing unittests
+"""
+
+import json
+import threading
+import time
+
+import pykube
+from pykube.exceptions import HTTPError
+from pykube.testing import FakeAPI
+
+from . import TestCase
+
+
+def pod(name, **labels):
+    return {"metadata": {"name": name, "labels": labels}, "spec": {"nodeName": "node-1"}}
+
+
+class TestFakeAPI(TestCase):
+
+    def setUp(self):
+        self.fake = FakeAPI(history=50)
+        self.api = self.fake.client()
+
+    def tearDown(self):
+        self.fake.close()
+
+    def create_pods(self, count, **labels):
+        for i in range(count):
+            pykube.Pod(self.api, pod("pod-{:03d}".format(i), **labels)).create()
+
+    def test_create_get_delete(self):
+        obj = pykube.Pod(self.api, pod("web", app="web"))
+        obj.create()
+        metadata = obj.obj["metadata"]
+        self.assertEqual(metadata["namespace"], "default")
+        self.assertTrue(metadata["uid"])
+        self.assertEqual(metadata["resourceVersion"], "1")
+        with self.assertRaises(HTTPError) as cm:
+            pykube.Pod(self.api, pod("web")).create()
+        self.assertEqual(cm.exception.code, 409)
+        self.assertEqual(pykube.Pod.objects(self.api).get(name="web").labels, {"app": "web"})
+        obj.delete()
+        self.assertFalse(obj.exists())
+        with self.assertRaises(pykube.ObjectDoesNotExist):
+            pykube.Pod.objects(self.api).get(name="web")
+
+    def test_generate_name_and_namespaces(self):
+        obj = pykube.Pod(self.api, {"metadata": {"generateName": "job-", "namespace": "batch"}})
+        obj.create()
+        self.assertTrue(obj.name.startswith("job-"))
+        self.assertEqual(len(pykube.Pod.objects(self.api).filter(namespace="batch")), 1)
+        self.assertEqual(len(pykube.Pod.objects(self.api)), 0)
+        self.assertEqual(len(pykube.Pod.objects(self.api).filter(namespace=pykube.all)), 1)
+        pykube.Namespace(self.api, {"metadata": {"name": "batch"}}).create()
+        self.assertEqual(pykube.Namespace.objects(self.api).get(name="batch").name, "batch")
+
+    def test_selectors(self):
+        self.create_pods(3, app="web")
+        pykube.Pod(self.api, dict(pod("db", app="db"), spec={"nodeName": "node-2"})).create()
+        pods = pykube.Pod.objects(self.api)
+        self.assertEqual(len(pods.filter(selector={"app": "web"})), 3)
+        self.assertEqual(len(pods.filter(selector="app in (web,db)")), 4)
+        self.assertEqual(len(pods.filter(selector="app!=web")), 1)
+        self.assertEqual(len(pods.filter(selector="!app")), 0)
+        self.assertEqual(pods.get(field_selector={"spec.nodeName": "node-2"}).name, "db")
+        self.assertEqual(pods.get(field_selector={"metadata.name": "pod-001"}).name, "pod-001")
+
+    def test_pagination(self):
+        self.create_pods(25)
+        names = [obj.name for obj in pykube.Pod.objects(self.api).iterator(page_size=10)]
+        self.assertEqual(names, ["pod-{:03d}".format(i) for i in range(25)])
+        first = self.api.get(url="pods?limit=10", namespace="default").json()
+        self.assertEqual(len(first["items"]), 10)
+        self.assertTrue(first["metadata"]["continue"])
+        last = self.api.get(url="pods?limit=25", namespace="default").json()
+        self.assertNotIn("continue", last["metadata"])
+
+    def test_update_and_patch(self):
+        obj = pykube.Pod(self.api, pod("web"))
+        obj.create()
+        stale = pykube.Pod.objects(self.api).get(name="web")
+        obj.labels["tier"] = "1"
+        obj.update(optimistic=True)
+        self.assertEqual(self.fake.get("v1", "Pod", "web", "default")["metadata"]["labels"], {"tier": "1"})
+        stale.labels["tier"] = "2"
+        with self.assertRaises(HTTPError) as cm:
+            stale.update(optimistic=True)
+        self.assertEqual(cm.exception.code, 409)
+        r = self.api.patch(url="pods/web", namespace="default", data=json.dumps([{"op": "remove"}]),
+                           headers={"Content-Type": "application/json-patch+json"})
+        self.assertEqual(r.status_code, 415)
+
+    def test_status_subresource(self):
+        obj = pykube.Pod(self.api, pod("web"))
+        obj.create()
+        r = self.api.patch(url="pods/web/status", namespace="default", data=json.dumps({
+            "status": {"phase": "Running"},
+            "spec": {"nodeName": "ignored"},
+        }), headers={"Content-Type": "application/merge-patch+json"})
+        self.assertEqual(r.status_code, 200)
+        obj.reload()
+        self.assertEqual(obj.obj["status"], {"phase": "Running"})
+        self.assertEqual(obj.obj["spec"]["nodeName"], "node-1")
+        # the main resource ignores the status
+        obj.obj["status"]["phase"] = "Failed"
+        obj.update()
+        self.assertEqual(obj.obj["status"]["phase"], "Running")
+
+    def test_scale(self):
+        deployment = pykube.Deployment(self.api, {"metadata": {"name": "web"}, "spec": {"replicas": 1}})
+        deployment.create()
+        deployment.scale(4, wait=True, timeout=5)
+        self.assertEqual(deployment.obj["status"]["readyReplicas"], 4)
+        scale = self.api.get(url="deployments/web/scale", namespace="default",
+                             version=pykube.Deployment.version, base="/apis").json()
+        self.assertEqual(scale["kind"], "Scale")
+        self.assertEqual(scale["spec"]["replicas"], 4)
+
+    def test_watch(self):
+        self.create_pods(2, app="web")
+        query = pykube.Pod.objects(self.api).filter(selector={"app": "web"})
+        since = query.response["metadata"]["resourceVersion"]
+        events = []
+
+        def watch():
+            for event in query.watch(since=since, timeout_seconds=1, reconnect=False):
+                events.append((event.type, event.object.name))
+        thread = threading.Thread(target=watch)
+        thread.start()
+        pykube.Pod(self.api, pod("other", app="db")).create()
+        pykube.Pod(self.api, pod("new", app="web")).create()
+        pykube.Pod.objects(self.api).get(name="pod-000").delete()
+        thread.join(5)
+        self.assertEqual(events, [("ADDED", "new"), ("DELETED", "pod-000")])
+
+    def test_watch_timeout_sends_changes_before_bookmark(self):
+        pykube.Pod(self.api, pod("first")).create()
+        since = pykube.Pod.objects(self.api).response["metadata"]["resourceVersion"]
+        self.create_pods(2)
+        pykube.ConfigMap(self.api, {"metadata": {"name": "other"}}).create()
+        # the deadline has passed before the stream is first read
+        watch = pykube.Pod.objects(self.api).watch(since=since, timeout_seconds=0, reconnect=False)
+        self.assertEqual([e.object.name for e in watch], ["pod-000", "pod-001"])
+        latest = self.fake.get("v1", "ConfigMap", "other", "default")["metadata"]["resourceVersion"]
+        self.assertEqual(watch.resource_version, latest)
+
+    def test_watch_expired(self):
+        self.create_pods(60)
+        watch = pykube.Pod.objects(self.api).watch(since="1", timeout_seconds=1, reconnect=False)
+        with self.assertRaises(HTTPError) as cm:
+            list(watch)
+        self.assertEqual(cm.exception.code, 410)
+        # a reconnecting watch lists again instead
+        watch = pykube.Pod.objects(self.api).watch(since="1", timeout_seconds=1)
+        events = []
+        for event in watch:
+            events.append(event)
+            if len(events) == 60:
+                break
+        self.assertEqual(set(e.type for e in events), {"ADDED"})
+
+    def test_informer(self):
+        self.create_pods(3)
+        informer = pykube.cache.Informer(self.api, pykube.Pod, namespace="default").start()
+        try:
+            self.assertTrue(informer.wait_for_sync(timeout=5))
+            self.assertEqual(len(informer.store.list()), 3)
+        finally:
+            informer.stop()
+            self.fake.close()
+
+    def test_informer_stop_closes_the_watch(self):
+        informer = pykube.cache.Informer(self.api, pykube.Pod, namespace="default", timeout_seconds=300).start()
+        self.assertTrue(informer.wait_for_sync(timeout=5))
+        start = time.time()
+        self.assertTrue(informer.stop(timeout=5))
+        self.assertLess(time.time() - start, 1)
+        self.assertFalse(informer._thread.is_alive())
+
+    def test_discovery_and_custom_resources(self):
+        self.fake.add_resource("example.com/v1", "Widget", "widgets")
+        Widget = pykube.object_factory(self.api, "example.com/v1", "Widget")
+        Widget(self.api, {"metadata": {"name": "w"}, "spec": {"size": 3}}).create()
+        self.assertEqual(Widget.objects(self.api).get(name="w").obj["spec"], {"size": 3})
+        self.assertEqual(self.fake.list("example.com/v1", "Widget")[0]["kind"], "Widget")
+        r = self.api.get(url="gadgets", version="example.com/v1")
+        self.assertEqual(r.status_code, 404)
+        groups = self.api.get(version="", base="/apis").json()
+        self.assertIn("example.com", [g["name"] for g in groups["groups"]])
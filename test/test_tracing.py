@@ -0,0 +1,107 @@
+"""
+pykube.tracing unittests
+"""
+
+import pykube
+from pykube.tracing import NOOP_TRACER, InMemoryExporter, Tracer, opentelemetry_installed
+
+from . import TestCase
+from .test_query import BASE_CONFIG, StubAdapter
+
+
+def pod(name):
+    return {"metadata": {"name": name, "namespace": "default", "resourceVersion": "1"}}
+
+
+def pod_list(*names, **kwargs):
+    return {
+        "kind": "PodList",
+        "metadata": {"resourceVersion": "1", "continue": kwargs.get("continue_", "")},
+        "items": [pod(name) for name in names],
+    }
+
+
+class TestTracing(TestCase):
+
+    def client(self, responses):
+        self.exporter = InMemoryExporter()
+        api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG), discovery_cache_dir=None,
+                                tracer=Tracer(self.exporter))
+        adapter = StubAdapter(responses)
+        api.session.mount("http://", adapter)
+        return api
+
+    def test_default_noop(self):
+        api = pykube.HTTPClient(pykube.KubeConfig(doc=BASE_CONFIG), discovery_cache_dir=None)
+        self.assertIs(api.tracer, NOOP_TRACER)
+        self.assertEqual(api._after_request, [])
+
+    def test_nesting(self):
+        api = self.client([(200, pod_list("a"))])
+        obj = pykube.Pod.objects(api).filter(namespace="default").get(selector={"app": "web"})
+        self.assertEqual(obj.name, "a")
+        get, = self.exporter.find("Query.get")
+        execute, = self.exporter.find("Query.execute")
+        request, = self.exporter.find("HTTP GET")
+        self.assertIsNone(get.parent)
+        self.assertIs(execute.parent, get)
+        self.assertIs(request.parent, execute)
+        self.assertEqual(request.trace_id, get.trace_id)
+        self.assertEqual(get.attributes, {"k8s.kind": "Pod", "k8s.namespace": "default"})
+        self.assertEqual(request.attributes["http.status_code"], 200)
+        self.assertEqual(request.attributes["k8s.verb"], "list")
+        self.assertGreaterEqual(get.duration, execute.duration)
+
+    def test_error(self):
+        api = self.client([(404, {"kind": "Status", "message": "pods \"a\" not found"})])
+        with self.assertRaises(pykube.ObjectDoesNotExist):
+            pykube.Pod.objects(api).filter(namespace="default").get(name="a")
+        get_by_name, = self.exporter.find("Query.get_by_name")
+        self.assertIsInstance(get_by_name.error, pykube.ObjectDoesNotExist)
+        self.assertIsNone(self.exporter.find("HTTP GET")[0].error)
+
+    def test_generator(self):
+        api = self.client([(200, pod_list("a", continue_="next")), (200, pod_list("b"))])
+        names = []
+        for obj in pykube.Pod.objects(api).filter(namespace="default").iterator(page_size=1):
+            names.append(obj.name)
+            # spans opened by the consumer are not children of the iterator
+            with api.tracer.start_as_current_span("consumer"):
+                pass
+        self.assertEqual(names, ["a", "b"])
+        iterator, = self.exporter.find("Query.iterator")
+        paginate, = self.exporter.find("Query.paginate")
+        self.assertIs(paginate.parent, iterator)
+        self.assertEqual([s.parent for s in self.exporter.find("HTTP GET")], [paginate, paginate])
+        self.assertEqual([s.parent for s in self.exporter.find("consumer")], [None, None])
+
+    def test_generator_closed(self):
+        api = self.client([(200, pod_list("a", "b"))])
+        iterator = pykube.Pod.objects(api).filter(namespace="default").iterator(page_size=None)
+        next(iterator)
+        self.assertEqual(self.exporter.find("Query.iterator"), [])
+        iterator.close()
+        span, = self.exporter.find("Query.iterator")
+        self.assertIsNone(span.error)
+
+    def test_object_operations(self):
+        deployment = {
+            "metadata": {"name": "web", "namespace": "default", "generation": 1},
+            "spec": {"replicas": 1},
+        }
+        api = self.client([(200, {"spec": {"replicas": 3}}), (200, dict(deployment, spec={"replicas": 2}))])
+        obj = pykube.Deployment(api, deployment)
+        obj.scale(3, wait=False)
+        obj.obj["spec"]["replicas"] = 2
+        obj.update()
+        scale, = self.exporter.find("ScalableMixin.scale")
+        update, = self.exporter.find("APIObject.update")
+        self.assertEqual(scale.attributes, {"k8s.kind": "Deployment", "k8s.namespace": "default", "k8s.name": "web"})
+        self.assertEqual([s.attributes["k8s.verb"] for s in self.exporter.children(scale)], ["patch"])
+        self.assertEqual(len(self.exporter.children(update)), 1)
+
+    def test_opentelemetry_missing(self):
+        if opentelemetry_installed:
+            self.skipTest("opentelemetry is installed")
+        with self.assertRaises(ImportError):
+            pykube.tracing.OpenTelemetryTracer()
@@ -0,0 +1,66 @@
+"""
+pykube.utils unittests
+"""
+
+import json
+
+from pykube.utils import StreamingList, merge_patch
+
+from . import TestCase
+
+
+class TestMergePatch(TestCase):
+
+    def test_only_changes(self):
+        original = {"metadata": {"name": "a", "labels": {"app": "web", "tier": "1"}}, "data": {"big": "x" * 100}}
+        current = {"metadata": {"name": "a", "labels": {"app": "web", "tier": "2"}}, "data": {"big": "x" * 100}}
+        self.assertEqual(merge_patch(original, current), {"metadata": {"labels": {"tier": "2"}}})
+
+    def test_removed_keys_become_null(self):
+        self.assertEqual(merge_patch({"a": 1, "b": {"c": 2}}, {"b": {}}), {"a": None, "b": {"c": None}})
+
+    def test_lists_are_replaced(self):
+        self.assertEqual(merge_patch({"a": [1, 2]}, {"a": [1, 3]}), {"a": [1, 3]})
+        self.assertEqual(merge_patch({"a": {"b": 1}}, {"a": [1]}), {"a": [1]})
+
+    def test_no_changes(self):
+        self.assertEqual(merge_patch({"a": {"b": [1]}}, {"a": {"b": [1]}}), {})
+
+
+class TestStreamingList(TestCase):
+
+    doc = {
+        "kind": "PodList",
+        "metadata": {"resourceVersion": "12", "continue": "t"},
+        "items": [{"metadata": {"name": "pod-{}".format(i)}, "n": i * 1.5, "s": u"é" * i} for i in range(20)],
+        "extra": None,
+    }
+
+    def chunked(self, size):
+        raw = json.dumps(self.doc, ensure_ascii=False).encode("utf-8")
+        return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+    def test_decodes_any_chunking(self):
+        for size in (1, 3, 17, 4096):
+            stream = StreamingList(self.chunked(size))
+            self.assertEqual(list(stream), self.doc["items"])
+            self.assertEqual(stream.envelope, {"kind": "PodList", "metadata": self.doc["metadata"], "extra": None})
+
+    def test_yields_before_reading_everything(self):
+        chunks = self.chunked(16)
+        read = []
+
+        def source():
+            for chunk in chunks:
+                read.append(chunk)
+                yield chunk
+
+        first = next(iter(StreamingList(source())))
+        self.assertEqual(first, self.doc["items"][0])
+        self.assertLess(len(read), len(chunks) / 4)
+
+    def test_empty_and_invalid(self):
+        self.assertEqual(list(StreamingList([b'{"items": []}'])), [])
+        self.assertEqual(list(StreamingList([b"{}"])), [])
+        with self.assertRaises(ValueError):
+            list(StreamingList([b'{"items": [{"a": 1}']))